@@ -0,0 +1,181 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+import uuid
+
+
+class AnalysisJob():
+    """
+    This class holds the state of the analysis of a single month that is being carried out in the background, so that
+    its progress can be reported to whoever requested the month.
+    """
+
+    def __init__(self, month, year, kind="analyse"):
+        self.job_id = uuid.uuid4().hex
+        self.month = month
+        self.year = year
+        # "analyse" for a month that has not been analysed yet, "reanalyse" for a month whose files have changed
+        self.kind = kind
+        self.status = "queued"
+        self.comments_scored = 0
+        self.comments_total = 0
+        self.error = None
+        self.exception = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def update_progress(self, comments_scored, comments_total):
+        """
+        Records how many of the month's comments have been scored so far.
+
+        :param comments_scored: Number of comments scored so far
+        :param comments_total: Number of comments in the month
+        """
+        self.comments_scored = comments_scored
+        self.comments_total = comments_total
+
+    def wait(self):
+        """
+        Waits for the job to finish, so a request can wait for a month to be analysed by the same job as every other
+        request for the month.
+
+        :raises Exception: The error that made the job fail, if it failed
+        """
+        self.done.wait()
+        if self.exception is not None:
+            raise self.exception
+
+    def to_dict(self):
+        """
+        Describes the job so it can be returned by the API.
+
+        :return: Dictionary containing the id, month, year, kind, status and progress of the job
+        """
+        return {"job_id": self.job_id, "month": self.month, "year": self.year, "kind": self.kind, "status": self.status,
+                "comments_scored": self.comments_scored, "comments_total": self.comments_total, "error": self.error}
+
+
+class AnalysisJobQueue():
+    """
+    This class encapsulates all the code that deals with analysing months in the background, so a request for a month
+    that has not been analysed yet does not have to wait for every comment to be scored. Requests that do wait for the
+    month wait on a job here too. Only one job is run for a month at a time, jobs for a month that is already being
+    analysed wait for the jobs before them to finish. A request for a month that already has a job of the same kind is
+    given that job instead.
+    """
+
+    def __init__(self):
+        with open('config.json') as config_file:
+            data = json.load(config_file)
+            max_workers = data.get("analysis_job_workers", 2)
+            # seconds a finished job is kept so its result can still be looked up
+            self.retention = data.get("analysis_job_retention", 3600)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = OrderedDict()
+        # jobs that have not finished for each (month, year) in the order they were submitted, each held as (job,
+        # analyse). The first is running or about to run.
+        self.active_jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, month, year, analyse, kind="analyse"):
+        """
+        Queues a month to be analysed once any jobs already queued for the month have finished. If the month already
+        has a job of the same kind that has not finished, that job is returned instead. A re-analysis that is already
+        running is not shared, as the files may have changed again after it read them.
+
+        :param month: Int representing month to analyse
+        :param year: Int representing year to analyse
+        :param analyse: Function given the month, year and a progress function that analyses and stores the month
+        :param kind: "analyse" or "reanalyse", the kind of job given to AnalysisJob
+        :return: AnalysisJob for the month
+        """
+        with self.lock:
+            self.remove_finished_jobs()
+            month_jobs = self.active_jobs.setdefault((month, year), [])
+            for job, job_analyse in month_jobs:
+                if job.kind == kind and job.finished is None and (job.status == "queued" or kind != "reanalyse"):
+                    return job
+            job = AnalysisJob(month, year, kind)
+            self.jobs[job.job_id] = job
+            month_jobs.append((job, analyse))
+            if len(month_jobs) > 1:
+                return job
+        self.executor.submit(self.run_month_jobs, month, year)
+        return job
+
+    def run_month_jobs(self, month, year):
+        """
+        Runs the jobs queued for a month one after another in the order they were submitted, until there are none left.
+
+        :param month: Int representing month the jobs are for
+        :param year: Int representing year the jobs are for
+        """
+        with self.lock:
+            month_jobs = self.active_jobs[(month, year)]
+        while True:
+            with self.lock:
+                job, analyse = month_jobs[0]
+            self.run_job(job, analyse)
+            with self.lock:
+                month_jobs.pop(0)
+                if len(month_jobs) == 0:
+                    del self.active_jobs[(month, year)]
+                    return
+
+    def run_job(self, job, analyse):
+        """
+        Analyses the month a job is for, recording whether it succeeded.
+
+        :param job: AnalysisJob to be run
+        :param analyse: Function that analyses and stores the month
+        """
+        job.status = "running"
+        try:
+            analyse(job.month, job.year, job.update_progress)
+            job.status = "complete"
+        except Exception as err:
+            print(err)
+            job.error = str(err)
+            job.exception = err
+            job.status = "failed"
+        finally:
+            job.finished = time.monotonic()
+            job.done.set()
+
+    def get_job(self, job_id):
+        """
+        Gets a job using its id.
+
+        :param job_id: Id given to the job when it was queued
+        :return: The AnalysisJob with the given id, None if there is no such job
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def remove_finished_jobs(self):
+        """
+        Forgets jobs that finished longer ago than the retention period. The lock must already be held.
+        """
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished is not None and now - job.finished > self.retention:
+                del self.jobs[job_id]
+
+
+job_queue = None
+job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Gets the job queue shared by every request made to the API, creating it the first time it is needed.
+
+    :return: The AnalysisJobQueue used by the whole process
+    """
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = AnalysisJobQueue()
+        return job_queue
@@ -1,7 +1,129 @@
 from azure.storage.blob import BlockBlobService
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import os
+import io
 import json
+import re
+import threading
+import time
+
+from LocalStorage import LocalBlobService
+from Metrics import metrics, timed, with_request_context
+from WorkbookCache import get_workbook_cache
+
+month_numbers = {"January": 1, "February": 2, "March": 3, "April": 4, "May": 5, "June": 6, "July": 7, "August": 8,
+                 "September": 9, "October": 10, "November": 11, "December": 12}
+
+# the only columns of each workbook used by the pipeline, read as text whatever the cells hold
+workbook_columns = {"CLINIC": str, "RESPONSE": str, "COMMENTS": str}
+
+# files are named in the form "Positive Comments - January 20.xlsx"
+blob_name_pattern = re.compile(r"^(Positive|Negative) Comments - ([A-Za-z]+) (\d+)\.xlsx$")
+
+
+def parse_blob_name(name):
+    """
+    Works out which month of feedback a file holds from its name.
+
+    :param name: name of the file in Azure blob storage
+    :return: tuple in the form (String, int, int) representing the sentiment ("Positive" or "Negative"), year and month
+    of the file. None is returned if the name is not in the expected format.
+    """
+    match = blob_name_pattern.match(name)
+    if match is None or match.group(2) not in month_numbers:
+        return None
+    return match.group(1), int(match.group(3)), month_numbers[match.group(2)]
+
+
+def index_blobs(blobs):
+    """
+    Creates an index of feedback files so that the file for a given month can be found without searching every name.
+
+    :param blobs: list of tuples in the form (name, etag, last_modified) describing each file
+    :return: dictionary mapping (sentiment, year, month) to a dictionary holding the name, etag and last_modified of the
+    file. Files whose names are not in the expected format are left out.
+    """
+    index = {}
+    for name, etag, last_modified in blobs:
+        key = parse_blob_name(name)
+        if key is not None:
+            index[key] = {"name": name, "etag": etag, "last_modified": last_modified}
+    return index
+
+
+class BlobCatalogue():
+    """
+    This class encapsulates all the code that deals with keeping track of the feedback files stored in an Azure blob
+    storage container. The list of files is shared by every request and only fetched again from Azure once it is older
+    than its time to live.
+    """
+
+    def __init__(self, create_blob_service, container_name, ttl):
+        self.create_blob_service = create_blob_service
+        self.container_name = container_name
+        self.ttl = ttl
+        self.index = {}
+        self.refreshed = None
+        self.lock = threading.Lock()
+
+    @timed("blob_listing")
+    def list_blobs(self):
+        """
+        Lists the files stored in the container.
+
+        :return: list of tuples in the form (name, etag, last_modified) describing each file
+        """
+        blob_service = self.create_blob_service()
+        return [(blob.name, blob.properties.etag, blob.properties.last_modified)
+                for blob in blob_service.list_blobs(self.container_name)]
+
+    def refresh(self, force=False):
+        """
+        Fetches the list of files from Azure again if the current list is older than its time to live, or if forced to.
+        The ETag of each file is compared with the one already held to find which files have changed.
+
+        :param force: If True the list is fetched again even if it has not expired
+        :return: dictionary with keys "added", "changed" and "removed", each a list of the (sentiment, year, month) keys
+        of the files that were added, changed or removed since the last refresh. All lists are empty if nothing was
+        fetched.
+        """
+        changes = {"added": [], "changed": [], "removed": []}
+        with self.lock:
+            if not force and self.refreshed is not None and time.monotonic() - self.refreshed < self.ttl:
+                return changes
+
+            index = index_blobs(self.list_blobs())
+            for key, blob in index.items():
+                if key not in self.index:
+                    changes["added"].append(key)
+                elif self.index[key]["etag"] != blob["etag"]:
+                    changes["changed"].append(key)
+            changes["removed"] = [key for key in self.index if key not in index]
+
+            # replaced rather than updated so anyone already holding the old index is not affected
+            self.index = index
+            self.refreshed = time.monotonic()
+        return changes
+
+
+blob_catalogues = {}
+blob_catalogues_lock = threading.Lock()
+
+
+def get_blob_catalogue(azure_storage):
+    """
+    Gets the catalogue shared by every request for a container, creating it the first time it is needed.
+
+    :param azure_storage: AzureStorage object holding the details of the container
+    :return: The BlobCatalogue for the container
+    """
+    with blob_catalogues_lock:
+        key = (azure_storage.storage_backend, azure_storage.storage_account_name, azure_storage.container_name,
+               azure_storage.local_storage_directory)
+        if key not in blob_catalogues:
+            blob_catalogues[key] = BlobCatalogue(azure_storage.create_blob_service, azure_storage.container_name,
+                                                 azure_storage.catalogue_ttl)
+        return blob_catalogues[key]
 
 
 class AzureStorage():
@@ -16,41 +138,130 @@ class AzureStorage():
             self.storage_account_name = data["storage_account_name"]
             self.storage_account_key = data["storage_account_key"]
             self.container_name = data["storage_container_name"]
-        self.positive_local_file = "temp1.xlsx"
-        self.negative_local_file = "temp2.xlsx"
-        self.blob_data_names = []
+            self.catalogue_ttl = data.get("blob_catalogue_ttl", 60)
+            # "local" reads the files from local_storage_directory instead of Azure
+            self.storage_backend = data.get("storage_backend", "azure")
+            self.local_storage_directory = data.get("local_storage_directory", "../Excel/MockData")
+            # engine pandas reads workbooks with, None leaves pandas to choose
+            self.excel_engine = data.get("excel_engine", None)
+        self.blob_index = {}
+
+    def create_blob_service(self):
+        """
+        Creates the service used to access the files, depending on the "storage_backend" chosen in config.json.
+
+        :return: A BlockBlobService for Azure blob storage or a LocalBlobService for a local directory
+        """
+        if self.storage_backend == "local":
+            return LocalBlobService(self.local_storage_directory)
+        return BlockBlobService(account_name=self.storage_account_name, account_key=self.storage_account_key)
 
     def get_blob_data_names(self):
         """
-        Populates a list with the names of the files stored in Azure blob storage to be used to find the latest month for
-        which data is available
+        Gets the index of the files stored in Azure blob storage to be used to find the latest month for which data is
+        available. The list of files is cached between requests and only fetched from Azure once it has expired.
         """
-        blob_service = BlockBlobService(account_name=self.storage_account_name, account_key=self.storage_account_key)
-        datasheets = blob_service.list_blobs(self.container_name)
+        catalogue = get_blob_catalogue(self)
+        catalogue.refresh()
+        self.blob_index = catalogue.index
 
-        for data in datasheets:
-            if data.name not in self.blob_data_names:
-                self.blob_data_names.append(data.name)
+    def set_blob_data_names(self, names):
+        """
+        Replaces the index of the files stored in Azure blob storage with an index of the names given.
 
-    def get_data_from_azure(self, blob_name_neg, blob_name_pos):
+        :param names: list of file names
         """
-        Gets the data from Azure blob storage.
+        self.blob_index = index_blobs([(name, None, None) for name in names])
 
-        :param blob_name_neg: file name containing negative customer feedback
-        :param blob_name_pos: file name containing positive customer feedback
+    def has_data(self, month, year, sentiment=None):
+        """
+        Checks whether a file holding feedback for a month is stored in Azure blob storage.
+
+        :param month: Int representing month to check
+        :param year: Int representing year to check
+        :param sentiment: "Positive" or "Negative" to check for that file only, None to check for either
+        :return: True if a file is stored for the month, False otherwise
+        """
+        if sentiment is None:
+            return (("Positive", year, month) in self.blob_index) or (("Negative", year, month) in self.blob_index)
+        return (sentiment, year, month) in self.blob_index
+
+    @timed("blob_fetch")
+    def get_blob(self, blob_name):
+        """
+        Downloads a single file from Azure blob storage into memory.
+
+        :param blob_name: name of the file to download
+        :return: Blob holding the bytes making up the file in content and its ETag in properties
+        """
+        blob_service = self.create_blob_service()
+        metrics.add_rows("blob_fetch", 1)
+        return blob_service.get_blob_to_bytes(self.container_name, blob_name)
+
+    def get_blob_contents(self, blob_name):
+        """
+        Downloads a single file from Azure blob storage into memory.
+
+        :param blob_name: name of the file to download
+        :return: bytes making up the file
+        """
+        return self.get_blob(blob_name).content
+
+    @timed("blob_properties")
+    def get_blob_etag(self, blob_name):
+        """
+        Gets the current ETag of a file without downloading it.
+
+        :param blob_name: name of the file
+        :return: ETag of the file
         """
-        blob_service = BlockBlobService(account_name=self.storage_account_name, account_key=self.storage_account_key)
-        blob_service.get_blob_to_path(self.container_name, blob_name_pos, self.positive_local_file)
-        blob_service.get_blob_to_path(self.container_name, blob_name_neg, self.negative_local_file)
+        blob_service = self.create_blob_service()
+        return blob_service.get_blob_properties(self.container_name, blob_name).properties.etag
 
-    def load_data_into_pandas_dataframe(self):
+    def get_month_dataframes(self, blob_name_neg, blob_name_pos):
         """
-        loads the data retrieved from azure into a pandas dataframe.
+        Gets the parsed contents of the positive and negative files of a month. Files that have already been parsed are
+        loaded from the parsed workbook cache using their ETag, any others are downloaded and parsed at the same time.
+
+        :param blob_name_neg: file name containing negative customer feedback
+        :param blob_name_pos: file name containing positive customer feedback
         :return: Two dataframes, first containing the negative customer feedback and the second containing the postive
         customer feedback
         """
-        dataframe_blobdata_pos = pd.read_excel(self.positive_local_file)
-        os.remove(self.positive_local_file)
-        dataframe_blobdata_neg = pd.read_excel(self.negative_local_file)
-        os.remove(self.negative_local_file)
-        return dataframe_blobdata_neg, dataframe_blobdata_pos
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            negative_dataframe, positive_dataframe = executor.map(with_request_context(self.get_blob_dataframe),
+                                                                  [blob_name_neg, blob_name_pos])
+        return negative_dataframe, positive_dataframe
+
+    def get_blob_dataframe(self, blob_name):
+        """
+        Gets the parsed contents of a single file, from the parsed workbook cache if the file has not changed since it
+        was last parsed. The ETag is fetched from Azure rather than taken from the blob catalogue, which may be out of
+        date, and a parsed file is stored under the ETag it was downloaded with.
+
+        :param blob_name: name of the file
+        :return: Dataframe holding the CLINIC, RESPONSE and COMMENTS columns of the file
+        """
+        workbook_cache = get_workbook_cache()
+        if not workbook_cache.enabled:
+            return self.parse_workbook(self.get_blob_contents(blob_name))
+
+        dataframe = workbook_cache.get(blob_name, self.get_blob_etag(blob_name))
+        if dataframe is None:
+            blob = self.get_blob(blob_name)
+            dataframe = self.parse_workbook(blob.content)
+            workbook_cache.put(blob_name, blob.properties.etag, dataframe)
+        return dataframe
+
+    @timed("excel_parse")
+    def parse_workbook(self, contents):
+        """
+        Reads the columns used by the pipeline from a workbook. Any other columns are skipped without being parsed.
+
+        :param contents: bytes making up the workbook
+        :return: Dataframe holding the CLINIC, RESPONSE and COMMENTS columns of the workbook
+        """
+        dataframe = pd.read_excel(io.BytesIO(contents), engine=self.excel_engine,
+                                  usecols=lambda column: column in workbook_columns, dtype=workbook_columns)
+        metrics.add_rows("excel_parse", len(dataframe.index))
+        return dataframe
@@ -0,0 +1,102 @@
+import argparse
+import random
+import statistics
+import time
+
+from Database import connect_to_database, schema_migrations
+
+"""
+NOTE:
+
+This python file does not make up part of the API. It measures how long it takes to look up a month of feedback as the
+feedback table grows, both before and after the schema migrations adding the (Year, Month) and (Clinic, Year, Month)
+indexes are applied. It uses its own table in the database configured in config.json and removes it when finished so
+the real feedbackdatabase table is never touched.
+
+Example usage: python BenchmarkDatabase.py --sizes 10000 100000 1000000
+"""
+
+benchmark_table = "feedbackdatabase_benchmark"
+clinics = ["Cardiology", "Dermatology", "Neurology", "Oncology", "Orthopaedics", "Paediatrics", "Radiology", "Urology"]
+
+
+def create_benchmark_table(cursor, size):
+    """
+    Creates a table with the same layout as feedbackdatabase holding size rows spread evenly over five years of months.
+
+    :param cursor: Cursor for the database connection
+    :param size: Number of rows to fill the table with
+    """
+    cursor.execute("DROP TABLE IF EXISTS " + benchmark_table)
+    cursor.execute(
+        "CREATE TABLE " + benchmark_table + "(ID INT NOT NULL AUTO_INCREMENT, Clinic VARCHAR(100) NOT NULL, Comments VARCHAR(1000) NOT NULL, Month INT NOT NULL, PosOrNeg VARCHAR(10) NOT NULL, Response VARCHAR(25), Sentiment_Score FLOAT NOT NULL, Year INT NOT NULL, PRIMARY KEY (ID));")
+    sql_formula = "INSERT INTO " + benchmark_table + " (Clinic, Comments, Month, PosOrNeg, Response, Sentiment_Score, Year) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+    for start in range(0, size, 5000):
+        rows = []
+        for row in range(start, min(start + 5000, size)):
+            rows.append((random.choice(clinics), "Benchmark comment " + str(row), row % 12 + 1,
+                         random.choice(["Positive", "Negative"]), "Likely", random.random(), 15 + (row // 12) % 5))
+        cursor.executemany(sql_formula, rows)
+
+
+def time_lookups(cursor, repeats):
+    """
+    Times how long it takes to look up a single month and a single clinic's month of feedback.
+
+    :param cursor: Cursor for the database connection
+    :param repeats: Number of times each lookup is timed, the median time is reported
+    :return: tuple in the form (float, float) holding the median month and clinic lookup times in milliseconds
+    """
+    month_times = []
+    clinic_times = []
+    for repeat in range(repeats):
+        month, year = random.randint(1, 12), random.randint(15, 19)
+
+        start = time.perf_counter()
+        cursor.execute("SELECT * FROM " + benchmark_table + " WHERE Month = %s AND Year = %s", (month, year))
+        cursor.fetchall()
+        month_times.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        cursor.execute("SELECT * FROM " + benchmark_table + " WHERE Clinic = %s AND Month = %s AND Year = %s",
+                       (random.choice(clinics), month, year))
+        cursor.fetchall()
+        clinic_times.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(month_times), statistics.median(clinic_times)
+
+
+def main():
+    """
+    Runs the benchmark for each table size given on the command line and prints the median lookup times.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark feedback lookups against table size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    db_connection = connect_to_database()
+    cursor = db_connection.cursor()
+
+    print("{:>10} {:>18} {:>18} {:>18} {:>18}".format("rows", "month (no index)", "month (index)",
+                                                     "clinic (no index)", "clinic (index)"))
+    try:
+        for size in args.sizes:
+            create_benchmark_table(cursor, size)
+            db_connection.commit()
+            month_before, clinic_before = time_lookups(cursor, args.repeats)
+
+            for version, description, statements in schema_migrations:
+                for statement in statements:
+                    cursor.execute(statement.format(table=benchmark_table))
+            month_after, clinic_after = time_lookups(cursor, args.repeats)
+
+            print("{:>10} {:>15.2f} ms {:>15.2f} ms {:>15.2f} ms {:>15.2f} ms".format(
+                size, month_before, month_after, clinic_before, clinic_after))
+    finally:
+        cursor.execute("DROP TABLE IF EXISTS " + benchmark_table)
+        db_connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from Database import prepare_database
+from ProcessData import DataForMultipleMonths
+
+"""
+NOTE:
+
+This python file does not make up part of the API. It measures how long each stage of the analysis pipeline takes by
+generating synthetic monthly workbooks shaped like the ones in Excel/MockData and running them through
+DataForMultipleMonths using the local directory, SQLite database and deterministic scorer, so no Azure credentials are
+needed. Results are written as JSON so that they can be compared between releases with --compare, which exits with an
+error if any stage has become slower than the allowed threshold.
+
+Writing the synthetic workbooks requires openpyxl to be installed.
+
+Example usage: python BenchmarkPipeline.py --comments 10000 --months 12 --output results.json
+               python BenchmarkPipeline.py --comments 10000 --months 12 --compare results.json
+"""
+
+months = {1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 6: "June", 7: "July", 8: "August",
+          9: "September", 10: "October", 11: "November", 12: "December"}
+
+mock_data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Excel", "MockData")
+
+
+class StageTimer():
+    """
+    This class records how long each stage of the pipeline takes, how many times it ran and how many rows it handled.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def wrap(self, name, function, count_rows=None):
+        """
+        Wraps a function so that every call to it is timed under the given stage name.
+
+        :param name: Name of the stage
+        :param function: Function to be timed
+        :param count_rows: Optional function given the arguments and result of a call that returns the number of rows
+        handled by the call
+        :return: The wrapped function
+        """
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rows": 0})
+            stage["seconds"] += elapsed
+            stage["calls"] += 1
+            if count_rows is not None:
+                stage["rows"] += count_rows(args, result)
+            return result
+        return timed
+
+
+def load_mock_comments():
+    """
+    Reads the clinics, responses and comments found in the mock data so the synthetic workbooks contain realistic text.
+
+    :return: tuple in the form (list, list, list) holding the clinics, responses and comments
+    """
+    dataframes = [pd.read_excel(os.path.join(mock_data_directory, name))
+                  for name in sorted(os.listdir(mock_data_directory)) if name.endswith(".xlsx")]
+    mock_data = pd.concat(dataframes, ignore_index=True).dropna(subset=["CLINIC", "COMMENTS"])
+    return list(mock_data["CLINIC"].unique()), list(mock_data["RESPONSE"].dropna().unique()), \
+        list(mock_data["COMMENTS"].unique())
+
+
+def generate_workbooks(directory, comments_per_month, no_of_months, seed):
+    """
+    Writes synthetic positive and negative comment workbooks for the most recent no_of_months months. Around 5% of
+    comments are left blank and 2% have no clinic, and comments are formed from one or two mock comments so that many,
+    but not all, comments repeat as they do in real feedback.
+
+    :param directory: Directory to write the workbooks to
+    :param comments_per_month: Number of comments in each month, split evenly between the two workbooks
+    :param no_of_months: Number of months to generate
+    :param seed: Seed for the random number generator so runs can be repeated
+    """
+    generator = np.random.default_rng(seed)
+    clinics, responses, comments = load_mock_comments()
+    month, year = datetime.now().month, datetime.now().year % 100
+
+    for iteration in range(no_of_months):
+        for sentiment in ["Positive", "Negative"]:
+            rows = comments_per_month // 2
+            first = generator.choice(comments, rows).astype(object)
+            second = generator.choice(comments, rows).astype(object)
+            text = np.where(generator.random(rows) < 0.3, first + ". " + second, first).astype(object)
+            text[generator.random(rows) < 0.05] = None
+            clinic = generator.choice(clinics, rows).astype(object)
+            clinic[generator.random(rows) < 0.02] = None
+            workbook = pd.DataFrame({"CLINIC": clinic, "RESPONSE": generator.choice(responses, rows), "COMMENTS": text})
+            workbook.to_excel(os.path.join(directory, sentiment + " Comments - " + months[month] + " " + str(year) +
+                                           ".xlsx"), index=False)
+        if month == 1:
+            month = 12
+            year -= 1
+        else:
+            month -= 1
+
+
+def write_config(directory, workers, scorer):
+    """
+    Writes the config.json used during the benchmark, pointing every backend at local stand-ins.
+
+    :param directory: Directory the benchmark is run in
+    :param workers: Number of months analysed at the same time
+    :param scorer: Name of the local sentiment backend to use
+    """
+    config = {"storage_account_name": "", "storage_account_key": "", "storage_container_name": "",
+              "storage_backend": "local", "local_storage_directory": os.path.join(directory, "blobs"),
+              "text_analytics_key": "", "text_analytics_endpoint": "", "sentiment_backend": scorer,
+              "sentiment_cache_enabled": False, "database_username": "", "database_password": "", "database_name": "",
+              "database_host": "", "database_backend": "sqlite",
+              "sqlite_database_path": os.path.join(directory, "feedback.db"), "API_username": "", "API_password": "",
+              "analysis_job_workers": workers}
+    with open(os.path.join(directory, "config.json"), "w") as config_file:
+        json.dump(config, config_file)
+
+
+def run_pipeline(no_of_months, timer):
+    """
+    Runs the pipeline once for the most recent no_of_months months with every stage timed.
+
+    :param no_of_months: Number of months to request
+    :param timer: StageTimer recording the time taken by each stage
+    :return: DataForMultipleMonths holding the result
+    """
+    process_data = DataForMultipleMonths()
+    azure_storage = process_data.azure_storage
+    azure_storage.get_blob = timer.wrap("blob_fetch", azure_storage.get_blob)
+    azure_storage.parse_workbook = timer.wrap("read_excel", azure_storage.parse_workbook,
+                                              lambda args, result: len(result.index))
+    process_data.prepare_month_dataframe = timer.wrap("prepare_month", process_data.prepare_month_dataframe,
+                                                      lambda args, result: len(result.index))
+    text_analytics = process_data.text_analytics
+    text_analytics.calculate_sentiment_scores = timer.wrap("scoring", text_analytics.calculate_sentiment_scores,
+                                                           lambda args, result: len(result))
+    database = process_data.database
+    database.insert_data = timer.wrap("insert_data", database.insert_data, lambda args, result: len(args[0].index))
+    database.use_database_storage_for_months = timer.wrap(
+        "use_database_storage", database.use_database_storage_for_months,
+        lambda args, result: len(result[0].index))
+
+    process_data.process_months(no_of_months)
+    return process_data
+
+
+def run_benchmark(args):
+    """
+    Generates the workbooks, runs the pipeline cold (nothing analysed yet) and warm (every month in the database) and
+    collects the results.
+
+    :param args: Parsed command line arguments
+    :return: Dictionary holding the results of the benchmark
+    """
+    directory = tempfile.mkdtemp(prefix="psat-benchmark-")
+    original_directory = os.getcwd()
+    results = {"parameters": vars(args).copy(),
+               "environment": {"python": platform.python_version(), "pandas": pd.__version__,
+                               "numpy": np.__version__, "machine": platform.machine()},
+               "runs": {}}
+    try:
+        os.mkdir(os.path.join(directory, "blobs"))
+        start = time.perf_counter()
+        generate_workbooks(os.path.join(directory, "blobs"), args.comments // args.months, args.months, args.seed)
+        results["generation_seconds"] = time.perf_counter() - start
+        write_config(directory, args.workers, args.scorer)
+        os.chdir(directory)
+
+        prepare_database()
+
+        for run in ["cold", "warm"]:
+            timer = StageTimer()
+            if args.trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            process_data = run_pipeline(args.months, timer)
+            to_json = timer.wrap("to_json", process_data.final_dataframe.to_json,
+                                 lambda to_json_args, result: len(process_data.final_dataframe.index))
+            to_json()
+            results["runs"][run] = {"wall_seconds": time.perf_counter() - start, "stages": timer.stages,
+                                    "rows": len(process_data.final_dataframe.index)}
+            if args.trace_memory:
+                results["runs"][run]["peak_traced_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+    finally:
+        os.chdir(original_directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    # ru_maxrss is given in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compares the time taken by each stage with a previous set of results.
+
+    :param results: Results of this benchmark
+    :param baseline: Results of an earlier benchmark to compare against
+    :param threshold: Ratio of new time to old time above which a stage is counted as a regression
+    :return: List of descriptions of each stage that regressed
+    """
+    regressions = []
+    for run, run_results in results["runs"].items():
+        for stage, stage_results in run_results["stages"].items():
+            old_stage = baseline.get("runs", {}).get(run, {}).get("stages", {}).get(stage)
+            if old_stage is None or old_stage["seconds"] == 0:
+                continue
+            ratio = stage_results["seconds"] / old_stage["seconds"]
+            print("{:>5} {:>22} {:>10.3f}s {:>10.3f}s {:>7.2f}x".format(run, stage, old_stage["seconds"],
+                                                                       stage_results["seconds"], ratio))
+            if ratio > threshold:
+                regressions.append("{} {} took {:.2f}x as long".format(run, stage, ratio))
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark with the options given on the command line, prints a summary and writes the results.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the analysis pipeline.")
+    parser.add_argument("--comments", type=int, default=10000, help="total number of comments across all months")
+    parser.add_argument("--months", type=int, default=12, help="number of months of workbooks to generate")
+    parser.add_argument("--workers", type=int, default=1, help="number of months analysed at the same time")
+    parser.add_argument("--scorer", default="deterministic", choices=["deterministic", "lexicon"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="record peak Python memory use (slower)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    for run, run_results in results["runs"].items():
+        print("{} run: {} rows in {:.3f}s".format(run, run_results["rows"], run_results["wall_seconds"]))
+        for stage, stage_results in run_results["stages"].items():
+            print("  {:>22} {:>10.3f}s {:>6} calls {:>10} rows".format(stage, stage_results["seconds"],
+                                                                      stage_results["calls"], stage_results["rows"]))
+    print("peak RSS: {:.1f} MB".format(results["peak_rss_mb"]))
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if len(regressions) != 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from BenchmarkPipeline import write_config
+from ProcessData import DataForMultipleMonths
+
+"""
+NOTE:
+
+This python file does not make up part of the API. It measures how long it takes to turn the parsed positive and
+negative files of a month into the single dataframe that is scored, comparing DataForMultipleMonths.
+prepare_month_dataframe with the list based clean up, labelling and merging steps it replaced. A synthetic month shaped
+like the files in Excel/MockData is used, with an extra unused column, some empty rows and some missing clinics. Both
+versions are checked to give the same rows before being timed. DataForMultipleMonths is created with the same local
+stand-ins used by BenchmarkPipeline.py, so no Azure credentials are needed.
+
+Example usage: python BenchmarkTransform.py --rows 100000 --repeats 20
+"""
+
+clinics = ["Cardiology", "Dermatology", "Neurology", "Oncology", "Orthopaedics", "Paediatrics", "Radiology", "Urology"]
+responses = ["Extremely likely", "Likely", "Neither likely nor unlikely", "Unlikely", "Extremely unlikely"]
+
+
+def generate_month(rows, seed):
+    """
+    Creates the parsed contents of a synthetic month's positive and negative files. Around 1% of rows are completely
+    empty and 2% have no clinic.
+
+    :param rows: Total number of rows, split evenly between the two files
+    :param seed: Seed for the random number generator so runs can be repeated
+    :return: tuple in the form (Dataframe, Dataframe) holding the negative and positive comments
+    """
+    generator = np.random.default_rng(seed)
+    dataframes = []
+    for sentiment in ["Negative", "Positive"]:
+        size = rows // 2
+        dataframe = pd.DataFrame({"CLINIC": generator.choice(clinics, size).astype(object),
+                                  "RESPONSE": generator.choice(responses, size).astype(object),
+                                  "COMMENTS": np.array([sentiment + " comment " + str(row) for row in range(size)],
+                                                       dtype=object),
+                                  "Unnamed: 3": np.nan})
+        dataframe.loc[generator.random(size) < 0.02, "CLINIC"] = np.nan
+        dataframe.loc[generator.random(size) < 0.01, ["CLINIC", "RESPONSE", "COMMENTS"]] = np.nan
+        dataframes.append(dataframe)
+    return dataframes[0], dataframes[1]
+
+
+def legacy_prepare_month(file_month, file_year, negative_dataframe, positive_dataframe):
+    """
+    Combines a month's files the way DataForMultipleMonths did before prepare_month_dataframe, by dropping columns by
+    position, filling in missing clinics in place, building the label columns one element at a time and adding the
+    negative file to the end of the positive one. This is the old code as it was, including filling in the positive
+    file's clinics twice and never the negative file's, except that DataFrame.append, which was removed in pandas 2, is
+    replaced by the equivalent pd.concat.
+
+    :param file_month: Month the files are for
+    :param file_year: Year the files are for
+    :param negative_dataframe: Dataframe containing negative comments, changed in place
+    :param positive_dataframe: Dataframe containing positive comments, changed in place
+    :return: Dataframe containing the comments for the month
+    """
+    if len(positive_dataframe.columns) > 3:
+        positive_dataframe.drop(positive_dataframe.columns[3], axis=1, inplace=True)
+    positive_dataframe.dropna(axis=0, how='all', inplace=True)
+    if len(negative_dataframe.columns) > 3:
+        negative_dataframe.drop(negative_dataframe.columns[3], axis=1, inplace=True)
+    negative_dataframe.dropna(axis=0, how='all', inplace=True)
+    positive_dataframe['CLINIC'].fillna(0, inplace=True)
+    positive_dataframe['CLINIC'].fillna(0, inplace=True)
+
+    positive = []
+    negative = []
+    for row in range(len(negative_dataframe.index)):
+        negative.append("Negative")
+    for row in range(len(positive_dataframe.index)):
+        positive.append("Positive")
+
+    positive_dataframe["Pos or Neg"] = positive
+    negative_dataframe["Pos or Neg"] = negative
+    temp = pd.concat([positive_dataframe, negative_dataframe], ignore_index=True)
+    month = []
+    year = []
+    for row in range(len(temp.index)):
+        month.append(file_month)
+        year.append(file_year)
+    temp["Month"] = month
+    temp["Year"] = year
+    return temp
+
+
+def time_transform(transform, negative_dataframe, positive_dataframe, repeats):
+    """
+    Times a transform, giving it fresh copies of the files every time as the legacy transform changes them in place.
+
+    :param transform: Function given the month, year, negative and positive dataframes
+    :param negative_dataframe: Dataframe containing negative comments
+    :param positive_dataframe: Dataframe containing positive comments
+    :param repeats: Number of times the transform is timed
+    :return: Median time taken in milliseconds
+    """
+    times = []
+    for repeat in range(repeats):
+        negative_copy, positive_copy = negative_dataframe.copy(), positive_dataframe.copy()
+        start = time.perf_counter()
+        transform(1, 20, negative_copy, positive_copy)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    """
+    Checks both transforms give the same rows, then prints how long each takes.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark combining a month's files into one dataframe.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    negative_dataframe, positive_dataframe = generate_month(args.rows, args.seed)
+    directory = tempfile.mkdtemp(prefix="psat-benchmark-")
+    original_directory = os.getcwd()
+    try:
+        os.mkdir(os.path.join(directory, "blobs"))
+        write_config(directory, 1, "deterministic")
+        os.chdir(directory)
+        prepare_month_dataframe = DataForMultipleMonths().prepare_month_dataframe
+    finally:
+        os.chdir(original_directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    legacy = legacy_prepare_month(1, 20, negative_dataframe.copy(), positive_dataframe.copy())
+    # the legacy code left the negative file's missing clinics as NaN, which prepare_month_dataframe fills in with 0
+    legacy["CLINIC"] = legacy["CLINIC"].fillna(0)
+    current = prepare_month_dataframe(1, 20, negative_dataframe.copy(), positive_dataframe.copy())
+    pd.testing.assert_frame_equal(legacy, current.astype({"Pos or Neg": object}))
+
+    legacy_time = time_transform(legacy_prepare_month, negative_dataframe, positive_dataframe, args.repeats)
+    current_time = time_transform(prepare_month_dataframe, negative_dataframe, positive_dataframe, args.repeats)
+    print("{:>10} {:>12} {:>12} {:>9}".format("rows", "legacy", "vectorised", "speedup"))
+    print("{:>10} {:>9.2f} ms {:>9.2f} ms {:>8.2f}x".format(len(current.index), legacy_time, current_time,
+                                                          legacy_time / current_time))
+
+
+if __name__ == "__main__":
+    main()
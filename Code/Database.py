@@ -1,24 +1,241 @@
 import mysql.connector
+import mysql.connector.pooling
 import pandas as pd
+import hashlib
 import json
+import threading
 
+from LocalStorage import SQLiteConnection
+from Metrics import metrics, timed
+from ResponseCache import get_response_cache
 
-def connect_to_database():
+# changes made to the feedbackdatabase table, or tables added alongside it, after it was first created, in the form
+# (version, description, statements). {table} is replaced with the name of the table being migrated. New migrations must
+# be added to the end of the list with the next version number.
+schema_migrations = [
+    (1, "Index feedback by year and month",
+     ["CREATE INDEX idx_year_month ON {table} (Year, Month)"]),
+    (2, "Index feedback by clinic, year and month",
+     ["CREATE INDEX idx_clinic_year_month ON {table} (Clinic, Year, Month)"]),
+    (3, "Record the files each month was analysed from",
+     ["CREATE TABLE IF NOT EXISTS analysed_files(Year INT NOT NULL, Month INT NOT NULL, "
+      "PositiveETag VARCHAR(100) NOT NULL, NegativeETag VARCHAR(100) NOT NULL, "
+      "Analysed TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (Year, Month))"]),
+]
+
+# MySQL error raised when creating an index that already exists
+duplicate_key_name_error = 1061
+
+# SQLite reports an index that already exists as an OperationalError without an error code, so it is told not to create
+# it instead, MySQL does not support IF NOT EXISTS on CREATE INDEX
+sqlite_statement_replacements = [("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ")]
+
+# columns of the dataframes holding analysed data, in the same order as the columns of feedbackdatabase
+dataframe_columns = ["CLINIC", "COMMENTS", "Month", "Pos or Neg", "RESPONSE", "Sentiment_Score", "Year"]
+
+# name of the column of feedbackdatabase holding each column of the dataframes
+database_columns = {"CLINIC": "Clinic", "COMMENTS": "Comments", "Month": "Month", "Pos or Neg": "PosOrNeg",
+                    "RESPONSE": "Response", "Sentiment_Score": "Sentiment_Score", "Year": "Year"}
+
+# columns that identify a row of feedback when comparing a changed file with what is already stored
+fingerprint_columns = ["CLINIC", "COMMENTS", "RESPONSE", "Pos or Neg"]
+
+database_prepared = False
+database_prepared_lock = threading.Lock()
+
+
+class DatabaseUnavailableError(Exception):
+    """
+    Raised when no connection to the database can be made, either because the database cannot be reached or because
+    every connection in the pool stayed in use for longer than the pool timeout.
+    """
+
+
+class ConnectionPool():
+    """
+    This class encapsulates a pool of connections to the database that is shared by the whole process, so requests do
+    not have to open a new connection to the database every time they need one.
+    """
+
+    def __init__(self):
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+            self.size = data.get("database_pool_size", 8)
+            self.timeout = data.get("database_pool_timeout", 30)
+
+        self.pool = mysql.connector.pooling.MySQLConnectionPool(pool_name="psat",
+                                                                pool_size=self.size,
+                                                                user=data["database_username"],
+                                                                password=data["database_password"],
+                                                                database=data["database_name"],
+                                                                host=data["database_host"]
+                                                                )
+        # the pool itself fails straight away when empty, this makes callers wait for a connection to be returned
+        self.available = threading.BoundedSemaphore(self.size)
+
+    def get_connection(self):
+        """
+        Borrows a connection from the pool, waiting up to timeout seconds for one to become free. The pool checks the
+        connection is still alive before handing it out and reconnects it if not.
+
+        :return: A PooledConnection which is given back to the pool when closed.
+        """
+        if not self.available.acquire(timeout=self.timeout):
+            raise RuntimeError("Timed out waiting for a database connection")
+        try:
+            return PooledConnection(self.pool.get_connection(), self.available)
+        except Exception:
+            self.available.release()
+            raise
+
+
+class PooledConnection():
     """
-    Attempts to connect to the database hosted on azure.
+    This class wraps a connection borrowed from the ConnectionPool. It can be used in the same way as a normal
+    connection, but closing it gives it back to the pool instead of disconnecting from the database.
     """
-    with open("config.json") as config_file:
-        data = json.load(config_file)
 
+    dialect = "mysql"
+
+    def __init__(self, db_connection, available):
+        self.db_connection = db_connection
+        self.available = available
+
+    def __getattr__(self, name):
+        return getattr(self.db_connection, name)
+
+    def close(self):
+        """
+        Gives the connection back to the pool. Closing a connection more than once has no effect.
+        """
+        if self.db_connection is not None:
+            db_connection = self.db_connection
+            self.db_connection = None
+            try:
+                db_connection.close()
+            finally:
+                self.available.release()
+
+
+class SQLiteConnectionPool():
+    """
+    This class is used in place of the ConnectionPool when "database_backend" is set to "sqlite" in config.json, so the
+    system can be run without access to the MySQL database. SQLite connections are cheap to open so a new one is
+    opened every time.
+    """
+
+    def __init__(self):
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+            self.path = data.get("sqlite_database_path", "feedback.db")
+
+    def get_connection(self):
+        """
+        Opens a connection to the SQLite file.
+
+        :return: A SQLiteConnection which accepts the same queries as a MySQL connection
+        """
+        return SQLiteConnection(self.path)
+
+
+connection_pool = None
+connection_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Gets the connection pool shared by the whole process, creating it the first time it is needed. The type of pool
+    depends on the "database_backend" chosen in config.json. The pool is not created when the module is imported as
+    the MySQL pool connects straight away, so each worker process of the web server opens its own connections once it
+    has started and the modules can be imported without access to the database.
+
+    :return: The ConnectionPool or SQLiteConnectionPool used by the whole process
+    """
+    global connection_pool
+    with connection_pool_lock:
+        if connection_pool is None:
+            with open("config.json") as config_file:
+                database_backend = json.load(config_file).get("database_backend", "mysql")
+            if database_backend == "sqlite":
+                connection_pool = SQLiteConnectionPool()
+            else:
+                connection_pool = ConnectionPool()
+        return connection_pool
+
+
+def fingerprint_rows(dataframe):
+    """
+    Creates a fingerprint for every row of feedback from its clinic, comment, response and whether it came from the
+    positive or negative file, so rows read from a file can be matched with rows already stored in the database.
+
+    :param dataframe: Pandas dataframe holding rows of feedback
+    :return: Series holding the hex digest of the SHA-256 hash of each row
+    """
+    values = dataframe[fingerprint_columns].astype(object)
+    values = values.where(values.notnull(), "").astype(str)
+    joined = values[fingerprint_columns[0]]
+    for column in fingerprint_columns[1:]:
+        joined = joined + "\x1f" + values[column]
+    return joined.map(lambda row: hashlib.sha256(row.encode("utf-8")).hexdigest())
+
+
+def check_columns(columns):
+    """
+    Checks that every column asked for by a client is a column of the stored data.
+
+    :param columns: List of dataframe column names
+    """
+    unknown_columns = [column for column in columns if column not in database_columns]
+    if len(unknown_columns) != 0:
+        raise RuntimeError("Unknown columns " + ", ".join(unknown_columns))
+
+
+def dataframe_to_rows(dataframe):
+    """
+    Converts a dataframe of analysed data into rows that can be inserted into the database.
+
+    :param dataframe: Pandas dataframe holding analysed data
+    :return: list of lists, each holding the values of a row in the same order as the columns of feedbackdatabase
+    """
+    if not isinstance(dataframe, pd.DataFrame):
+        raise RuntimeError("Dataframe not passed to insert_data")
+
+    missing_columns = [column for column in dataframe_columns if column not in dataframe.columns]
+    if len(missing_columns) != 0:
+        raise RuntimeError("Dataframe passed to insert_data is missing columns " + ", ".join(missing_columns))
+
+    # converted to python objects with NaN replaced by None so they can be sent to MySQL
+    values = dataframe[dataframe_columns].astype(object)
+    return values.where(values.notnull(), None).values.tolist()
+
+
+@timed("db_connect")
+def connect_to_database():
+    """
+    Attempts to get a connection to the database hosted on azure from the connection pool.
+
+    :return: A connection to the database
+    :raises DatabaseUnavailableError: If the database cannot be reached or no connection became free in time
+    """
     try:
-        db_connection = mysql.connector.connect(user=data["database_username"],
-                                                password=data["database_password"],
-                                                database=data["database_name"],
-                                                host=data["database_host"]
-                                                )
-        return db_connection
-    except mysql.connector.Error as err:
+        return get_connection_pool().get_connection()
+    except (mysql.connector.Error, RuntimeError) as err:
         print(err)
+        raise DatabaseUnavailableError("Unable to connect to the database. " + str(err)) from err
+
+
+def prepare_database():
+    """
+    Makes sure the feedbackdatabase table exists and is up to date with every schema migration. Only does this the first
+    time it is called in a process so the checks are not repeated on every request.
+    """
+    global database_prepared
+    with database_prepared_lock:
+        if not database_prepared:
+            database = Database()
+            database.create_table()
+            database.migrate_schema()
+            database_prepared = True
 
 
 class Database():
@@ -27,28 +244,94 @@ class Database():
     Azure.
     """
 
-    def insert_data(self, dataframe):
+    def __init__(self):
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+            self.insert_chunk_size = data.get("database_insert_chunk_size", 1000)
+            self.stream_chunk_size = data.get("stream_chunk_size", 1000)
+
+    @timed("db_insert")
+    def insert_data(self, dataframe, analysed_files=None):
         """
         Writes the analysed data (both positive and negative) for a specific month to the MySQL database for future use
-        so that there's no need to re-run the analysis on the same data in case it is requested again later on.
+        so that there's no need to re-run the analysis on the same data in case it is requested again later on. Rows are
+        written in chunks of several rows per statement within a single transaction.
 
         :param dataframe: Pandas dataframe holding the analysed data for a specific month and year
+        :param analysed_files: Optional tuple in the form (month, year, positive etag, negative etag) recording which
+        files the data was analysed from, written in the same transaction as the data
         """
-
-        if not isinstance(dataframe, pd.DataFrame):
-            raise RuntimeError("Dataframe not passed to insert_data")
+        rows = dataframe_to_rows(dataframe)
 
         db_connection = connect_to_database()
         cursor = db_connection.cursor()
 
+        try:
+            self.insert_rows(cursor, rows)
+            if analysed_files is not None:
+                self.record_analysed_files(cursor, analysed_files)
+            db_connection.commit()
+        except Exception:
+            db_connection.rollback()
+            raise
+        finally:
+            db_connection.close()
+        metrics.add_rows("db_insert", len(rows))
+        get_response_cache().invalidate()
+
+    def insert_rows(self, cursor, rows):
+        """
+        Inserts rows into the database in chunks of several rows per statement. Nothing is committed so the rows can be
+        written as part of a larger transaction.
+
+        :param cursor: Cursor of the connection the rows are written with
+        :param rows: list of rows created by dataframe_to_rows
+        """
         sql_formula = "INSERT INTO feedbackdatabase (Clinic, Comments, Month, PosOrNeg, Response, Sentiment_Score, Year) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-        for row in range(len(dataframe.index)):
-            cursor.execute(sql_formula, (
-                dataframe.values[row][0], dataframe.values[row][2], dataframe.values[row][4], dataframe.values[row][3],
-                dataframe.values[row][1], dataframe.values[row][6], dataframe.values[row][5]))
-        db_connection.commit()
+        for start in range(0, len(rows), self.insert_chunk_size):
+            cursor.executemany(sql_formula, rows[start:start + self.insert_chunk_size])
+
+    def record_analysed_files(self, cursor, analysed_files):
+        """
+        Records the ETags of the files a month was analysed from, replacing any recorded before. Nothing is committed so
+        they can be written in the same transaction as the month's data.
+
+        :param cursor: Cursor of the connection the ETags are written with
+        :param analysed_files: tuple in the form (month, year, positive etag, negative etag)
+        """
+        month, year, positive_etag, negative_etag = analysed_files
+        cursor.execute("DELETE FROM analysed_files WHERE Year = %s AND Month = %s", (year, month))
+        cursor.execute("INSERT INTO analysed_files (Year, Month, PositiveETag, NegativeETag) VALUES (%s, %s, %s, %s)",
+                       (year, month, positive_etag, negative_etag))
+
+    @timed("db_select")
+    def get_analysed_files(self, months_and_years):
+        """
+        Gets the ETags of the files each month was analysed from, so months whose files have changed since can be found
+        without reading any of the stored data.
+
+        :param months_and_years: List of tuples in the form (month, year) representing the months to check
+        :return: Dictionary mapping (month, year) to a tuple in the form (positive etag, negative etag). Months with no
+        recorded ETags are left out.
+        """
+        if len(months_and_years) == 0:
+            return {}
+
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+
+        sql_formula = "SELECT Month, Year, PositiveETag, NegativeETag FROM analysed_files WHERE " + \
+                      " OR ".join(["(Year = %s AND Month = %s)"] * len(months_and_years))
+        parameters = []
+        for month, year in months_and_years:
+            parameters.extend([year, month])
+        cursor.execute(sql_formula, parameters)
+        analysed_files = {(month, year): (positive_etag, negative_etag)
+                          for month, year, positive_etag, negative_etag in cursor.fetchall()}
         db_connection.close()
 
+        return analysed_files
+
     def create_table(self):
         """
         Creates the table in the database if it does not already exist. Table should already exist but this method is here
@@ -57,12 +340,66 @@ class Database():
         db_connection = connect_to_database()
         cursor = db_connection.cursor()
 
-        cursor.execute("USE fftfeedback")
-        cursor.execute(
-            "CREATE TABLE IF NOT EXISTS feedbackdatabase(ID INT NOT NULL AUTO_INCREMENT, Clinic VARCHAR(100) NOT NULL, Comments VARCHAR(1000) NOT NULL, Month INT NOT NULL, PosOrNeg VARCHAR(10) NOT NULL, Response VARCHAR(25), Sentiment_Score FLOAT NOT NULL, Year INT NOT NULL, PRIMARY KEY (ID));")
+        if db_connection.dialect == "sqlite":
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS feedbackdatabase(ID INTEGER PRIMARY KEY AUTOINCREMENT, Clinic VARCHAR(100) NOT NULL, Comments VARCHAR(1000) NOT NULL, Month INT NOT NULL, PosOrNeg VARCHAR(10) NOT NULL, Response VARCHAR(25), Sentiment_Score FLOAT NOT NULL, Year INT NOT NULL);")
+        else:
+            cursor.execute("USE fftfeedback")
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS feedbackdatabase(ID INT NOT NULL AUTO_INCREMENT, Clinic VARCHAR(100) NOT NULL, Comments VARCHAR(1000) NOT NULL, Month INT NOT NULL, PosOrNeg VARCHAR(10) NOT NULL, Response VARCHAR(25), Sentiment_Score FLOAT NOT NULL, Year INT NOT NULL, PRIMARY KEY (ID));")
         db_connection.commit()
         db_connection.close()
 
+    def migrate_schema(self, table="feedbackdatabase"):
+        """
+        Applies any schema migrations that have not yet been applied to the table, recording each applied version in the
+        schema_version table. Safe to run against an existing table, migrations that have already been applied are
+        skipped and an index that was created by hand is treated as already applied.
+
+        :param table: Name of the table to migrate
+        :return: List of the versions that were applied
+        """
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+
+        # stops two processes starting at the same time from applying the same migration, SQLite locks the whole file
+        # while writing so does not need this
+        if db_connection.dialect == "mysql":
+            cursor.execute("SELECT GET_LOCK('psat_schema_migration', 60)")
+            cursor.fetchall()
+        try:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS schema_version(TableName VARCHAR(100) NOT NULL, Version INT NOT NULL, Description VARCHAR(255), Applied TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (TableName, Version));")
+            cursor.execute("SELECT Version FROM schema_version WHERE TableName = %s", (table,))
+            applied_versions = set(row[0] for row in cursor.fetchall())
+
+            newly_applied = []
+            for version, description, statements in schema_migrations:
+                if version in applied_versions:
+                    continue
+                for statement in statements:
+                    statement = statement.format(table=table)
+                    if db_connection.dialect == "sqlite":
+                        for mysql_text, sqlite_text in sqlite_statement_replacements:
+                            statement = statement.replace(mysql_text, sqlite_text)
+                    try:
+                        cursor.execute(statement)
+                    except mysql.connector.Error as err:
+                        if err.errno != duplicate_key_name_error:
+                            raise
+                cursor.execute("INSERT INTO schema_version (TableName, Version, Description) VALUES (%s, %s, %s)",
+                               (table, version, description))
+                db_connection.commit()
+                newly_applied.append(version)
+        finally:
+            if db_connection.dialect == "mysql":
+                cursor.execute("SELECT RELEASE_LOCK('psat_schema_migration')")
+                cursor.fetchall()
+            db_connection.close()
+
+        return newly_applied
+
+    @timed("db_select")
     def use_database_storage(self, month, year):
         """
         Gets the already analysed data from the MySQL database on azure for a specific month and year and converts the data
@@ -78,11 +415,12 @@ class Database():
         db_connection = connect_to_database()
         cursor = db_connection.cursor()
 
-        sql_formula = "SELECT * FROM feedbackdatabase WHERE Month = " + str(month) + " AND Year = " + str(year)
-        cursor.execute(sql_formula)
+        sql_formula = "SELECT * FROM feedbackdatabase WHERE Month = %s AND Year = %s"
+        cursor.execute(sql_formula, (month, year))
         rows = cursor.fetchall()
         db_connection.close()
 
+        metrics.add_rows("db_select", len(rows))
         if len(rows) != 0:
             # drops the ID row from the database that acts as a primary key to conform to the required format
             df = pd.DataFrame(rows, columns=["DROP", "CLINIC", "COMMENTS", "Month", "Pos or Neg", "RESPONSE",
@@ -91,9 +429,245 @@ class Database():
             return True, df
         return False, None
 
+    @timed("db_select_months")
+    def use_database_storage_for_months(self, months_and_years):
+        """
+        Gets the already analysed data from the MySQL database on azure for several months at once using a single query,
+        rather than one query per month.
+
+        :param months_and_years: List of tuples in the form (month, year) representing the months that need to be
+        retrieved
+        :return: tuple in the form (Dataframe, Set). Dataframe contains the data for every month that was found in the
+        database, in the same format as use_database_storage. Set contains the (month, year) tuples for the months that
+        are not in the database yet and still need to be analysed.
+        """
+        if len(months_and_years) == 0:
+            return pd.DataFrame(columns=dataframe_columns), set()
+
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+
+        sql_formula = "SELECT Clinic, Comments, Month, PosOrNeg, Response, Sentiment_Score, Year FROM feedbackdatabase " \
+                      "WHERE " + " OR ".join(["(Year = %s AND Month = %s)"] * len(months_and_years)) + " ORDER BY ID"
+        parameters = []
+        for month, year in months_and_years:
+            parameters.extend([year, month])
+        cursor.execute(sql_formula, parameters)
+        rows = cursor.fetchall()
+        db_connection.close()
+
+        metrics.add_rows("db_select_months", len(rows))
+        df = pd.DataFrame(rows, columns=dataframe_columns)
+        stored_months = set(zip(df["Month"], df["Year"]))
+        missing_months = set(months_and_years) - stored_months
+        return df, missing_months
+
+    @timed("db_select")
+    def find_missing_months(self, months_and_years):
+        """
+        Works out which months have not been stored in the database yet without reading any of the stored data.
+
+        :param months_and_years: List of tuples in the form (month, year) representing the months to check
+        :return: Set containing the (month, year) tuples for the months that are not in the database
+        """
+        if len(months_and_years) == 0:
+            return set()
+
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+
+        sql_formula = "SELECT DISTINCT Month, Year FROM feedbackdatabase WHERE " + \
+                      " OR ".join(["(Year = %s AND Month = %s)"] * len(months_and_years))
+        parameters = []
+        for month, year in months_and_years:
+            parameters.extend([year, month])
+        cursor.execute(sql_formula, parameters)
+        stored_months = set((month, year) for month, year in cursor.fetchall())
+        db_connection.close()
+
+        return set(months_and_years) - stored_months
+
+    def build_feedback_query(self, months_and_years, columns, clinic=None, sentiment=None, min_score=None,
+                             max_score=None, after_id=None, limit=None):
+        """
+        Creates the query used by query_feedback and stream_feedback. The ID of each row is always selected first.
+
+        :param months_and_years: List of tuples in the form (month, year) representing the months to be retrieved
+        :param columns: List of the dataframe columns to be retrieved
+        :param clinic: Only rows for this clinic are retrieved, None for every clinic
+        :param sentiment: "Positive" or "Negative" to retrieve only rows from that file, None for both
+        :param min_score: Only rows with a sentiment score of at least this are retrieved, None for no minimum
+        :param max_score: Only rows with a sentiment score of at most this are retrieved, None for no maximum
+        :param after_id: Only rows with an ID after this are retrieved, None to start from the first row
+        :param limit: Greatest number of rows to retrieve, None for no limit
+        :return: tuple in the form (String, list) holding the query and its parameters
+        """
+        check_columns(columns)
+        conditions = ["(" + " OR ".join(["(Year = %s AND Month = %s)"] * len(months_and_years)) + ")"]
+        parameters = []
+        for month, year in months_and_years:
+            parameters.extend([year, month])
+        for condition, value in [("Clinic = %s", clinic), ("PosOrNeg = %s", sentiment),
+                                 ("Sentiment_Score >= %s", min_score), ("Sentiment_Score <= %s", max_score),
+                                 ("ID > %s", after_id)]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        sql_formula = "SELECT ID, " + ", ".join(database_columns[column] for column in columns) + \
+                      " FROM feedbackdatabase WHERE " + " AND ".join(conditions) + " ORDER BY ID"
+        if limit is not None:
+            sql_formula += " LIMIT %s"
+            parameters.append(limit)
+        return sql_formula, parameters
+
+    @timed("db_query")
+    def query_feedback(self, months_and_years, columns=None, clinic=None, sentiment=None, min_score=None,
+                       max_score=None, after_id=None, limit=None):
+        """
+        Gets the stored data for several months, filtered and cut down in the database itself so only the rows and
+        columns that are needed are read. Rows are returned in order of their ID so the data can be read a page at a
+        time, each page starting after the last ID of the page before.
+
+        :param months_and_years: List of tuples in the form (month, year) representing the months to be retrieved
+        :param columns: List of the dataframe columns to be retrieved, None for every column
+        :param clinic: Only rows for this clinic are retrieved, None for every clinic
+        :param sentiment: "Positive" or "Negative" to retrieve only rows from that file, None for both
+        :param min_score: Only rows with a sentiment score of at least this are retrieved, None for no minimum
+        :param max_score: Only rows with a sentiment score of at most this are retrieved, None for no maximum
+        :param after_id: Only rows with an ID after this are retrieved, None to start from the first row
+        :param limit: Greatest number of rows to retrieve, None for no limit
+        :return: tuple in the form (Dataframe, int). Dataframe holds the rows retrieved. The int is the ID to pass as
+        after_id to get the next page, None if there are no more rows.
+        """
+        columns = dataframe_columns if columns is None else columns
+        check_columns(columns)
+        if len(months_and_years) == 0:
+            return pd.DataFrame(columns=columns), None
+
+        sql_formula, parameters = self.build_feedback_query(months_and_years, columns, clinic, sentiment, min_score,
+                                                            max_score, after_id, limit)
+
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+        cursor.execute(sql_formula, parameters)
+        rows = cursor.fetchall()
+        db_connection.close()
+
+        metrics.add_rows("db_query", len(rows))
+        df = pd.DataFrame(rows, columns=["ID"] + columns)
+        next_after_id = None
+        if limit is not None and len(df.index) == limit:
+            next_after_id = int(df["ID"].iloc[-1])
+        return df.drop(columns="ID"), next_after_id
+
+    def stream_feedback(self, months_and_years, columns=None, clinic=None, sentiment=None, min_score=None,
+                        max_score=None):
+        """
+        Reads the stored data for several months one month at a time, and within each month a chunk of rows at a time
+        straight from the database cursor, so the data for every month never has to be held in memory at once. The
+        connection is held until every chunk has been read or the generator is closed.
+
+        :param months_and_years: List of tuples in the form (month, year) representing the months to be retrieved, in
+        the order they should be read
+        :param columns: List of the dataframe columns to be retrieved, None for every column
+        :param clinic: Only rows for this clinic are retrieved, None for every clinic
+        :param sentiment: "Positive" or "Negative" to retrieve only rows from that file, None for both
+        :param min_score: Only rows with a sentiment score of at least this are retrieved, None for no minimum
+        :param max_score: Only rows with a sentiment score of at most this are retrieved, None for no maximum
+        :return: Generator of dataframes each holding up to stream_chunk_size rows
+        """
+        columns = dataframe_columns if columns is None else columns
+        # built before anything is read so invalid columns are reported straight away
+        queries = [self.build_feedback_query([month], columns, clinic, sentiment, min_score, max_score)
+                   for month in months_and_years]
+        return self.read_in_chunks(queries, columns)
+
+    def read_in_chunks(self, queries, columns):
+        """
+        Runs queries one after another, reading the rows of each a chunk at a time.
+
+        :param queries: List of tuples in the form (String, list) holding each query and its parameters
+        :param columns: List of the dataframe columns selected by the queries after the ID
+        :return: Generator of dataframes each holding up to stream_chunk_size rows
+        """
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+        try:
+            for sql_formula, parameters in queries:
+                cursor.execute(sql_formula, parameters)
+                rows = cursor.fetchmany(self.stream_chunk_size)
+                while len(rows) != 0:
+                    metrics.add_rows("db_stream", len(rows))
+                    yield pd.DataFrame(rows, columns=["ID"] + columns).drop(columns="ID")
+                    rows = cursor.fetchmany(self.stream_chunk_size)
+        except GeneratorExit:
+            # MySQL will not reuse a connection with rows left unread, so they are read and thrown away a chunk at a time
+            if db_connection.dialect == "mysql":
+                while len(cursor.fetchmany(self.stream_chunk_size)) != 0:
+                    pass
+            raise
+        finally:
+            db_connection.close()
+
+    @timed("db_select")
+    def get_month_rows(self, month, year):
+        """
+        Gets the id and identifying columns of every row stored for a specific month and year, used to work out which
+        rows have changed when the files for the month are updated.
+
+        :param month: Integer representing month to be retrieved
+        :param year: Integer representing year to be retrieved
+        :return: Dataframe with the columns ID, CLINIC, COMMENTS, RESPONSE and Pos or Neg
+        """
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+
+        sql_formula = "SELECT ID, Clinic, Comments, Response, PosOrNeg FROM feedbackdatabase WHERE Year = %s AND Month = %s ORDER BY ID"
+        cursor.execute(sql_formula, (year, month))
+        rows = cursor.fetchall()
+        db_connection.close()
+
+        metrics.add_rows("db_select", len(rows))
+        return pd.DataFrame(rows, columns=["ID"] + fingerprint_columns)
+
+    @timed("db_update")
+    def update_month(self, added_dataframe, removed_ids, analysed_files=None):
+        """
+        Inserts the rows added to a month and deletes the rows removed from it in a single transaction, so requests
+        never see the month half updated.
+
+        :param added_dataframe: Pandas dataframe holding the analysed rows to be added
+        :param removed_ids: List of the ids of the rows to be deleted
+        :param analysed_files: Optional tuple in the form (month, year, positive etag, negative etag) recording which
+        files the month was analysed from, written in the same transaction
+        """
+        rows = dataframe_to_rows(added_dataframe)
+
+        db_connection = connect_to_database()
+        cursor = db_connection.cursor()
+
+        try:
+            for start in range(0, len(removed_ids), self.insert_chunk_size):
+                chunk = removed_ids[start:start + self.insert_chunk_size]
+                cursor.execute("DELETE FROM feedbackdatabase WHERE ID IN (" + ", ".join(["%s"] * len(chunk)) + ")",
+                               chunk)
+            self.insert_rows(cursor, rows)
+            if analysed_files is not None:
+                self.record_analysed_files(cursor, analysed_files)
+            db_connection.commit()
+        except Exception:
+            db_connection.rollback()
+            raise
+        finally:
+            db_connection.close()
+        metrics.add_rows("db_update", len(rows) + len(removed_ids))
+        get_response_cache().invalidate()
+
+    @timed("db_delete")
     def delete_specific_month(self, month, year):
         """
-        Deletes a specific month and year from the database.
+        Deletes a specific month and year from the database, along with the ETags of the files it was analysed from.
 
         :param month: Integer representing month to be deleted
         :param year: Integer representing year to be deleted
@@ -102,10 +676,12 @@ class Database():
         db_connection = connect_to_database()
         cursor = db_connection.cursor()
 
-        sql_formula = "DELETE FROM feedbackdatabase WHERE Month = " + str(month) + " AND Year = " + str(year)
-        cursor.execute(sql_formula)
+        sql_formula = "DELETE FROM feedbackdatabase WHERE Month = %s AND Year = %s"
+        cursor.execute(sql_formula, (month, year))
+        cursor.execute("DELETE FROM analysed_files WHERE Month = %s AND Year = %s", (month, year))
         db_connection.commit()
         db_connection.close()
+        get_response_cache().invalidate()
 
     def delete_specific_year(self, year):
         """
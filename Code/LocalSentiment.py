@@ -0,0 +1,97 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+
+# weights of words commonly found in patient feedback, positive weights push a comment's score towards 1 and negative
+# weights push it towards 0
+default_lexicon = {
+    "amazing": 3.0, "brilliant": 3.0, "excellent": 3.0, "outstanding": 3.0, "fantastic": 3.0, "superb": 3.0,
+    "wonderful": 3.0, "perfect": 2.5, "great": 2.5, "caring": 2.0, "kind": 2.0, "friendly": 2.0, "helpful": 2.0,
+    "pleasant": 2.0, "professional": 2.0, "thank": 2.0, "thanks": 2.0, "good": 1.5, "happy": 1.5, "lovely": 2.0,
+    "polite": 1.5, "quick": 1.0, "efficient": 1.5, "clean": 1.0, "reassuring": 1.5, "reassured": 1.5,
+    "supportive": 1.5, "patient": 1.0, "clear": 1.0, "informative": 1.5, "welcoming": 1.5, "comfortable": 1.0,
+    "satisfied": 1.5, "recommend": 1.5, "listened": 1.5, "nice": 1.5, "well": 1.0, "best": 2.5, "easy": 1.0,
+    "appalling": -3.0, "awful": -3.0, "terrible": -3.0, "horrible": -3.0, "dreadful": -3.0, "disgusting": -3.0,
+    "worst": -3.0, "rude": -2.5, "unprofessional": -2.5, "disappointed": -2.0, "disappointing": -2.0, "poor": -2.0,
+    "bad": -2.0, "unhelpful": -2.0, "dirty": -2.0, "ignored": -2.0, "uncaring": -2.0, "dismissive": -2.0,
+    "waste": -2.0, "wasted": -2.0, "cancelled": -1.5, "confusing": -1.5, "confused": -1.0, "delay": -1.5,
+    "delayed": -1.5, "delays": -1.5, "late": -1.0, "long": -0.5, "waiting": -1.0, "wait": -0.5, "slow": -1.5,
+    "pain": -1.0, "painful": -1.5, "upset": -2.0, "unhappy": -2.0, "complaint": -1.5, "lost": -1.0,
+    "problem": -1.0, "problems": -1.0, "difficult": -1.0, "lack": -1.0, "never": -1.0, "nobody": -1.0,
+}
+
+# words that reverse the sentiment of the word that follows them e.g. "not helpful"
+negations = ["not", "no", "never", "isn't", "wasn't", "weren't", "don't", "didn't", "doesn't", "couldn't", "won't",
+             "wouldn't", "hardly"]
+
+
+class LexiconSentimentScorer():
+    """
+    This class encapsulates all the code that deals with scoring comments locally without using the Text Analytics
+    API. It acts as a linear model over the terms found in each comment, with the weight of each term taken from a
+    lexicon. Every comment in a month is scored at the same time using NumPy rather than one comment at a time.
+    """
+
+    def __init__(self):
+        with open('config.json') as config_file:
+            data = json.load(config_file)
+            lexicon_path = data.get("sentiment_lexicon_path", "")
+
+        self.lexicon = default_lexicon
+        if lexicon_path != "":
+            with open(lexicon_path) as lexicon_file:
+                self.lexicon = json.load(lexicon_file)
+        # scores depend on the lexicon used so the version changes whenever the lexicon does
+        lexicon_hash = hashlib.sha256(json.dumps(self.lexicon, sort_keys=True).encode("utf-8")).hexdigest()
+        self.model_version = "lexicon-" + lexicon_hash[:12]
+
+    def score_comments(self, comments):
+        """
+        Scores every comment at once. Comments are split into terms to form a sparse term matrix, held as the comment
+        position and weight of each term, which is then summed per comment and squashed into a score between 0 and 1.
+        Comments without any terms found in the lexicon are given a neutral score of 0.5.
+
+        :param comments: List of comments to be analysed.
+        :return: List of scores corresponding to the comments. Comments that are not text have None as their score.
+        """
+        comments = pd.Series(list(comments), dtype=object)
+        is_text = comments.map(lambda comment: isinstance(comment, str)).to_numpy(dtype=bool)
+
+        terms = comments.where(is_text).str.lower().str.findall(r"[a-z']+").explode()
+        positions = terms.index.to_numpy()
+        weights = terms.map(self.lexicon).fillna(0).to_numpy(dtype=np.float64)
+        # flip the weight of any term that directly follows a negation within the same comment
+        negated = terms.groupby(level=0).shift(1).isin(negations).to_numpy()
+        weights = np.where(negated, -weights, weights)
+
+        totals = np.bincount(positions, weights=weights, minlength=len(comments))
+        matches = np.bincount(positions, weights=(weights != 0).astype(np.float64), minlength=len(comments))
+        scores = 1 / (1 + np.exp(-totals / np.sqrt(np.maximum(matches, 1))))
+
+        return ["{:.4f}".format(score) if text else None for score, text in zip(scores, is_text)]
+
+
+class DeterministicSentimentScorer():
+    """
+    This class stands in for the Text Analytics API when benchmarking or testing without access to Azure. Each comment
+    is given a score worked out from a hash of its text, so the same comment is always given the same score.
+    """
+
+    model_version = "deterministic-1"
+
+    def score_comments(self, comments):
+        """
+        Scores every comment using a hash of its text.
+
+        :param comments: List of comments to be analysed.
+        :return: List of scores corresponding to the comments. Comments that are not text have None as their score.
+        """
+        scores = []
+        for comment in comments:
+            if not isinstance(comment, str):
+                scores.append(None)
+                continue
+            digest = hashlib.sha256(comment.encode("utf-8")).digest()
+            scores.append("{:.4f}".format(int.from_bytes(digest[:4], "big") / 2 ** 32))
+        return scores
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+import os
+import sqlite3
+
+
+class LocalBlob():
+    """
+    This class describes a file in a LocalBlobService in the same way Azure describes a blob, so it can be used in
+    place of one.
+    """
+
+    def __init__(self, name, etag, last_modified):
+        self.name = name
+        self.properties = LocalBlobProperties(etag, last_modified)
+
+
+class LocalBlobProperties():
+    """
+    This class holds the properties of a LocalBlob.
+    """
+
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class LocalBlobContents():
+    """
+    This class holds the contents of a LocalBlob in the same way Azure returns the contents of a blob.
+    """
+
+    def __init__(self, content, etag, last_modified):
+        self.content = content
+        self.properties = LocalBlobProperties(etag, last_modified)
+
+
+class LocalBlobService():
+    """
+    This class stands in for the Azure BlockBlobService, reading the feedback files from a local directory instead of
+    a blob storage container. Used to run and profile the system without access to Azure, for example by pointing it at
+    the Excel/MockData directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def list_blobs(self, container_name):
+        """
+        Lists the files in the directory. The ETag of each file changes whenever the file is modified.
+
+        :param container_name: Name of the container, ignored as the directory acts as the container
+        :return: list of LocalBlob objects describing each file
+        """
+        return [self.get_blob_properties(container_name, name) for name in sorted(os.listdir(self.directory))
+                if os.path.isfile(os.path.join(self.directory, name))]
+
+    def get_blob_properties(self, container_name, blob_name):
+        """
+        Describes a single file in the directory.
+
+        :param container_name: Name of the container, ignored as the directory acts as the container
+        :param blob_name: Name of the file
+        :return: LocalBlob describing the file
+        """
+        stat = os.stat(os.path.join(self.directory, blob_name))
+        etag = "{}-{}".format(stat.st_mtime_ns, stat.st_size)
+        return LocalBlob(blob_name, etag, datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+
+    def get_blob_to_bytes(self, container_name, blob_name):
+        """
+        Reads a file from the directory.
+
+        :param container_name: Name of the container, ignored as the directory acts as the container
+        :param blob_name: Name of the file to read
+        :return: LocalBlobContents holding the bytes making up the file along with its properties
+        """
+        with open(os.path.join(self.directory, blob_name), "rb") as blob_file:
+            stat = os.fstat(blob_file.fileno())
+            return LocalBlobContents(blob_file.read(), "{}-{}".format(stat.st_mtime_ns, stat.st_size),
+                                     datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+
+
+class SQLiteConnection():
+    """
+    This class stands in for a connection to the MySQL database, storing feedback in a local SQLite file instead. The
+    queries written for MySQL can be run unchanged as the %s placeholders they use are converted to the ? placeholders
+    SQLite expects.
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, path):
+        self.db_connection = sqlite3.connect(path, timeout=30)
+        # lets requests read the database while another request is writing to it
+        self.db_connection.execute("PRAGMA journal_mode=WAL")
+
+    def cursor(self):
+        return SQLiteCursor(self.db_connection.cursor())
+
+    def commit(self):
+        self.db_connection.commit()
+
+    def rollback(self):
+        self.db_connection.rollback()
+
+    def close(self):
+        self.db_connection.close()
+
+
+class SQLiteCursor():
+    """
+    This class wraps a SQLite cursor so that it accepts queries written with MySQL placeholders.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql_formula, parameters=()):
+        self.cursor.execute(sql_formula.replace("%s", "?"), parameters)
+
+    def executemany(self, sql_formula, rows):
+        self.cursor.executemany(sql_formula.replace("%s", "?"), rows)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
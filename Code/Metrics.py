@@ -0,0 +1,182 @@
+import contextvars
+import functools
+import threading
+import time
+
+# upper bounds in seconds of the buckets stage durations are counted in
+default_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# time spent in each stage during the current request, None when not in a request
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class StageMetrics():
+    """
+    This class holds the latency histogram and counters recorded for a single stage of the pipeline.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.rows = 0
+
+    def observe(self, seconds):
+        """
+        Records a single run of the stage.
+
+        :param seconds: Time the stage took
+        """
+        self.count += 1
+        self.total_seconds += seconds
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+
+
+class MetricsRegistry():
+    """
+    This class encapsulates all the code that deals with recording how long each stage of the pipeline takes and how
+    many rows it handles, and writing the results out in the Prometheus text format.
+    """
+
+    def __init__(self, buckets=None):
+        self.buckets = buckets if buckets is not None else default_buckets
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def get_stage(self, stage):
+        """
+        Gets the metrics for a stage, creating them the first time the stage is seen. The lock must already be held.
+
+        :param stage: Name of the stage
+        :return: StageMetrics for the stage
+        """
+        if stage not in self.stages:
+            self.stages[stage] = StageMetrics(self.buckets)
+        return self.stages[stage]
+
+    def observe(self, stage, seconds):
+        """
+        Records how long a run of a stage took, both for the whole process and for the current request.
+
+        :param stage: Name of the stage
+        :param seconds: Time the stage took
+        """
+        with self.lock:
+            self.get_stage(stage).observe(seconds)
+            timings = request_timings.get()
+            if timings is not None:
+                timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def add_rows(self, stage, rows):
+        """
+        Records the number of rows handled by a stage.
+
+        :param stage: Name of the stage
+        :param rows: Number of rows handled
+        """
+        with self.lock:
+            self.get_stage(stage).rows += rows
+
+    def render(self, cache_statistics):
+        """
+        Writes every metric out in the Prometheus text format.
+
+        :param cache_statistics: Dictionary mapping the name of each cache to a dictionary holding its hits and misses
+        :return: String holding the metrics
+        """
+        lines = ["# HELP psat_stage_duration_seconds Time spent in each stage of the pipeline.",
+                 "# TYPE psat_stage_duration_seconds histogram"]
+        with self.lock:
+            stages = sorted(self.stages.items())
+            for stage, stage_metrics in stages:
+                for bound, bucket_count in zip(stage_metrics.buckets, stage_metrics.bucket_counts):
+                    lines.append('psat_stage_duration_seconds_bucket{{stage="{}",le="{}"}} {}'.format(
+                        stage, bound, bucket_count))
+                lines.append('psat_stage_duration_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(
+                    stage, stage_metrics.count))
+                lines.append('psat_stage_duration_seconds_sum{{stage="{}"}} {}'.format(
+                    stage, stage_metrics.total_seconds))
+                lines.append('psat_stage_duration_seconds_count{{stage="{}"}} {}'.format(stage, stage_metrics.count))
+
+            lines.append("# HELP psat_stage_rows_total Rows handled by each stage of the pipeline.")
+            lines.append("# TYPE psat_stage_rows_total counter")
+            for stage, stage_metrics in stages:
+                lines.append('psat_stage_rows_total{{stage="{}"}} {}'.format(stage, stage_metrics.rows))
+
+        lines.append("# HELP psat_cache_hits_total Lookups answered by each cache.")
+        lines.append("# TYPE psat_cache_hits_total counter")
+        for cache, statistics in sorted(cache_statistics.items()):
+            lines.append('psat_cache_hits_total{{cache="{}"}} {}'.format(cache, statistics["hits"]))
+        lines.append("# HELP psat_cache_misses_total Lookups each cache could not answer.")
+        lines.append("# TYPE psat_cache_misses_total counter")
+        for cache, statistics in sorted(cache_statistics.items()):
+            lines.append('psat_cache_misses_total{{cache="{}"}} {}'.format(cache, statistics["misses"]))
+        lines.append("# HELP psat_cache_hit_ratio Fraction of lookups answered by each cache.")
+        lines.append("# TYPE psat_cache_hit_ratio gauge")
+        for cache, statistics in sorted(cache_statistics.items()):
+            lookups = statistics["hits"] + statistics["misses"]
+            lines.append('psat_cache_hit_ratio{{cache="{}"}} {}'.format(
+                cache, statistics["hits"] / lookups if lookups != 0 else 0.0))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+def timed(stage):
+    """
+    Decorator that records how long every call to the decorated function takes under the given stage name.
+
+    :param stage: Name of the stage
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.observe(stage, time.perf_counter() - start)
+        return timed_function
+    return decorator
+
+
+def start_request_timing():
+    """
+    Starts recording the time spent in each stage for the current request.
+    """
+    request_timings.set({})
+
+
+def stop_request_timing():
+    """
+    Stops recording the time spent in each stage once the current request has been handled.
+    """
+    request_timings.set(None)
+
+
+def get_request_timings():
+    """
+    Gets the time spent in each stage during the current request.
+
+    :return: Dictionary mapping each stage to the seconds spent in it, None if timings are not being recorded
+    """
+    return request_timings.get()
+
+
+def with_request_context(function):
+    """
+    Wraps a function so that when it is run by a pool of workers, the time it spends in each stage still counts towards
+    the request that started it.
+
+    :param function: Function to be run by the workers
+    :return: The wrapped function
+    """
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run_in_context
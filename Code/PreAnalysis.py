@@ -0,0 +1,134 @@
+import json
+import threading
+
+from AnalysisJobs import get_job_queue
+from AzureBlobStorage import get_blob_catalogue
+from Database import prepare_database
+from ProcessData import DataForMultipleMonths
+
+"""
+NOTE:
+
+The API starts a PreAnalysisScheduler when "pre_analysis_enabled" is set in config.json and application.py is run
+directly. When the API is served by several worker processes this file should be run on its own instead, so that months
+are pre-analysed by a single process, as long as it uses the same database as the API.
+
+Example usage: python PreAnalysis.py
+"""
+
+
+class PreAnalysisScheduler():
+    """
+    This class encapsulates all the code that deals with analysing monthly feedback files as soon as they are uploaded,
+    rather than waiting for the first request for the month. The blob catalogue is checked every interval and any
+    month whose positive and negative files are new or have changed since they were last analysed is queued on the
+    shared job queue, which limits how many months are analysed at the same time and stops a month being analysed by a
+    request, whether or not it waits for the month, and the scheduler at once. The ETags of the files each month was analysed from are stored in the database
+    with the month, so months are not analysed again when the process restarts.
+    """
+
+    def __init__(self):
+        with open('config.json') as config_file:
+            data = json.load(config_file)
+            self.interval = data.get("pre_analysis_interval", 300)
+            # only this many of the most recent months are pre-analysed, older months are still analysed on request
+            self.max_months = data.get("pre_analysis_months", 12)
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def find_complete_months(self, blob_index):
+        """
+        Finds the most recent months that have both a positive and a negative file.
+
+        :param blob_index: Index of the files in blob storage as held by a BlobCatalogue
+        :return: list of tuples in the form (month, year), most recent first
+        """
+        complete_months = sorted({(year, month) for sentiment, year, month in blob_index
+                                  if ("Positive", year, month) in blob_index and ("Negative", year, month) in blob_index},
+                                 reverse=True)[:self.max_months]
+        return [(month, year) for year, month in complete_months]
+
+    def find_months_to_analyse(self, blob_index, analysed_files):
+        """
+        Finds the months whose files have not been analysed since they were last changed.
+
+        :param blob_index: Index of the files in blob storage as held by a BlobCatalogue
+        :param analysed_files: Dictionary mapping (month, year) to the ETags of the positive and negative files the
+        month was analysed from, as given by Database.get_analysed_files
+        :return: list of tuples in the form (month, year)
+        """
+        months_to_analyse = []
+        for month, year in self.find_complete_months(blob_index):
+            etags = (blob_index[("Positive", year, month)]["etag"], blob_index[("Negative", year, month)]["etag"])
+            if analysed_files.get((month, year)) != etags:
+                months_to_analyse.append((month, year))
+        return months_to_analyse
+
+    def poll(self):
+        """
+        Fetches the list of files and queues a job for every month that needs analysing. A month that fails is tried
+        again on the next poll as its ETags are only stored once it has been analysed.
+
+        :return: list of AnalysisJob objects that were queued
+        """
+        prepare_database()
+        process_data = DataForMultipleMonths()
+        catalogue = get_blob_catalogue(process_data.azure_storage)
+        catalogue.refresh(force=True)
+        process_data.azure_storage.blob_index = catalogue.index
+
+        analysed_files = process_data.database.get_analysed_files(self.find_complete_months(catalogue.index))
+
+        # months that are already stored are only updated with the rows that changed, and record their files either way
+        job_queue = get_job_queue()
+        return [job_queue.submit(month, year, process_data.reanalyse_month, "reanalyse")
+                for month, year in self.find_months_to_analyse(catalogue.index, analysed_files)]
+
+    def run(self):
+        """
+        Polls the blob catalogue every interval until stopped.
+        """
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as err:
+                print(err)
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """
+        Starts polling in a background thread, unless already started.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="pre-analysis", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stops polling once the current poll has finished.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+scheduler = None
+scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Gets the scheduler used by the whole process, creating it the first time it is needed.
+
+    :return: The PreAnalysisScheduler used by the whole process
+    """
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = PreAnalysisScheduler()
+        return scheduler
+
+
+if __name__ == "__main__":
+    get_scheduler().run()
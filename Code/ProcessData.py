@@ -1,10 +1,24 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
-from AzureBlobStorage import AzureStorage
-from Database import Database
+from AnalysisJobs import get_job_queue
+from AzureBlobStorage import AzureStorage, workbook_columns
+from Database import Database, fingerprint_rows
+from Metrics import metrics, timed, with_request_context
+from SentimentCache import normalise_comment
 from TextAnalyticsAPI import TextAnalyticsService
 
+# types given to the columns of final_dataframe, categories and small types keep long windows of data small in memory
+column_types = {"CLINIC": "category", "Pos or Neg": "category", "Month": "int8", "Year": "int16",
+                "Sentiment_Score": "float32"}
+
+# columns the data can be summarised by, named as they are in the summary endpoints
+summary_groupings = {"clinic": ["CLINIC"], "month": ["Year", "Month"], "clinicmonth": ["CLINIC", "Year", "Month"]}
+
+# labels given to comments from the positive and negative files, in the order the files are combined
+sentiment_labels = ["Positive", "Negative"]
+
 months = {1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 6: "June", 7: "July", 8: "August",
           9: "September", 10: "October", 11: "November", 12: "December"}
 
@@ -20,34 +34,258 @@ class DataForMultipleMonths():
         self.final_dataframe = pd.DataFrame()
         self.latest_month = ""
         self.latest_year = ""
+        # jobs analysing months that were left out of final_dataframe as they were not ready yet
+        self.pending_jobs = []
         self.database = Database()
         self.azure_storage = AzureStorage()
         self.azure_storage.get_blob_data_names()
         self.text_analytics = TextAnalyticsService()
 
-    def main(self, prev_month_number):
+    @timed("process_months")
+    def process_months(self, no_of_months, background=False):
+        """
+        Gets the data for the most recent no_of_months months. Every month already stored in the database is read with a
+        single query and only the months that are missing are analysed, on the shared job queue so several months are
+        analysed at the same time. The months that were analysed are then read back from the database and the data for
+        every month is combined into final_dataframe at once, from the latest month backwards.
+
+        :param no_of_months: Number of months of data to retrieve, starting from the latest month data is available for.
+        :param background: If True missing months are queued to be analysed in the background instead of waiting for
+        them. final_dataframe then only holds the months that are ready and the jobs are put in pending_jobs.
         """
-        Each execution of this method will append a specific months worth of data to final_dataframe. Acts as a control
-        method and mainly calls other methods in a required order to get the data for the required month.
+        required_months = self.find_required_months(no_of_months)
+        stored_dataframe, missing_months = self.database.use_database_storage_for_months(required_months)
+        month_dataframes = dict(tuple(stored_dataframe.groupby(["Month", "Year"])))
 
-        :param prev_month_number: number of months before the latest month for which there is data available we want to find
-        data for. If the latest month data is available for is September (9) and prev_month_number is 2 then we want to get
-        data for 2 months before September which is July (7).
+        months_to_analyse = [month for month in required_months if month in missing_months]
+        self.analyse_missing_months(months_to_analyse, background)
+        if len(months_to_analyse) != 0 and not background:
+            analysed_dataframe, still_missing = self.database.use_database_storage_for_months(months_to_analyse)
+            month_dataframes.update(dict(tuple(analysed_dataframe.groupby(["Month", "Year"]))))
+
+        self.combine_month_dataframes([month_dataframes[month] for month in required_months
+                                       if month in month_dataframes])
+        metrics.add_rows("process_months", len(self.final_dataframe.index))
+
+    def stream_months(self, no_of_months, background=False, **filters):
+        """
+        Gets the data for the most recent no_of_months months as a stream of chunks read straight from the database,
+        starting with the latest month, so the data never has to be held in memory all at once. Months that are missing
+        are analysed first in the same way as process_months.
+
+        :param no_of_months: Number of months of data to retrieve, starting from the latest month data is available for.
+        :param background: If True missing months are queued to be analysed in the background and left out of the stream
+        :param filters: Filters passed on to Database.stream_feedback
+        :return: Generator of dataframes each holding a chunk of rows
+        """
+        required_months = self.find_required_months(no_of_months)
+        missing_months = self.database.find_missing_months(required_months)
+        self.analyse_missing_months([month for month in required_months if month in missing_months], background)
+        if background:
+            required_months = [month for month in required_months if month not in missing_months]
+        return self.database.stream_feedback(required_months, **filters)
+
+    def find_required_months(self, no_of_months):
+        """
+        Works out which of the most recent no_of_months months have data available.
+
+        :param no_of_months: Number of months to look at, starting from the latest month data is available for.
+        :return: list of tuples in the form (int, int) holding the month and year of each month with data, from the
+        latest month backwards
+        """
+        # worked out once up front so every month is found relative to the same latest month
+        if self.latest_month == "":
+            self.find_latest_data()
+
+        required_months = []
+        for prev_month_number in range(no_of_months):
+            file_month, file_year = self.find_required_month_data(prev_month_number)
+            if file_month is not None:
+                required_months.append((file_month, file_year))
+        return required_months
+
+    def analyse_missing_months(self, months_to_analyse, background=False):
         """
-        file_month, file_year = self.find_required_month_data(prev_month_number)
-        if file_month is None:
+        Analyses months that are not in the database yet using the shared job queue, so several months are analysed at
+        the same time and a month is only ever analysed by one job at once, whether it was asked for by a request waiting
+        for it, a request that does not wait, a re-analysis or the pre-analysis scheduler. Each month is only stored once
+        as the job checks it is still missing before analysing it.
+
+        :param months_to_analyse: list of tuples in the form (int, int) holding the month and year of each month
+        :param background: If True the jobs are put in pending_jobs and not waited for, otherwise this waits until every
+        month has been analysed and stored
+        """
+        self.pending_jobs = []
+        job_queue = get_job_queue()
+        if background:
+            self.pending_jobs = [job_queue.submit(file_month, file_year, self.analyse_month_if_missing)
+                                 for file_month, file_year in months_to_analyse]
             return
-        already_stored, month_dataframe = self.database.use_database_storage(file_month, file_year)
-        if already_stored is True:
-            self.final_dataframe = self.final_dataframe.append(month_dataframe, ignore_index=True)
+        # the time spent analysing still counts towards the request waiting for it
+        analyse = with_request_context(self.analyse_month_if_missing)
+        jobs = [job_queue.submit(file_month, file_year, analyse) for file_month, file_year in months_to_analyse]
+        for job in jobs:
+            job.wait()
+
+    @timed("query_months")
+    def query_months(self, no_of_months, background=False, **filters):
+        """
+        Gets the data for the most recent no_of_months months filtered, cut down to the columns needed and paginated by
+        the database, rather than reading every row and column into final_dataframe. Months that are missing are
+        analysed first in the same way as process_months.
+
+        :param no_of_months: Number of months of data to retrieve, starting from the latest month data is available for.
+        :param background: If True missing months are queued to be analysed in the background and left out of the result
+        :param filters: Filters passed on to Database.query_feedback
+        :return: tuple in the form (Dataframe, int) holding the rows retrieved and the ID the next page starts after
+        """
+        required_months = self.find_required_months(no_of_months)
+        missing_months = self.database.find_missing_months(required_months)
+        self.analyse_missing_months([month for month in required_months if month in missing_months], background)
+        if background:
+            required_months = [month for month in required_months if month not in missing_months]
+        return self.database.query_feedback(required_months, **filters)
+
+    def summarise(self, grouping):
+        """
+        Summarises final_dataframe by clinic, month or both so dashboards can be sent a few rows of statistics rather than
+        every comment. Each group is given its number of comments, number of positive and negative comments, the ratio of
+        positive comments and the mean, median, 10th and 90th percentile of the sentiment scores.
+
+        :param grouping: "clinic", "month" or "clinicmonth", the key of summary_groupings to group the data by
+        :return: Dataframe holding a row for each group, in order of the grouping columns
+        """
+        if grouping not in summary_groupings:
+            raise RuntimeError("Unknown summary grouping " + grouping)
+        group_columns = summary_groupings[grouping]
+        summary_columns = group_columns + ["Comments", "Positive", "Negative", "Positive_Ratio", "Mean_Score",
+                                           "Median_Score", "P10_Score", "P90_Score"]
+        if len(self.final_dataframe.index) == 0:
+            return pd.DataFrame(columns=summary_columns)
+
+        dataframe = self.final_dataframe.assign(
+            Positive=(self.final_dataframe["Pos or Neg"] == "Positive").astype("int32"),
+            Negative=(self.final_dataframe["Pos or Neg"] == "Negative").astype("int32"),
+            Sentiment_Score=self.final_dataframe["Sentiment_Score"].astype("float64"))
+        groups = dataframe.groupby(group_columns, observed=True, sort=True)
+        summary = groups.agg(Comments=("Sentiment_Score", "size"), Positive=("Positive", "sum"),
+                             Negative=("Negative", "sum"), Mean_Score=("Sentiment_Score", "mean"),
+                             Median_Score=("Sentiment_Score", "median"))
+        quantiles = groups["Sentiment_Score"].quantile([0.1, 0.9]).unstack()
+        summary["P10_Score"] = quantiles[0.1]
+        summary["P90_Score"] = quantiles[0.9]
+        summary["Positive_Ratio"] = summary["Positive"] / summary["Comments"]
+        # scores are only given to 4 decimal places so the statistics are not given to more
+        summary = summary.round({"Positive_Ratio": 4, "Mean_Score": 4, "Median_Score": 4, "P10_Score": 4,
+                                 "P90_Score": 4}).reset_index()
+        summary[group_columns] = summary[group_columns].astype(object)
+        return summary[summary_columns]
+
+    def combine_month_dataframes(self, month_dataframes):
+        """
+        Combines several months worth of data into final_dataframe with a single concatenation, rather than appending
+        one month at a time which copies all of the data gathered so far for every month added. Columns are then given
+        compact types.
+
+        :param month_dataframes: List of dataframes to be combined, in the order they should appear in final_dataframe
+        """
+        month_dataframes = [month_dataframe for month_dataframe in month_dataframes if len(month_dataframe.index) != 0]
+        if len(month_dataframes) == 0:
             return
+        final_dataframe = pd.concat(month_dataframes, ignore_index=True)
+        self.final_dataframe = final_dataframe.astype(
+            {column: column_type for column, column_type in column_types.items() if column in final_dataframe.columns})
+
+    def analyse_month_if_missing(self, file_month, file_year, progress=None):
+        """
+        Analyses a specific months worth of data unless it has already been stored in the database, for example by a
+        job that finished after the month was found to be missing.
+
+        :param file_month: Int representing month to analyse
+        :param file_year: Int representing year to analyse
+        :param progress: Optional function called with the number of comments scored so far and the total
+        """
+        if (file_month, file_year) in self.database.find_missing_months([(file_month, file_year)]):
+            self.analyse_month(file_month, file_year, progress)
+
+    @timed("reanalyse_month")
+    def reanalyse_month(self, file_month, file_year, progress=None):
+        """
+        Analyses a specific months worth of data again after its files in Azure storage have changed. Rather than
+        deleting and scoring the whole month again, the rows in the files are matched with the rows already stored using
+        a fingerprint of each row. Only rows that are new are scored and added, and rows that are no longer in the files
+        are deleted, all in a single transaction. A row that appears several times is matched as many times as it
+        appears. A month that has not been stored yet is analysed in full in the same way.
+
+        :param file_month: Int representing month to analyse
+        :param file_year: Int representing year to analyse
+        :param progress: Optional function called with the number of comments scored so far and the total
+        :return: tuple in the form (int, int) holding the number of rows added and removed
+        """
+        analysed_files = self.find_analysed_files(file_month, file_year)
+        month_dataframe = self.read_month(file_month, file_year)
+        # only rows that can be scored are ever stored so the rest are not compared
+        month_dataframe = month_dataframe.loc[self.find_scorable_comments(month_dataframe).index]
+        stored_dataframe = self.database.get_month_rows(file_month, file_year)
+
+        # the nth copy of a row in the files is matched with the nth copy of the same row in the database
+        new_fingerprints = fingerprint_rows(month_dataframe)
+        new_keys = list(zip(new_fingerprints, month_dataframe.groupby(new_fingerprints).cumcount()))
+        stored_fingerprints = fingerprint_rows(stored_dataframe)
+        stored_keys = list(zip(stored_fingerprints, stored_dataframe.groupby(stored_fingerprints).cumcount()))
+
+        stored_key_set = set(stored_keys)
+        new_key_set = set(new_keys)
+        added_dataframe = month_dataframe[[key not in stored_key_set for key in new_keys]]
+        removed_ids = [int(row_id) for row_id, key in zip(stored_dataframe["ID"], stored_keys)
+                       if key not in new_key_set]
+
+        added_dataframe = self.score_month_dataframe(added_dataframe.reset_index(drop=True), progress)
+        self.database.update_month(added_dataframe, removed_ids, analysed_files)
+        return len(added_dataframe.index), len(removed_ids)
+
+    @timed("analyse_month")
+    def analyse_month(self, file_month, file_year, progress=None):
+        """
+        Analyses a specific months worth of data stored in Azure storage. Acts as a control method and mainly calls other
+        methods in a required order to get the analysed data for the required month.
+
+        :param file_month: Int representing month to analyse
+        :param file_year: Int representing year to analyse
+        :param progress: Optional function called with the number of comments scored so far and the total
+        :return: Dataframe containing the analysed data for the month.
+        """
+        analysed_files = self.find_analysed_files(file_month, file_year)
+        return self.finalise_data_frame(self.read_month(file_month, file_year), progress, analysed_files)
+
+    def find_analysed_files(self, file_month, file_year):
+        """
+        Finds the ETags of the files a month is about to be analysed from, so they can be stored with the month. They
+        are taken from the blob index before the files are read, so a file that changes while it is being read is found
+        to have changed and analysed again rather than missed.
+
+        :param file_month: Int representing month to analyse
+        :param file_year: Int representing year to analyse
+        :return: tuple in the form (month, year, positive etag, negative etag), None if the ETag of either file is not
+        known
+        """
+        positive_file = self.azure_storage.blob_index.get(("Positive", file_year, file_month))
+        negative_file = self.azure_storage.blob_index.get(("Negative", file_year, file_month))
+        if positive_file is None or negative_file is None or None in (positive_file["etag"], negative_file["etag"]):
+            return None
+        return file_month, file_year, positive_file["etag"], negative_file["etag"]
+
+    def read_month(self, file_month, file_year):
+        """
+        Downloads the files holding a specific months worth of data and combines them into one dataframe.
+
+        :param file_month: Int representing month to read
+        :param file_year: Int representing year to read
+        :return: Dataframe containing the comments for the month, not yet scored
+        """
         blob_name_neg, blob_name_pos = self.set_blob_names(file_month, file_year)
-        self.azure_storage.get_data_from_azure(blob_name_neg, blob_name_pos)
-        negative_dataframe, positive_dataframe = self.azure_storage.load_data_into_pandas_dataframe()
-        self.clean_up_dataframe(len(negative_dataframe.columns), len(positive_dataframe.columns), negative_dataframe,
-                                positive_dataframe)
-        negative, positive = self.populate_pos_neg_lists(len(negative_dataframe.index), len(positive_dataframe.index))
-        self.finalise_data_frame(negative, positive, file_month, file_year, negative_dataframe, positive_dataframe)
+        negative_dataframe, positive_dataframe = self.azure_storage.get_month_dataframes(blob_name_neg, blob_name_pos)
+        return self.prepare_month_dataframe(file_month, file_year, negative_dataframe, positive_dataframe)
 
     def set_blob_names(self, file_month, file_year):
         """
@@ -69,11 +307,10 @@ class DataForMultipleMonths():
         year = datetime.now().year % 100
         # looks for data within the past year, if not found stops searching
         for iteration in range(12):
-            for name in self.azure_storage.blob_data_names:
-                if months[month] in name and str(year) in name:
-                    self.latest_month = month
-                    self.latest_year = year
-                    return
+            if self.azure_storage.has_data(month, year):
+                self.latest_month = month
+                self.latest_year = year
+                return
             if month == 1:
                 month = 12
                 year -= 1
@@ -120,97 +357,84 @@ class DataForMultipleMonths():
                 file_month -= 1
 
         # check if an excel file containing data for the month exists in azure storage
-        if "Positive Comments - " + months[file_month] + " " + str(file_year) + ".xlsx" in self.azure_storage.blob_data_names:
+        if self.azure_storage.has_data(file_month, file_year, "Positive"):
             return file_month, file_year
         else:
             return None, None
 
-    def clean_up_dataframe(self, neg_cols, pos_cols, negative_dataframe, positive_dataframe):
+    @timed("prepare_month")
+    def prepare_month_dataframe(self, file_month, file_year, negative_dataframe, positive_dataframe):
         """
-        Removes any empty rows or columns in the database.
+        Combines the files holding the positive and negative comments for a month into one dataframe. Any columns other
+        than CLINIC, RESPONSE and COMMENTS and any completely empty rows are removed, missing clinics are replaced with 0s
+        so they can be filtered and dealt with later on, and every row is labelled with whether it is a positive or
+        negative comment and the month and year it is for. The labels are set for the whole column at once rather than
+        row by row.
 
-        :param neg_cols: Number of columns in the negative comments dataframe
-        :param pos_cols: Number of columns in the positive comments dataframe
-        :param negative_dataframe: Dataframe containing the negative comments
-        :param positive_dataframe: Dataframe containing the positive comments
+        :param file_month: Month for which data is being collected
+        :param file_year: Year for which data is being collected
+        :param negative_dataframe: Dataframe containing negative comments
+        :param positive_dataframe: Dataframe containing positive comments
+        :return: Dataframe containing the comments for the month, not yet scored
         """
-        if pos_cols > 3:
-            positive_dataframe.drop(positive_dataframe.columns[3], axis=1, inplace=True)
-        positive_dataframe.dropna(axis=0, how='all', inplace=True)
-        if neg_cols > 3:
-            negative_dataframe.drop(negative_dataframe.columns[3], axis=1, inplace=True)
-        negative_dataframe.dropna(axis=0, how='all', inplace=True)
-
-        # replaces NaN values in the Clinic field with 0s so they can be filtered and dealt with later on.
-        positive_dataframe['CLINIC'].fillna(0, inplace=True)
-        positive_dataframe['CLINIC'].fillna(0, inplace=True)
-
-    def populate_pos_neg_lists(self, neg_len, pos_len):
+        dataframes = [dataframe.reindex(columns=list(workbook_columns)).dropna(axis=0, how='all')
+                      for dataframe in [positive_dataframe, negative_dataframe]]
+        temp = pd.concat(dataframes, ignore_index=True)
+        temp["CLINIC"] = temp["CLINIC"].fillna(0)
+        temp["Pos or Neg"] = pd.Categorical.from_codes(
+            np.repeat(np.arange(len(sentiment_labels)), [len(dataframe.index) for dataframe in dataframes]),
+            categories=sentiment_labels)
+        temp["Month"] = file_month
+        temp["Year"] = file_year
+        metrics.add_rows("prepare_month", len(temp.index))
+        return temp
+
+    def finalise_data_frame(self, temp, progress=None, analysed_files=None):
         """
-        Creates two lists to be appended to the two dataframes containing positive and negative comments so they can be
-        distinguished when later combined into one dataframe.
+        Scores the comments for a month and stores the result in the database.
 
-        :param neg_len: Number of rows in the negative dataframe
-        :param pos_len: Number of rows in the positive dataframe
-        :return: lists containing the matching number of instances of either "Positive" or "Negative" depending on which
-        dataframe they are intended for.
+        :param temp: Dataframe containing the comments for the month, as given by prepare_month_dataframe
+        :param progress: Optional function called with the number of comments scored so far and the total
+        :param analysed_files: Optional tuple given by find_analysed_files, stored with the month
+        :return: Dataframe containing the analysed data for the month
         """
-        positive = []
-        negative = []
-
-        for row in range(neg_len):
-            negative.append("Negative")
-
-        for row in range(pos_len):
-            positive.append("Positive")
+        temp = self.score_month_dataframe(temp, progress)
 
-        return negative, positive
+        # if we are in this method then we were not able to use data from the database, hence store it for future use
+        self.database.insert_data(temp, analysed_files)
+        return temp
 
-    def populate_month_year_lists(self, length, file_month, file_year):
+    def find_scorable_comments(self, temp):
         """
-        Creates two lists containing the month and year for which the data just obtained is for.
-        Used to create two new columns in dataframe representing the months combined positive and negative responses.
+        Finds the rows of a dataframe that can be scored, leaving out rows without a clinic and rows whose comment is
+        missing or only whitespace. Comments are normalised the same way as in the sentiment cache so that comments
+        differing only in case or whitespace are treated as the same comment.
 
-        :param length: length of the dataframe the lists are to e appended to
-        :param file_month: Name of month for the current data
-        :param file_year: Name of year for the current data
-        :return: lists containing the month and year with lengths matching the dataframe they are to be added to
+        :param temp: Dataframe containing comments
+        :return: Series holding the normalised comment of each row that can be scored, with the same index as temp
         """
-        month = []
-        year = []
-
-        for row in range(length):
-            month.append(file_month)
-            year.append(file_year)
+        normalised = temp["COMMENTS"].map(
+            lambda comment: normalise_comment(comment) if isinstance(comment, str) else np.nan)
+        return normalised[(temp.CLINIC != 0) & normalised.notna() & (normalised != "")]
 
-        return month, year
-
-    def finalise_data_frame(self, negative, positive, file_month, file_year, negative_dataframe, positive_dataframe):
+    @timed("score_month")
+    def score_month_dataframe(self, temp, progress=None):
         """
-        Merges the dataframe for positive and negative comments into one dataframe. Then appends that dataframe onto the
-        final_dataframe to be returned by the api.
+        Scores the comments in a dataframe, dropping comments without a clinic or without any text before scoring and
+        comments that could not be scored afterwards. Each distinct comment is only scored once, its score is then given
+        to every row with the same comment.
 
-        :param negative: list containing "Negative" with correct length to match the negative_dataframe
-        :param positive: list containing "Positive" with correct length to match the positive_dataframe
-        :param file_month: Month for which data is being collected
-        :param file_year: Year for which data is being collected
-        :param negative_dataframe: Dataframe containing negative comments
-        :param positive_dataframe: Dataframe containing positive comments
+        :param temp: Dataframe containing comments
+        :param progress: Optional function called with the number of distinct comments scored so far and the total
+        :return: Dataframe containing the scored comments
         """
-
-        positive_dataframe["Pos or Neg"] = positive
-        negative_dataframe["Pos or Neg"] = negative
-        temp = positive_dataframe.append(negative_dataframe, ignore_index=True)
-        month, year = self.populate_month_year_lists(len(temp.index), file_month, file_year)
-        temp["Month"] = month
-        temp["Year"] = year
-        scores_for_comments = self.text_analytics.calculate_sentiment_scores(temp["COMMENTS"])
-        temp["Sentiment_Score"] = pd.Series(scores_for_comments)
-        temp = temp.dropna(subset=["Sentiment_Score"])
-
-        # deal with entries that do not specify a clinic name
-        temp = temp[temp.CLINIC != 0]
-
-        # if we are in this method then we were not able to use data from the database, hence store it for future use
-        self.database.insert_data(temp)
-        self.final_dataframe = self.final_dataframe.append(temp, ignore_index=True)
+        normalised = self.find_scorable_comments(temp)
+        temp = temp.loc[normalised.index]
+        first_occurrences = ~normalised.duplicated()
+        scores_for_comments = self.text_analytics.calculate_sentiment_scores(temp["COMMENTS"][first_occurrences],
+                                                                             progress)
+        metrics.add_rows("score_month", len(temp.index))
+
+        scores = pd.Series(scores_for_comments, index=normalised[first_occurrences].values, dtype=object)
+        temp = temp.assign(Sentiment_Score=normalised.map(scores))
+        return temp.dropna(subset=["Sentiment_Score"])
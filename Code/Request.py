@@ -1,3 +1,4 @@
+import io
 import pandas as pd
 import requests
 from requests.auth import HTTPBasicAuth
@@ -10,6 +11,42 @@ BI (or any other visualisation tool that you wish to use) in order to make reque
 visualisation tool.
 """
 
+
+def get_feedback(url, username, password, response_format="parquet", params=None):
+    """
+    Requests data from the API in the given format and loads it into a pandas DataFrame. Parquet and Arrow are read
+    straight into columns with their types kept, so there is no JSON to parse and clinics stay categorical. pyarrow is
+    only needed for those two formats.
+
+    :param url: URL of the endpoint to request data from
+    :param username: Username for the API
+    :param password: Password for the API
+    :param response_format: "parquet", "arrow", "csv", "ndjson" or "json"
+    :param params: Optional dictionary of other URL parameters, such as columns or clinic
+    :return: DataFrame holding the data. If some months are still being analysed only the months that are ready are
+    included and a message is printed.
+    """
+    params = dict(params or {}, format=response_format)
+    response = requests.get(url, params=params, auth=HTTPBasicAuth(username, password))
+    response.raise_for_status()
+    if response.status_code == 202:
+        print("Some months are still being analysed, try again later for the full data")
+
+    if response_format in ["parquet", "arrow"]:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        if response_format == "parquet":
+            return pyarrow.parquet.read_table(pyarrow.BufferReader(response.content)).to_pandas()
+        return pyarrow.ipc.open_stream(response.content).read_pandas()
+    if response_format == "csv":
+        return pd.read_csv(io.BytesIO(response.content))
+    if response_format == "ndjson":
+        return pd.read_json(io.BytesIO(response.content), lines=True)
+    content = response.json()
+    return pd.read_json(content["data"] if response.status_code == 202 else content)
+
+
 """
 This is an example request for retrieving the last 12 months of data from Azure where it's stored.
 In this example the JSON from the API is then converted into a pandas DataFrame.
@@ -20,6 +57,13 @@ JSONContent = requests.get("http://127.0.0.1:5000/psat/pastyear", auth=HTTPBasic
 feedback = pd.read_json(JSONContent)
 print(feedback)
 
+"""
+This is an example request for retrieving the last 12 months of data as Parquet, which is much quicker to send and load
+than JSON for large amounts of data. Requires pyarrow to be installed.
+"""
+# feedback = get_feedback("http://127.0.0.1:5000/psat/pastyear/", 'your_chosen_username', 'your_chosen_password')
+# print(feedback)
+
 """
 This is an example request to retrieve a specific months worth of data.
 In this case it is retrieving data for January 2019.
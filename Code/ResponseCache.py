@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+import hashlib
+import json
+import threading
+import time
+
+"""
+NOTE:
+
+Each process serving the API has its own ResponseCache and invalidate() only empties the cache of the process that
+changed the data. When the API is served by several worker processes, or the data is changed by another process such
+as PreAnalysis.py, the other processes keep serving their cached responses until they expire. Set "response_cache_ttl"
+in config.json to the longest time clients can be allowed to see data from before a change.
+"""
+
+
+class CachedResponse():
+    """
+    This class holds the body of a response along with the validators clients can use to check whether the copy they
+    already have is still up to date.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body if isinstance(body, bytes) else body.encode("utf-8")).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.created = time.monotonic()
+
+
+class ResponseCache():
+    """
+    This class encapsulates all the code that deals with keeping the responses of the API in memory, so requests for
+    data that has not changed do not have to be rebuilt from the database and Azure storage every time. Responses
+    expire after a time to live and are all thrown away whenever this process changes the data in the database.
+    """
+
+    def __init__(self):
+        with open('config.json') as config_file:
+            data = json.load(config_file)
+            # seconds a response is kept, this also limits how long other processes serve data that has changed
+            self.ttl = data.get("response_cache_ttl", 300)
+            self.max_size = data.get("response_cache_size", 64)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # increased on every invalidation so responses built from data that has since changed are never stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Gets a response from the cache if it is present and has not expired.
+
+        :param key: Tuple identifying the response, made up of the endpoint, the window of months and the latest month
+        :return: The CachedResponse stored under the key, None if there is no valid response stored
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, generation):
+        """
+        Stores a response in the cache, removing the least recently used response if the cache is full. The response is
+        not stored if the cache was invalidated while it was being built.
+
+        :param key: Tuple identifying the response
+        :param body: Body of the response
+        :param generation: Value of generation when the response started being built
+        :return: CachedResponse holding the body and its validators
+        """
+        entry = CachedResponse(body)
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def statistics(self):
+        """
+        Gives the number of requests answered from the cache and the number that had to be built.
+
+        :return: Dictionary containing the hits and misses of the cache
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def invalidate(self):
+        """
+        Removes every response from the cache. Called whenever data is written to or deleted from the database.
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+
+response_cache = None
+response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Gets the response cache shared by every request made to the API, creating it the first time it is needed.
+
+    :return: The ResponseCache used by the whole process
+    """
+    global response_cache
+    with response_cache_lock:
+        if response_cache is None:
+            response_cache = ResponseCache()
+        return response_cache
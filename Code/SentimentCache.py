@@ -0,0 +1,168 @@
+from collections import OrderedDict
+import hashlib
+import json
+import sqlite3
+import threading
+
+
+def normalise_comment(comment):
+    """
+    Normalises a comment so that comments differing only in case or whitespace are treated as the same comment.
+
+    :param comment: Comment to be normalised
+    :return: The comment in lower case with surrounding whitespace removed and inner whitespace collapsed
+    """
+    return " ".join(comment.split()).casefold()
+
+
+def make_cache_key(comment, model_version):
+    """
+    Creates the key a comment's score is stored under. The model version is part of the key so scores produced by an
+    older model are never returned once the model changes.
+
+    :param comment: Comment the score is for
+    :param model_version: Version of the model that produced the score
+    :return: Hex digest of the SHA-256 hash of the model version and normalised comment
+    """
+    content = model_version + "\n" + normalise_comment(comment)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class SentimentScoreCache():
+    """
+    This class encapsulates all the code that deals with storing sentiment scores locally so that comments that have
+    already been scored are not sent to the Text Analytics API again. Scores are kept in a SQLite file with a bounded
+    in memory LRU cache in front of it.
+    """
+
+    def __init__(self):
+        with open('config.json') as config_file:
+            data = json.load(config_file)
+            self.path = data.get("sentiment_cache_path", "sentiment_cache.db")
+            self.max_size = data.get("sentiment_cache_size", 10000)
+        self.memory_cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.db_connection = None
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        Opens the SQLite file holding the scores, creating the table if it does not already exist. Only done the first
+        time the cache is used.
+        """
+        if self.db_connection is None:
+            self.db_connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.db_connection.execute(
+                "CREATE TABLE IF NOT EXISTS sentiment_scores(CacheKey TEXT NOT NULL, Sentiment_Score REAL NOT NULL, PRIMARY KEY (CacheKey))")
+            self.db_connection.commit()
+
+    def remember(self, key, score):
+        """
+        Adds a score to the in memory cache, removing the least recently used score if the cache is full.
+
+        :param key: Key created by make_cache_key
+        :param score: Score for the comment
+        """
+        self.memory_cache[key] = score
+        self.memory_cache.move_to_end(key)
+        if len(self.memory_cache) > self.max_size:
+            self.memory_cache.popitem(last=False)
+
+    def get_scores(self, comments, model_version):
+        """
+        Looks up the scores for a list of comments, first in memory and then in the SQLite file.
+
+        :param comments: List of comments to find scores for
+        :param model_version: Version of the model the scores must have been produced by
+        :return: List of scores matching the order of comments, None is given for comments that have not been scored
+        """
+        keys = [make_cache_key(comment, model_version) if isinstance(comment, str) else None for comment in comments]
+        scores = [None] * len(comments)
+
+        with self.lock:
+            stored_keys = []
+            for index, key in enumerate(keys):
+                if key in self.memory_cache:
+                    self.memory_cache.move_to_end(key)
+                    scores[index] = self.memory_cache[key]
+                elif key is not None:
+                    stored_keys.append(key)
+
+            if len(stored_keys) != 0:
+                self.connect()
+                stored_scores = {}
+                unique_keys = list(set(stored_keys))
+                # SQLite limits the number of parameters a single query can have
+                for start in range(0, len(unique_keys), 500):
+                    chunk = unique_keys[start:start + 500]
+                    sql_formula = "SELECT CacheKey, Sentiment_Score FROM sentiment_scores WHERE CacheKey IN (" + \
+                                  ", ".join(["?"] * len(chunk)) + ")"
+                    stored_scores.update(self.db_connection.execute(sql_formula, chunk).fetchall())
+                for key, score in stored_scores.items():
+                    self.remember(key, "{:.4f}".format(score))
+                for index, key in enumerate(keys):
+                    if scores[index] is None and key in stored_scores:
+                        scores[index] = "{:.4f}".format(stored_scores[key])
+
+            for index, key in enumerate(keys):
+                if key is None:
+                    continue
+                if scores[index] is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+
+        return scores
+
+    def store_scores(self, comments, scores, model_version):
+        """
+        Stores newly calculated scores both in memory and in the SQLite file.
+
+        :param comments: List of comments that were scored
+        :param scores: List of scores matching the order of comments, comments with a score of None are not stored
+        :param model_version: Version of the model that produced the scores
+        """
+        rows = []
+        with self.lock:
+            for comment, score in zip(comments, scores):
+                if score is None or not isinstance(comment, str):
+                    continue
+                key = make_cache_key(comment, model_version)
+                self.remember(key, score)
+                rows.append((key, float(score)))
+
+            if len(rows) != 0:
+                self.connect()
+                self.db_connection.executemany(
+                    "INSERT OR REPLACE INTO sentiment_scores (CacheKey, Sentiment_Score) VALUES (?, ?)", rows)
+                self.db_connection.commit()
+
+    def statistics(self):
+        """
+        Gives the number of lookups served by the cache and the number that had to be scored.
+
+        :return: Dictionary containing the hits, misses and hit rate of the cache
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            hit_rate = self.hits / lookups if lookups != 0 else 0.0
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate, "size": len(self.memory_cache)}
+
+
+shared_cache = None
+shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """
+    Gets the cache shared by every request made to the API, creating it the first time it is needed so that scores held
+    in memory are kept between requests.
+
+    :return: The SentimentScoreCache used by the whole process
+    """
+    global shared_cache
+    with shared_cache_lock:
+        if shared_cache is None:
+            shared_cache = SentimentScoreCache()
+        return shared_cache
@@ -0,0 +1,106 @@
+import unittest
+import threading
+import AnalysisJobs
+
+
+class AnalysisJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates an AnalysisJobQueue object before every test to be used in the tests.
+        """
+        self.job_queue = AnalysisJobs.AnalysisJobQueue()
+
+    def tearDown(self):
+        self.job_queue.executor.shutdown(wait=True)
+
+    def test_same_month_shares_job(self):
+        """
+        Checks to see that a month that is already being analysed is not queued again and that a new job can be queued
+        for the month once the first has finished.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def analyse(month, year, progress):
+            calls.append((month, year))
+            started.set()
+            release.wait(5)
+
+        job = self.job_queue.submit(1, 20, analyse)
+        started.wait(5)
+        repeated_job = self.job_queue.submit(1, 20, analyse)
+        other_job = self.job_queue.submit(12, 19, analyse)
+        release.set()
+        self.job_queue.executor.shutdown(wait=True)
+
+        self.assertIs(repeated_job, job)
+        self.assertIsNot(other_job, job)
+        self.assertEqual(sorted(calls), [(1, 20), (12, 19)])
+        self.assertEqual(job.status, "complete")
+        self.assertIs(self.job_queue.get_job(job.job_id), job)
+
+    def test_different_kinds_run_in_order(self):
+        """
+        Checks to see that a re-analysis submitted while a month is being analysed gets its own job, which runs once the
+        analysis has finished, and that a re-analysis waiting to run is shared.
+        """
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def analyse(month, year, progress):
+            calls.append("analyse")
+            started.set()
+            release.wait(5)
+
+        def reanalyse(month, year, progress):
+            calls.append("reanalyse")
+
+        job = self.job_queue.submit(1, 20, analyse)
+        started.wait(5)
+        reanalyse_job = self.job_queue.submit(1, 20, reanalyse, "reanalyse")
+        repeated_reanalyse_job = self.job_queue.submit(1, 20, reanalyse, "reanalyse")
+        self.assertEqual(reanalyse_job.status, "queued")
+        release.set()
+        self.job_queue.executor.shutdown(wait=True)
+
+        self.assertIsNot(reanalyse_job, job)
+        self.assertIs(repeated_reanalyse_job, reanalyse_job)
+        self.assertEqual(reanalyse_job.to_dict()["kind"], "reanalyse")
+        self.assertEqual(calls, ["analyse", "reanalyse"])
+        self.assertEqual(reanalyse_job.status, "complete")
+        self.assertEqual(self.job_queue.active_jobs, {})
+
+    def test_progress_reported(self):
+        """
+        Checks to see that the progress reported while a month is analysed is recorded against its job.
+        """
+        def analyse(month, year, progress):
+            progress(10, 40)
+            progress(40, 40)
+
+        job = self.job_queue.submit(1, 20, analyse)
+        self.job_queue.executor.shutdown(wait=True)
+
+        self.assertEqual(job.to_dict()["comments_scored"], 40)
+        self.assertEqual(job.to_dict()["comments_total"], 40)
+
+    def test_failed_job_recorded(self):
+        """
+        Checks to see that a job that raises an error is marked as failed along with the reason, and that finished jobs
+        are forgotten once they are older than the retention period.
+        """
+        def analyse(month, year, progress):
+            raise RuntimeError("Workbook could not be read")
+
+        job = self.job_queue.submit(1, 20, analyse)
+        self.job_queue.executor.shutdown(wait=True)
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.error, "Workbook could not be read")
+
+        self.job_queue.retention = -1
+        with self.job_queue.lock:
+            self.job_queue.remove_finished_jobs()
+        self.assertEqual(self.job_queue.get_job(job.job_id), None)
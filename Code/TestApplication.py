@@ -1,21 +1,30 @@
 import unittest
+import base64
 import json
+import threading
+from unittest import mock
+import pandas as pd
 import application as PSAT
 from application import app
+from AnalysisJobs import AnalysisJobQueue
+from TestFixtures import TemporaryStorageMixin
 
 
-class PSATTest(unittest.TestCase):
+class PSATTest(TemporaryStorageMixin, unittest.TestCase):
 
     def setUp(self):
         """
         Configures the Flask code to allow it to be tested. Creates a client for the Flask app allowing for HTTP requests
-        such as GET to be made.
+        such as GET to be made. The shared sentiment and parsed workbook caches are kept in a temporary directory.
         """
         app.config['TESTING'] = True
         app.config['WTF_CSRF_ENABLED'] = False
         app.config['DEBUG'] = False
         self.client = app.test_client()
 
+        self.use_temporary_directory()
+        self.use_temporary_caches()
+
     def test_successful_authentication(self):
         """
         Checks to see if given the correct credentials login succeeds
@@ -45,3 +54,248 @@ class PSATTest(unittest.TestCase):
         """
         response = self.client.get("/psat/specificmonth/")
         self.assertEqual(response.status_code, 403)
+
+    def test_unchanged_data_not_sent_again(self):
+        """
+        Checks to see that a repeated request for the past years worth of data is served from the response cache, and
+        that a client sending back the ETag it was given gets a 304 response with no body. Months that have not been
+        analysed are analysed before responding as the client did not ask for a response to be sent straight away.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+        PSAT.get_response_cache().invalidate()
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "prepare_database"), \
+                mock.patch.object(PSAT, "DataForMultipleMonths") as data_for_multiple_months:
+            data_for_multiple_months.return_value.latest_month = 1
+            data_for_multiple_months.return_value.latest_year = 20
+            data_for_multiple_months.return_value.final_dataframe = pd.DataFrame({"CLINIC": ["TestClinicOne"]})
+            data_for_multiple_months.return_value.pending_jobs = []
+
+            response = self.client.get("/psat/pastyear/", headers=headers)
+            headers["If-None-Match"] = response.headers["ETag"]
+            repeated_response = self.client.get("/psat/pastyear/", headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(repeated_response.status_code, 304)
+        self.assertEqual(repeated_response.data, b"")
+        data_for_multiple_months.return_value.process_months.assert_called_once_with(12, background=False)
+
+    def test_metrics_in_prometheus_format(self):
+        """
+        Checks to see that the metrics endpoint requires credentials and gives the stage timings and cache hit rates in
+        the Prometheus text format.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+        PSAT.metrics.observe("serialise", 0.01)
+
+        unauthorised_response = self.client.get("/psat/metrics")
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"):
+            response = self.client.get("/psat/metrics", headers=headers)
+
+        self.assertEqual(unauthorised_response.status_code, 403)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        self.assertIn(b'psat_stage_duration_seconds_count{stage="serialise"}', response.data)
+        self.assertIn(b'psat_cache_hits_total{cache="response"}', response.data)
+
+    def test_unanalysed_months_return_job(self):
+        """
+        Checks to see that a client asking for a response straight away, using a Prefer header of respond-async, has
+        missing months analysed in the background and gets a 202 response holding the months that are ready and a job
+        whose progress can then be looked up, and that the response is not cached.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode(),
+                   "Prefer": "respond-async"}
+        PSAT.get_response_cache().invalidate()
+        job_queue = AnalysisJobQueue()
+        job = job_queue.submit(1, 20, lambda month, year, progress: progress(5, 10))
+        job_queue.executor.shutdown(wait=True)
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "get_job_queue", return_value=job_queue), \
+                mock.patch.object(PSAT, "prepare_database"), \
+                mock.patch.object(PSAT, "DataForMultipleMonths") as data_for_multiple_months:
+            data_for_multiple_months.return_value.latest_month = 1
+            data_for_multiple_months.return_value.latest_year = 20
+            data_for_multiple_months.return_value.final_dataframe = pd.DataFrame({"CLINIC": ["TestClinicOne"]})
+            data_for_multiple_months.return_value.pending_jobs = [job]
+
+            response = self.client.get("/psat/mostrecentmonths/2", headers=headers)
+            job_response = self.client.get(response.get_json()["jobs"][0]["url"], headers=headers)
+            missing_job_response = self.client.get("/psat/jobs/unknown", headers=headers)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertIn("TestClinicOne", response.get_json()["data"])
+        self.assertEqual(job_response.get_json()["status"], "complete")
+        self.assertEqual(job_response.get_json()["comments_scored"], 5)
+        self.assertEqual(missing_job_response.status_code, 404)
+        data_for_multiple_months.return_value.process_months.assert_called_once_with(2, background=True)
+        self.assertEqual(PSAT.get_response_cache().get(("range", 2, 1, 20, "json")), None)
+
+    def test_reanalysis_during_analysis_queued(self):
+        """
+        Checks to see that asking for a month to be analysed again while it is still being analysed queues a separate
+        re-analysis job, rather than being given the running job, and that the re-analysis runs once it has finished.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+        job_queue = AnalysisJobQueue()
+        started = threading.Event()
+        release = threading.Event()
+
+        def analyse(month, year, progress):
+            started.set()
+            release.wait(5)
+
+        job = job_queue.submit(1, 20, analyse)
+        started.wait(5)
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "get_job_queue", return_value=job_queue), \
+                mock.patch.object(PSAT, "prepare_database"), \
+                mock.patch.object(PSAT, "DataForMultipleMonths") as data_for_multiple_months:
+            data_for_multiple_months.return_value.azure_storage.has_data.return_value = True
+            response = self.client.put("/psat/specificmonth/?month=1&year=20", headers=headers)
+            reanalyse_month = data_for_multiple_months.return_value.reanalyse_month
+            reanalyse_month.assert_not_called()
+            release.set()
+            job_queue.executor.shutdown(wait=True)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.get_json()["job_id"], job.job_id)
+        self.assertEqual(response.get_json()["kind"], "reanalyse")
+        reanalyse_month.assert_called_once_with(1, 20, mock.ANY)
+        self.assertEqual(job_queue.get_job(response.get_json()["job_id"]).status, "complete")
+
+    def test_summary_by_clinic(self):
+        """
+        Checks to see that a summary can be requested by clinic and that an unknown grouping is rejected.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+        PSAT.get_response_cache().invalidate()
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "prepare_database"), \
+                mock.patch.object(PSAT, "DataForMultipleMonths") as data_for_multiple_months:
+            data_for_multiple_months.return_value.latest_month = 1
+            data_for_multiple_months.return_value.latest_year = 20
+            data_for_multiple_months.return_value.pending_jobs = []
+            data_for_multiple_months.return_value.summarise.return_value = pd.DataFrame(
+                {"CLINIC": ["TestClinicOne"], "Comments": [3]})
+
+            response = self.client.get("/psat/summary/clinic/6", headers=headers)
+            unknown_response = self.client.get("/psat/summary/response/6", headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(pd.read_json(response.get_json())["Comments"][0], 3)
+        data_for_multiple_months.return_value.process_months.assert_called_once_with(6, background=False)
+        data_for_multiple_months.return_value.summarise.assert_called_once_with("clinic")
+        self.assertEqual(unknown_response.status_code, 404)
+
+    def test_month_query_paged(self):
+        """
+        Checks to see that filters given as URL parameters are passed to the database and that a Link header pointing at
+        the next page is given when there are more rows.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "Database") as database:
+            database.return_value.query_feedback.return_value = (pd.DataFrame({"Sentiment_Score": [0.5]}), 42)
+            response = self.client.get("/psat/specificmonth/?month=1&year=20&columns=Sentiment_Score"
+                                       "&clinic=TestClinicOne&limit=1", headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        database.return_value.query_feedback.assert_called_once_with(
+            [(1, 20)], columns=["Sentiment_Score"], clinic="TestClinicOne", sentiment=None, min_score=None,
+            max_score=None, after_id=None, limit=1)
+        self.assertIn("after=42", response.headers["Link"])
+        self.assertIn('rel="next"', response.headers["Link"])
+
+    def test_scores_rounded_in_json(self):
+        """
+        Checks to see that sentiment scores held as float32 are sent in JSON with the digits they were stored with
+        rather than the extra digits float32 gains when widened.
+        """
+        dataframe = pd.DataFrame({"Sentiment_Score": [0.9352, 0.2364]}).astype({"Sentiment_Score": "float32"})
+
+        self.assertEqual(json.loads(PSAT.serialise(dataframe))["Sentiment_Score"], {"0": 0.9352, "1": 0.2364})
+        self.assertEqual(PSAT.serialise(dataframe, "ndjson"),
+                         b'{"Sentiment_Score":0.9352}\n{"Sentiment_Score":0.2364}\n')
+
+    def test_unavailable_database_returns_503(self):
+        """
+        Checks to see that a request made while the database cannot be reached is answered with a 503 so the client
+        knows to try again later.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.dict(app.config, {"PROPAGATE_EXCEPTIONS": False}), \
+                mock.patch.object(PSAT, "Database") as database:
+            database.return_value.use_database_storage.side_effect = PSAT.DatabaseUnavailableError(
+                "Unable to connect to the database.")
+            response = self.client.get("/psat/specificmonth/?month=1&year=20", headers=headers)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.data)["message"], "Database unavailable, please try again later")
+
+    def test_recent_months_streamed_as_ndjson(self):
+        """
+        Checks to see that asking for newline delimited JSON streams each chunk of rows read from the database as one
+        JSON object per line.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode(),
+                   "Accept": "application/x-ndjson"}
+        chunks = [pd.DataFrame({"CLINIC": ["TestClinicOne", "TestClinicTwo"], "Month": [2, 2]}),
+                  pd.DataFrame({"CLINIC": ["TestClinicOne"], "Month": [1]})]
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "prepare_database"), \
+                mock.patch.object(PSAT, "DataForMultipleMonths") as data_for_multiple_months:
+            data_for_multiple_months.return_value.pending_jobs = []
+            data_for_multiple_months.return_value.stream_months.return_value = iter(chunks)
+            response = self.client.get("/psat/mostrecentmonths/2?columns=CLINIC,Month", headers=headers)
+            lines = response.data.decode().splitlines()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"CLINIC": "TestClinicOne", "Month": 2}, {"CLINIC": "TestClinicTwo", "Month": 2},
+                          {"CLINIC": "TestClinicOne", "Month": 1}])
+        data_for_multiple_months.return_value.stream_months.assert_called_once_with(
+            2, background=False, columns=["CLINIC", "Month"], clinic=None, sentiment=None, min_score=None,
+            max_score=None)
+        data_for_multiple_months.return_value.process_months.assert_not_called()
+
+    @unittest.skipIf(PSAT.pyarrow is None, "pyarrow is not installed")
+    def test_month_sent_in_requested_format(self):
+        """
+        Checks to see that data can be asked for as CSV, Parquet or Arrow using the format URL parameter or the Accept
+        header, and that Parquet and Arrow keep the type of each column.
+        """
+        headers = {"Authorization": "Basic " + base64.b64encode(b"username:password").decode()}
+        month_dataframe = pd.DataFrame({"CLINIC": pd.Categorical(["TestClinicOne", "TestClinicOne"]),
+                                        "Month": pd.Series([1, 1], dtype="int8"),
+                                        "Sentiment_Score": pd.Series([0.25, 0.75], dtype="float32")})
+
+        with mock.patch.object(PSAT.auth, "get_password_callback", return_value="password"), \
+                mock.patch.object(PSAT, "Database") as database:
+            database.return_value.use_database_storage.return_value = (True, month_dataframe)
+            csv_response = self.client.get("/psat/specificmonth/?month=1&year=20&format=csv", headers=headers)
+            parquet_response = self.client.get("/psat/specificmonth/?month=1&year=20&format=parquet",
+                                               headers=headers)
+            arrow_response = self.client.get("/psat/specificmonth/?month=1&year=20", headers=dict(
+                headers, Accept="application/vnd.apache.arrow.stream"))
+            unknown_response = self.client.get("/psat/specificmonth/?month=1&year=20&format=xml", headers=headers)
+
+        self.assertEqual(csv_response.mimetype, "text/csv")
+        self.assertEqual(csv_response.data.decode().splitlines()[0], "CLINIC,Month,Sentiment_Score")
+        self.assertEqual(parquet_response.mimetype, "application/vnd.apache.parquet")
+        parquet_dataframe = PSAT.pyarrow.parquet.read_table(PSAT.pyarrow.BufferReader(parquet_response.data)).to_pandas()
+        arrow_dataframe = PSAT.pyarrow.ipc.open_stream(arrow_response.data).read_pandas()
+        for dataframe in [parquet_dataframe, arrow_dataframe]:
+            self.assertEqual(dataframe["CLINIC"].dtype, "category")
+            self.assertEqual(dataframe["Month"].dtype, "int8")
+            self.assertEqual(list(dataframe["Sentiment_Score"]), [0.25, 0.75])
+        self.assertEqual(unknown_response.status_code, 406)
@@ -1,5 +1,6 @@
 import unittest
 import warnings
+from unittest import mock
 import AzureBlobStorage as AzureStorage
 
 
@@ -30,3 +31,55 @@ class AzureBlobStorageTest(unittest.TestCase):
         """
 
         self.azure_storage.get_blob_data_names()
+
+    def test_data_loaded_from_memory(self):
+        """
+        Checks to see that the contents of a downloaded file can be parsed straight into a dataframe without being written
+        to a local file first, keeping only the columns used by the pipeline.
+        """
+
+        with open("../Excel/MockData/Negative Comments - January 20.xlsx", "rb") as negative_file:
+            negative_data = negative_file.read()
+
+        negative_dataframe = self.azure_storage.parse_workbook(negative_data)
+
+        self.assertEqual(list(negative_dataframe.columns), ["CLINIC", "RESPONSE", "COMMENTS"])
+        self.assertFalse(negative_dataframe.empty)
+
+    def test_blob_names_parsed(self):
+        """
+        Checks to see that the sentiment, year and month of a file are worked out from its name and that files with
+        names in a different format are ignored.
+        """
+
+        self.assertEqual(AzureStorage.parse_blob_name("Positive Comments - January 20.xlsx"), ("Positive", 20, 1))
+        self.assertEqual(AzureStorage.parse_blob_name("Negative Comments - December 19.xlsx"), ("Negative", 19, 12))
+        self.assertEqual(AzureStorage.parse_blob_name("Negative Comments - Smarch 19.xlsx"), None)
+        self.assertEqual(AzureStorage.parse_blob_name("notes.txt"), None)
+
+        self.azure_storage.set_blob_data_names(["Negative Comments - December 19.xlsx"])
+        self.assertTrue(self.azure_storage.has_data(12, 19))
+        self.assertTrue(self.azure_storage.has_data(12, 19, "Negative"))
+        self.assertFalse(self.azure_storage.has_data(12, 19, "Positive"))
+
+    def test_catalogue_refresh_finds_changes(self):
+        """
+        Checks to see that the catalogue is only fetched again once it has expired or is forced to, and that refreshing
+        reports which files were added, changed or removed.
+        """
+
+        catalogue = AzureStorage.BlobCatalogue(self.azure_storage.create_blob_service, "container", 60)
+        with mock.patch.object(catalogue, "list_blobs") as list_blobs:
+            list_blobs.return_value = [("Positive Comments - January 20.xlsx", "etag1", None),
+                                       ("Negative Comments - January 20.xlsx", "etag2", None)]
+            first_changes = catalogue.refresh()
+            list_blobs.return_value = [("Positive Comments - January 20.xlsx", "etag3", None),
+                                       ("Positive Comments - February 20.xlsx", "etag4", None)]
+            cached_changes = catalogue.refresh()
+            forced_changes = catalogue.refresh(force=True)
+
+        self.assertEqual(sorted(first_changes["added"]), [("Negative", 20, 1), ("Positive", 20, 1)])
+        self.assertEqual(cached_changes, {"added": [], "changed": [], "removed": []})
+        self.assertEqual(forced_changes, {"added": [("Positive", 20, 2)], "changed": [("Positive", 20, 1)],
+                                          "removed": [("Negative", 20, 1)]})
+        self.assertEqual(list_blobs.call_count, 2)
@@ -1,4 +1,6 @@
 import unittest
+import threading
+from unittest import mock
 import Database as Database
 import pandas as pd
 
@@ -20,14 +22,69 @@ class DatabaseTest(unittest.TestCase):
         self.assertNotEqual(db_connection, None)
         db_connection.close()
 
+    def test_unavailable_database_raises_error(self):
+        """
+        Checks to see that a clear error is raised when no connection can be borrowed from the pool, rather than None
+        being returned for the caller to fail on later.
+        """
+
+        with mock.patch.object(Database, "get_connection_pool") as get_connection_pool:
+            get_connection_pool.return_value.get_connection.side_effect = RuntimeError(
+                "Timed out waiting for a database connection")
+            with self.assertRaises(Database.DatabaseUnavailableError):
+                Database.connect_to_database()
+
+    def test_pooled_connection_returned_on_close(self):
+        """
+        Checks to see that closing a connection borrowed from the pool gives it back to the pool exactly once, even if
+        it is closed more than once, so the pool never hands out more connections than it holds.
+        """
+
+        available = threading.BoundedSemaphore(1)
+        available.acquire()
+        db_connection = mock.Mock()
+        pooled_connection = Database.PooledConnection(db_connection, available)
+
+        pooled_connection.cursor()
+        pooled_connection.close()
+        pooled_connection.close()
+
+        db_connection.cursor.assert_called_once_with()
+        db_connection.close.assert_called_once_with()
+        self.assertTrue(available.acquire(blocking=False))
+        self.assertFalse(available.acquire(blocking=False))
+
+    def test_insert_data_in_chunks(self):
+        """
+        Checks to see that rows are written in chunks of the configured size within a single transaction, with columns
+        taken by name whatever order they are in and missing values written as NULL.
+        """
+
+        df = pd.DataFrame({"Year": [999, 999, 999], "Month": [1, 1, 1], "CLINIC": ["TestClinicOne"] * 3,
+                           "COMMENTS": ["good", "bad", "fine"], "RESPONSE": ["Likely", None, "Unlikely"],
+                           "Pos or Neg": ["Positive", "Negative", "Negative"], "Sentiment_Score": [0.9, 0.1, 0.5]})
+        self.database.insert_chunk_size = 2
+
+        with mock.patch.object(Database, "connect_to_database") as connect_to_database:
+            self.database.insert_data(df)
+
+        db_connection = connect_to_database.return_value
+        chunks = [call[0][1] for call in db_connection.cursor.return_value.executemany.call_args_list]
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(chunks[0][1], ["TestClinicOne", "bad", 1, "Negative", None, 0.1, 999])
+        db_connection.commit.assert_called_once_with()
+
     def test_database_functions(self):
         """
         Test acts as a controller calling other helper methods to test specific database interactions in a specified
         order.
         """
 
+        self.database.create_table()
+        self.database.migrate_schema()
         self.insert_data()
         self.select_data()
+        self.select_data_for_months()
         self.delete_month()
         self.delete_year()
 
@@ -42,7 +99,8 @@ class DatabaseTest(unittest.TestCase):
                 ["TestClinicOne", "Unlikely", "service was bad", "Negative", 4, 999, 0.2364],
                 ["TestClinicOne", "Unlikely", "nurse couldn't find vein for blood test", "Negative", 4, 999, 0.1344]]
 
-        df = pd.DataFrame(data)
+        df = pd.DataFrame(data, columns=["CLINIC", "RESPONSE", "COMMENTS", "Pos or Neg", "Month", "Year",
+                                         "Sentiment_Score"])
 
         self.database.insert_data(df)
 
@@ -59,6 +117,17 @@ class DatabaseTest(unittest.TestCase):
         self.assertFalse(month_dataframe_one.empty)
         self.assertFalse(month_dataframe_two.empty)
 
+    def select_data_for_months(self):
+        """
+        Checks to see that data for several months can be retrieved with a single query and that months with no data in
+        the database are reported as missing.
+        """
+
+        month_dataframe, missing_months = self.database.use_database_storage_for_months([(1, 999), (2, 999), (4, 999)])
+        self.assertEqual(len(month_dataframe.index), 3)
+        self.assertEqual(set(month_dataframe["Month"]), {1, 4})
+        self.assertEqual(missing_months, {(2, 999)})
+
     def delete_month(self):
         """
         Checks to see that data can be deleted from the database correctly. Deletes data for a specific month and
@@ -91,6 +160,16 @@ class DatabaseTest(unittest.TestCase):
         self.assertEqual(month_dataframe_one, None)
         self.assertEqual(month_dataframe_two, None)
 
+    def test_schema_migration_can_be_run_again(self):
+        """
+        Checks to see that schema migrations can be run against a table that is already up to date without any errors
+        and that no migration is applied twice.
+        """
+
+        self.database.create_table()
+        self.database.migrate_schema()
+        self.assertEqual(self.database.migrate_schema(), [])
+
     def test_insert_with_invalid_parameter(self):
         """
         Checks to make sure that should an invalid parameter be given as the content to insert into the database, an
@@ -111,3 +190,6 @@ class DatabaseTest(unittest.TestCase):
 
         with self.assertRaises(RuntimeError):
             self.database.insert_data(True)
+
+        with self.assertRaises(RuntimeError):
+            self.database.insert_data(pd.DataFrame({"CLINIC": ["TestClinicOne"]}))
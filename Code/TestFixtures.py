@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+import AzureBlobStorage
+import Database
+import SentimentCache
+import WorkbookCache
+
+
+class TemporaryStorageMixin():
+    """
+    Mixin for test cases whose code stores data on disk, e.g. the database, the sentiment cache or the parsed workbook
+    cache. Everything is kept in a temporary directory that is removed after each test so the tests do not leave files
+    behind or read files left by earlier runs. Meant to be used alongside unittest.TestCase.
+    """
+
+    def use_temporary_directory(self):
+        """
+        Creates the temporary directory used by the test, it is removed once the test has finished.
+
+        :return: Path to the temporary directory.
+        """
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        return self.directory.name
+
+    def patch_shared_objects(self, replacements):
+        """
+        Replaces shared objects, e.g. the connection pool, for the length of the test.
+
+        :param replacements: List of (module, name, value) tuples, each one replacing the named attribute of the module.
+        """
+        for module, name, value in replacements:
+            patcher = mock.patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_sentiment_cache(self, file_name="sentiment_cache.db"):
+        """
+        Creates a sentiment cache stored in the temporary directory, its connection is closed once the test has
+        finished.
+
+        :param file_name: Name of the SQLite file the cache is stored in.
+        :return: SentimentScoreCache object.
+        """
+        cache = SentimentCache.SentimentScoreCache()
+        cache.path = os.path.join(self.directory.name, file_name)
+
+        def close():
+            if cache.db_connection is not None:
+                cache.db_connection.close()
+
+        self.addCleanup(close)
+        return cache
+
+    def make_workbook_cache(self, directory_name="parsed_workbooks"):
+        """
+        Creates a parsed workbook cache stored in the temporary directory.
+
+        :param directory_name: Name of the directory the parsed workbooks are stored in.
+        :return: ParsedWorkbookCache object.
+        """
+        cache = WorkbookCache.ParsedWorkbookCache()
+        cache.directory = os.path.join(self.directory.name, directory_name)
+        return cache
+
+    def use_temporary_caches(self):
+        """
+        Replaces the shared sentiment and parsed workbook caches with caches stored in the temporary directory.
+        """
+        self.patch_shared_objects([(SentimentCache, "shared_cache", self.make_sentiment_cache()),
+                                   (WorkbookCache, "workbook_cache", self.make_workbook_cache())])
+
+    def use_temporary_database(self):
+        """
+        Replaces the shared connection pool with one for a SQLite file in the temporary directory so the tests can be
+        run without access to Azure.
+
+        :return: SQLiteConnectionPool object.
+        """
+        connection_pool = Database.SQLiteConnectionPool()
+        connection_pool.path = os.path.join(self.directory.name, "feedback.db")
+        self.patch_shared_objects([(Database, "connection_pool", connection_pool)])
+        return connection_pool
+
+    def use_temporary_config(self, settings):
+        """
+        Runs the test from the temporary directory with a copy of config.json changed by settings. The shared objects
+        are removed so they are created again from the copied config.json, and the database and caches are stored in
+        the temporary directory.
+
+        :param settings: Dictionary of settings to change in the copy of config.json.
+        """
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+        data.update({"sqlite_database_path": os.path.join(self.directory.name, "feedback.db"),
+                     "sentiment_cache_path": os.path.join(self.directory.name, "sentiment_cache.db"),
+                     "parsed_workbook_cache_directory": os.path.join(self.directory.name, "parsed_workbooks")})
+        data.update(settings)
+        with open(os.path.join(self.directory.name, "config.json"), "w") as config_file:
+            json.dump(data, config_file)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory.name)
+        self.patch_shared_objects([(Database, "connection_pool", None), (AzureBlobStorage, "blob_catalogues", {}),
+                                   (SentimentCache, "shared_cache", None), (WorkbookCache, "workbook_cache", None)])
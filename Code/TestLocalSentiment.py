@@ -0,0 +1,47 @@
+import unittest
+import LocalSentiment
+
+
+class LocalSentimentTest(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates a LexiconSentimentScorer object before every test to be used in the tests.
+        """
+        self.scorer = LocalSentiment.LexiconSentimentScorer()
+
+    def test_sentiment_scores_are_generated(self):
+        """
+        Checks to see that a positive comment is given a positive score, a negative comment a negative score and a
+        comment with no known words a neutral score, with the scores in the same order as the comments.
+        """
+        comments = ["The nurse was very friendly and helpful, excellent service",
+                    "Waited three hours and the receptionist was rude",
+                    "Parking on site"]
+
+        scores = self.scorer.score_comments(comments)
+
+        self.assertEqual(len(scores), 3)
+        self.assertTrue(float(scores[0]) > 0.5)
+        self.assertTrue(float(scores[1]) < 0.5)
+        self.assertEqual(scores[2], "0.5000")
+
+    def test_negation_reverses_sentiment(self):
+        """
+        Checks to see that a word following a negation counts towards the opposite sentiment.
+        """
+        scores = self.scorer.score_comments(["Staff were helpful", "Staff were not helpful"])
+        self.assertTrue(float(scores[0]) > 0.5)
+        self.assertTrue(float(scores[1]) < 0.5)
+
+    def test_comments_without_text_not_scored(self):
+        """
+        Checks to see that comments that are not text are given None instead of a score and do not affect the scores
+        of the comments around them.
+        """
+        scores = self.scorer.score_comments([None, "Excellent", float("nan")])
+        self.assertEqual(scores[0], None)
+        self.assertTrue(float(scores[1]) > 0.5)
+        self.assertEqual(scores[2], None)
+        self.assertEqual(self.scorer.score_comments([]), [])
+        self.assertEqual(self.scorer.score_comments([None]), [None])
@@ -0,0 +1,319 @@
+import unittest
+import os
+import shutil
+import threading
+import time
+from unittest import mock
+import AnalysisJobs
+import AzureBlobStorage
+import Database
+import LocalSentiment
+import LocalStorage
+import PreAnalysis
+import ProcessData
+from TestFixtures import TemporaryStorageMixin
+
+
+class LocalStorageTest(TemporaryStorageMixin, unittest.TestCase):
+
+    def setUp(self):
+        """
+        Points the database at a SQLite file in a temporary directory before every test so that the tests can be run
+        without access to Azure. The shared sentiment and parsed workbook caches are kept in the same directory.
+        """
+        self.use_temporary_directory()
+        self.connection_pool = self.use_temporary_database()
+        self.use_temporary_caches()
+        self.database = Database.Database()
+        self.database.create_table()
+        self.database.migrate_schema()
+
+    def test_local_blobs_listed_and_read(self):
+        """
+        Checks to see that files in a local directory are listed and read in the same way as blobs in Azure, and that a
+        file's ETag changes when the file is changed.
+        """
+        blob_directory = os.path.join(self.directory.name, "blobs")
+        os.mkdir(blob_directory)
+        blob_path = os.path.join(blob_directory, "Positive Comments - January 20.xlsx")
+        blob_service = LocalStorage.LocalBlobService(blob_directory)
+
+        with open(blob_path, "wb") as blob_file:
+            blob_file.write(b"first")
+        first_blobs = blob_service.list_blobs("container")
+        with open(blob_path, "wb") as blob_file:
+            blob_file.write(b"second version")
+        second_blobs = blob_service.list_blobs("container")
+
+        self.assertEqual([blob.name for blob in first_blobs], ["Positive Comments - January 20.xlsx"])
+        self.assertNotEqual(first_blobs[0].properties.etag, second_blobs[0].properties.etag)
+        self.assertEqual(blob_service.get_blob_to_bytes("container", "Positive Comments - January 20.xlsx").content,
+                         b"second version")
+
+    def test_sqlite_database_functions(self):
+        """
+        Checks to see that the SQLite database can be written to, read from and deleted from using the same Database
+        methods as the MySQL database, and that migrations are not applied twice.
+        """
+        month_dataframe = ProcessData.pd.DataFrame(
+            {"CLINIC": ["TestClinicOne", "TestClinicOne"], "RESPONSE": ["Likely", None],
+             "COMMENTS": ["service was good", "service was bad"], "Pos or Neg": ["Positive", "Negative"],
+             "Month": [1, 4], "Year": [999, 999], "Sentiment_Score": [0.9352, 0.2364]})
+
+        self.database.insert_data(month_dataframe)
+        already_stored, stored_dataframe = self.database.use_database_storage(1, 999)
+        months_dataframe, missing_months = self.database.use_database_storage_for_months([(1, 999), (2, 999),
+                                                                                          (4, 999)])
+        self.database.delete_specific_year(999)
+
+        self.assertTrue(already_stored)
+        self.assertEqual(list(stored_dataframe["COMMENTS"]), ["service was good"])
+        self.assertEqual(len(months_dataframe.index), 2)
+        self.assertEqual(missing_months, {(2, 999)})
+        self.assertEqual(self.database.use_database_storage(4, 999), (False, None))
+        self.assertEqual(self.database.migrate_schema(), [])
+
+    def test_sqlite_migration_with_existing_index(self):
+        """
+        Checks to see that a migration whose index or table already exists in the SQLite database, for example because
+        it was created by hand, is recorded as applied rather than raising an error.
+        """
+        db_connection = Database.connect_to_database()
+        cursor = db_connection.cursor()
+        cursor.execute("DELETE FROM schema_version")
+        db_connection.commit()
+        db_connection.close()
+
+        self.assertEqual(self.database.migrate_schema(), [1, 2, 3])
+        self.assertEqual(self.database.migrate_schema(), [])
+
+    def test_query_filtered_and_paged_in_database(self):
+        """
+        Checks to see that stored data can be cut down to the columns needed, filtered by clinic, sentiment and score
+        and read a page at a time.
+        """
+        month_dataframe = ProcessData.pd.DataFrame(
+            {"CLINIC": ["TestClinicOne", "TestClinicOne", "TestClinicTwo", "TestClinicOne", "TestClinicOne"],
+             "RESPONSE": ["Likely", None, "Likely", "Likely", "Likely"],
+             "COMMENTS": ["good", "bad", "good", "great", "fine"],
+             "Pos or Neg": ["Positive", "Negative", "Positive", "Positive", "Positive"],
+             "Month": [1, 1, 1, 1, 2], "Year": [999, 999, 999, 999, 999],
+             "Sentiment_Score": [0.9, 0.2, 0.8, 0.7, 0.6]})
+        self.database.insert_data(month_dataframe)
+
+        first_page, next_after_id = self.database.query_feedback(
+            [(1, 999), (2, 999)], columns=["COMMENTS", "Sentiment_Score"], clinic="TestClinicOne",
+            sentiment="Positive", min_score=0.5, limit=2)
+        second_page, last_after_id = self.database.query_feedback(
+            [(1, 999), (2, 999)], columns=["COMMENTS", "Sentiment_Score"], clinic="TestClinicOne",
+            sentiment="Positive", min_score=0.5, after_id=next_after_id, limit=2)
+        low_scores, no_after_id = self.database.query_feedback([(1, 999)], max_score=0.5)
+
+        self.assertEqual(list(first_page.columns), ["COMMENTS", "Sentiment_Score"])
+        self.assertEqual(list(first_page["COMMENTS"]), ["good", "great"])
+        self.assertEqual(list(second_page["COMMENTS"]), ["fine"])
+        self.assertEqual(last_after_id, None)
+        self.assertEqual(list(low_scores["COMMENTS"]), ["bad"])
+        self.assertEqual(no_after_id, None)
+        self.assertEqual(self.database.find_missing_months([(1, 999), (3, 999)]), {(3, 999)})
+        with self.assertRaises(RuntimeError):
+            self.database.query_feedback([(1, 999)], columns=["ID"])
+
+    def test_stored_data_streamed_in_chunks(self):
+        """
+        Checks to see that stored data is streamed a month at a time in the order the months are given, with each month
+        read in chunks no larger than the chunk size.
+        """
+        month_dataframe = ProcessData.pd.DataFrame(
+            {"CLINIC": ["TestClinicOne"] * 5, "RESPONSE": ["Likely"] * 5, "COMMENTS": ["a", "b", "c", "d", "e"],
+             "Pos or Neg": ["Positive"] * 5, "Month": [1, 1, 1, 2, 2], "Year": [999] * 5,
+             "Sentiment_Score": [0.9, 0.8, 0.7, 0.6, 0.5]})
+        self.database.insert_data(month_dataframe)
+        self.database.stream_chunk_size = 2
+
+        chunks = list(self.database.stream_feedback([(2, 999), (1, 999)], columns=["COMMENTS"]))
+
+        self.assertEqual([list(chunk["COMMENTS"]) for chunk in chunks], [["d", "e"], ["a", "b"], ["c"]])
+        with self.assertRaises(RuntimeError):
+            self.database.stream_feedback([(1, 999)], columns=["ID"])
+
+    def test_pipeline_runs_offline(self):
+        """
+        Checks to see that several months of the mock data can be analysed and stored using the local directory,
+        SQLite database and deterministic scorer, and that the analysed months are then read back from the database.
+        """
+        with mock.patch.object(AzureBlobStorage.AzureStorage, "create_blob_service",
+                               lambda azure_storage: LocalStorage.LocalBlobService("../Excel/MockData")), \
+                mock.patch.object(AzureBlobStorage, "blob_catalogues", {}):
+            first_run = ProcessData.DataForMultipleMonths()
+            first_run.text_analytics.backend = LocalSentiment.DeterministicSentimentScorer()
+            first_run.text_analytics.cache = None
+            first_run.latest_month, first_run.latest_year = 2, 20
+            first_run.process_months(3)
+
+            second_run = ProcessData.DataForMultipleMonths()
+            second_run.latest_month, second_run.latest_year = 2, 20
+            with mock.patch.object(second_run, "analyse_month") as analyse_month:
+                second_run.process_months(3)
+
+        self.assertEqual(list(first_run.final_dataframe["Month"].unique()), [2, 1, 12])
+        self.assertEqual(len(second_run.final_dataframe.index), len(first_run.final_dataframe.index))
+        analyse_month.assert_not_called()
+
+    def test_request_waits_for_month_being_analysed(self):
+        """
+        Checks to see that a request for a month that a queued job is already analysing waits for that job rather than
+        analysing the month as well, so the month is only scored and stored once.
+        """
+        job_queue = AnalysisJobs.AnalysisJobQueue()
+        release = threading.Event()
+
+        with mock.patch.object(AzureBlobStorage.AzureStorage, "create_blob_service",
+                               lambda azure_storage: LocalStorage.LocalBlobService("../Excel/MockData")), \
+                mock.patch.object(AzureBlobStorage, "blob_catalogues", {}), \
+                mock.patch.object(ProcessData, "get_job_queue", return_value=job_queue):
+            scheduler_data = ProcessData.DataForMultipleMonths()
+            scheduler_data.text_analytics.backend = LocalSentiment.DeterministicSentimentScorer()
+            scheduler_data.text_analytics.cache = None
+
+            def reanalyse_month(month, year, progress):
+                release.wait(5)
+                return scheduler_data.reanalyse_month(month, year, progress)
+
+            job_queue.submit(2, 20, reanalyse_month, "reanalyse")
+            request_data = ProcessData.DataForMultipleMonths()
+            request_data.text_analytics.backend = LocalSentiment.DeterministicSentimentScorer()
+            request_data.text_analytics.cache = None
+            request_data.latest_month, request_data.latest_year = 2, 20
+            request = threading.Thread(target=request_data.process_months, args=(1,))
+            request.start()
+            # the request's job is queued behind the re-analysis before it is let go
+            for attempt in range(500):
+                if len(job_queue.active_jobs.get((2, 20), [])) == 2:
+                    break
+                time.sleep(0.01)
+            queued_jobs = len(job_queue.active_jobs.get((2, 20), []))
+            release.set()
+            request.join(10)
+            scorable_rows = len(request_data.find_scorable_comments(request_data.read_month(2, 20)).index)
+        job_queue.executor.shutdown(wait=True)
+
+        self.assertEqual(queued_jobs, 2)
+        self.assertEqual(len(self.database.use_database_storage(2, 20)[1].index), scorable_rows)
+        self.assertEqual(len(request_data.final_dataframe.index), scorable_rows)
+
+    def test_concurrent_requests_share_analysis(self):
+        """
+        Checks to see that two requests waiting for the same missing month at the same time share one job, so the month
+        is only scored and stored once.
+        """
+        job_queue = AnalysisJobs.AnalysisJobQueue()
+        release = threading.Event()
+        scorer = LocalSentiment.DeterministicSentimentScorer()
+        score_comments = scorer.score_comments
+
+        def score_when_released(comments):
+            release.wait(5)
+            return score_comments(comments)
+
+        with mock.patch.object(AzureBlobStorage.AzureStorage, "create_blob_service",
+                               lambda azure_storage: LocalStorage.LocalBlobService("../Excel/MockData")), \
+                mock.patch.object(AzureBlobStorage, "blob_catalogues", {}), \
+                mock.patch.object(ProcessData, "get_job_queue", return_value=job_queue), \
+                mock.patch.object(job_queue, "submit", wraps=job_queue.submit) as submit, \
+                mock.patch.object(scorer, "score_comments", side_effect=score_when_released):
+            requests = []
+            for request in range(2):
+                request_data = ProcessData.DataForMultipleMonths()
+                request_data.text_analytics.backend = scorer
+                request_data.text_analytics.cache = None
+                request_data.latest_month, request_data.latest_year = 2, 20
+                requests.append((request_data, threading.Thread(target=request_data.process_months, args=(1,))))
+            for request_data, request in requests:
+                request.start()
+            for attempt in range(500):
+                if submit.call_count == 2:
+                    break
+                time.sleep(0.01)
+            release.set()
+            for request_data, request in requests:
+                request.join(10)
+            scorable_rows = len(request_data.find_scorable_comments(request_data.read_month(2, 20)).index)
+        job_queue.executor.shutdown(wait=True)
+
+        self.assertEqual(submit.call_count, 2)
+        self.assertEqual(len(job_queue.jobs), 1)
+        self.assertEqual(len(self.database.use_database_storage(2, 20)[1].index), scorable_rows)
+        self.assertEqual([len(request_data.final_dataframe.index) for request_data, request in requests],
+                         [scorable_rows, scorable_rows])
+
+    def test_changed_month_updated_incrementally(self):
+        """
+        Checks to see that when a month's file is changed, analysing the month again only scores the rows that were
+        added, deletes the rows that were removed and leaves the month holding the same rows as analysing it from
+        scratch would.
+        """
+        blob_directory = os.path.join(self.directory.name, "blobs")
+        os.mkdir(blob_directory)
+        for sentiment in ["Positive", "Negative"]:
+            name = sentiment + " Comments - January 20.xlsx"
+            shutil.copy(os.path.join("../Excel/MockData", name), os.path.join(blob_directory, name))
+
+        with mock.patch.object(AzureBlobStorage.AzureStorage, "create_blob_service",
+                               lambda azure_storage: LocalStorage.LocalBlobService(blob_directory)), \
+                mock.patch.object(AzureBlobStorage, "blob_catalogues", {}):
+            process_data = ProcessData.DataForMultipleMonths()
+            process_data.text_analytics.backend = LocalSentiment.DeterministicSentimentScorer()
+            process_data.text_analytics.cache = None
+            process_data.analyse_month(1, 20)
+            original_dataframe = self.database.use_database_storage(1, 20)[1]
+
+            positive_path = os.path.join(blob_directory, "Positive Comments - January 20.xlsx")
+            positive_dataframe = ProcessData.pd.read_excel(positive_path)
+            removed_comment = positive_dataframe["COMMENTS"].iloc[0]
+            positive_dataframe = positive_dataframe.iloc[1:]
+            positive_dataframe.loc[len(positive_dataframe.index) + 1] = ["TestClinicOne", "Likely", "A new comment"]
+            positive_dataframe.to_excel(positive_path, index=False)
+
+            with mock.patch.object(process_data.text_analytics.backend, "score_comments",
+                                   wraps=process_data.text_analytics.backend.score_comments) as score_comments:
+                added, removed = process_data.reanalyse_month(1, 20)
+            updated_dataframe = self.database.use_database_storage(1, 20)[1]
+
+        self.assertEqual((added, removed), (1, 1))
+        score_comments.assert_called_once_with(["A new comment"])
+        self.assertEqual(len(updated_dataframe.index), len(original_dataframe.index))
+        self.assertEqual(list(updated_dataframe["COMMENTS"]).count("A new comment"), 1)
+        self.assertEqual(list(updated_dataframe["COMMENTS"]).count(removed_comment),
+                         list(original_dataframe["COMMENTS"]).count(removed_comment) - 1)
+
+    def test_analysed_files_stored_with_month(self):
+        """
+        Checks to see that the ETags of the files a month was analysed from are stored with the month, so a new
+        scheduler does not analyse it again, and that they are removed when the month is deleted.
+        """
+        blob_directory = os.path.join(self.directory.name, "blobs")
+        os.mkdir(blob_directory)
+        for sentiment in ["Positive", "Negative"]:
+            name = sentiment + " Comments - January 20.xlsx"
+            shutil.copy(os.path.join("../Excel/MockData", name), os.path.join(blob_directory, name))
+
+        with mock.patch.object(AzureBlobStorage.AzureStorage, "create_blob_service",
+                               lambda azure_storage: LocalStorage.LocalBlobService(blob_directory)), \
+                mock.patch.object(AzureBlobStorage, "blob_catalogues", {}):
+            process_data = ProcessData.DataForMultipleMonths()
+            process_data.text_analytics.backend = LocalSentiment.DeterministicSentimentScorer()
+            process_data.text_analytics.cache = None
+            scheduler = PreAnalysis.PreAnalysisScheduler()
+            blob_index = process_data.azure_storage.blob_index
+            months_before = scheduler.find_months_to_analyse(blob_index, self.database.get_analysed_files([(1, 20)]))
+            process_data.analyse_month(1, 20)
+            analysed_files = self.database.get_analysed_files([(1, 20)])
+            months_after = PreAnalysis.PreAnalysisScheduler().find_months_to_analyse(blob_index, analysed_files)
+            self.database.delete_specific_month(1, 20)
+
+        self.assertEqual(months_before, [(1, 20)])
+        self.assertEqual(analysed_files, {(1, 20): (blob_index[("Positive", 20, 1)]["etag"],
+                                                    blob_index[("Negative", 20, 1)]["etag"])})
+        self.assertEqual(months_after, [])
+        self.assertEqual(self.database.get_analysed_files([(1, 20)]), {})
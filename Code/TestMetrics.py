@@ -0,0 +1,59 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates a MetricsRegistry object before every test to be used in the tests.
+        """
+        self.metrics = Metrics.MetricsRegistry(buckets=[0.1, 1])
+
+    def test_durations_counted_in_buckets(self):
+        """
+        Checks to see that each duration is counted in every bucket it fits in and that the rows handled are added up.
+        """
+        self.metrics.observe("db_insert", 0.05)
+        self.metrics.observe("db_insert", 0.5)
+        self.metrics.observe("db_insert", 5)
+        self.metrics.add_rows("db_insert", 10)
+        self.metrics.add_rows("db_insert", 5)
+
+        output = self.metrics.render({})
+        self.assertIn('psat_stage_duration_seconds_bucket{stage="db_insert",le="0.1"} 1', output)
+        self.assertIn('psat_stage_duration_seconds_bucket{stage="db_insert",le="1"} 2', output)
+        self.assertIn('psat_stage_duration_seconds_bucket{stage="db_insert",le="+Inf"} 3', output)
+        self.assertIn('psat_stage_duration_seconds_count{stage="db_insert"} 3', output)
+        self.assertIn('psat_stage_rows_total{stage="db_insert"} 15', output)
+
+    def test_cache_statistics_rendered(self):
+        """
+        Checks to see that the hits, misses and hit ratio of each cache are written out.
+        """
+        output = self.metrics.render({"response": {"hits": 3, "misses": 1}, "sentiment": {"hits": 0, "misses": 0}})
+        self.assertIn('psat_cache_hits_total{cache="response"} 3', output)
+        self.assertIn('psat_cache_misses_total{cache="response"} 1', output)
+        self.assertIn('psat_cache_hit_ratio{cache="response"} 0.75', output)
+        self.assertIn('psat_cache_hit_ratio{cache="sentiment"} 0.0', output)
+
+    def test_request_timings_include_workers(self):
+        """
+        Checks to see that time spent in timed functions run by a pool of workers counts towards the request that
+        started them.
+        """
+        @Metrics.timed("test_stage")
+        def timed_function(value):
+            return value * 2
+
+        def handle_request():
+            Metrics.start_request_timing()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = list(executor.map(Metrics.with_request_context(timed_function), [1, 2, 3]))
+            return results, Metrics.get_request_timings()
+
+        results, timings = ThreadPoolExecutor(max_workers=1).submit(handle_request).result()
+        self.assertEqual(results, [2, 4, 6])
+        self.assertIn("test_stage", timings)
+        self.assertEqual(Metrics.get_request_timings(), None)
@@ -0,0 +1,63 @@
+import unittest
+from unittest import mock
+import PreAnalysis
+
+
+def make_index(etags):
+    """
+    Creates an index of files in the same form as a BlobCatalogue.
+
+    :param etags: Dictionary mapping (sentiment, year, month) to the ETag of the file
+    :return: Dictionary mapping (sentiment, year, month) to the details of the file
+    """
+    return {key: {"name": "", "etag": etag, "last_modified": None} for key, etag in etags.items()}
+
+
+class PreAnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates a PreAnalysisScheduler object before every test to be used in the tests.
+        """
+        self.scheduler = PreAnalysis.PreAnalysisScheduler()
+
+    def test_only_recent_complete_months_found(self):
+        """
+        Checks to see that only the most recent months with both a positive and a negative file are found, and that a
+        month is only found to need analysing when it has not been analysed from its current files.
+        """
+        self.scheduler.max_months = 2
+        index = make_index({("Positive", 20, 2): "a", ("Positive", 20, 1): "b", ("Negative", 20, 1): "c",
+                            ("Positive", 19, 12): "d", ("Negative", 19, 12): "e", ("Positive", 19, 11): "f",
+                            ("Negative", 19, 11): "g"})
+
+        self.assertEqual(self.scheduler.find_complete_months(index), [(1, 20), (12, 19)])
+        self.assertEqual(self.scheduler.find_months_to_analyse(index, {}), [(1, 20), (12, 19)])
+
+        analysed_files = {(1, 20): ("b", "c"), (12, 19): ("d", "e")}
+        self.assertEqual(self.scheduler.find_months_to_analyse(index, analysed_files), [])
+        index[("Negative", 19, 12)]["etag"] = "h"
+        self.assertEqual(self.scheduler.find_months_to_analyse(index, analysed_files), [(12, 19)])
+
+    def test_poll_queues_months_not_analysed_from_current_files(self):
+        """
+        Checks to see that a poll compares the files in the catalogue with the ETags stored in the database and only
+        queues the months that were not analysed from the current files.
+        """
+        catalogue = mock.Mock()
+        catalogue.index = make_index({("Positive", 20, 1): "a", ("Negative", 20, 1): "b",
+                                      ("Positive", 19, 12): "c", ("Negative", 19, 12): "d"})
+        job_queue = mock.Mock()
+
+        with mock.patch.object(PreAnalysis, "prepare_database"), \
+                mock.patch.object(PreAnalysis, "DataForMultipleMonths") as data_for_multiple_months, \
+                mock.patch.object(PreAnalysis, "get_blob_catalogue", return_value=catalogue), \
+                mock.patch.object(PreAnalysis, "get_job_queue", return_value=job_queue):
+            process_data = data_for_multiple_months.return_value
+            process_data.database.get_analysed_files.return_value = {(1, 20): ("a", "b"), (12, 19): ("c", "old")}
+            jobs = self.scheduler.poll()
+
+        catalogue.refresh.assert_called_with(force=True)
+        process_data.database.get_analysed_files.assert_called_once_with([(1, 20), (12, 19)])
+        job_queue.submit.assert_called_once_with(12, 19, process_data.reanalyse_month, "reanalyse")
+        self.assertEqual(jobs, [job_queue.submit.return_value])
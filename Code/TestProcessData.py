@@ -1,7 +1,12 @@
 import unittest
+import os
+import time
 import warnings
+from unittest import mock
+import AnalysisJobs
 import ProcessData
 import pandas as pd
+from TestFixtures import TemporaryStorageMixin
 
 
 # Decorator to ignore warnings in specific tests
@@ -14,13 +19,19 @@ def suppress_warnings(test_func):
     return run_test
 
 
-class ProcessDataTest(unittest.TestCase):
+class ProcessDataTest(TemporaryStorageMixin, unittest.TestCase):
 
     @suppress_warnings
     def setUp(self):
         """
-        Creates a ProcessData object before every test to be used in the tests.
+        Creates a ProcessData object before every test to be used in the tests. The tests are run from a temporary
+        directory holding a copy of config.json that reads files from Excel/MockData, stores data in a SQLite database
+        and scores comments with the deterministic scorer, so no Azure or MySQL credentials are needed.
         """
+        self.use_temporary_directory()
+        self.use_temporary_config({"storage_backend": "local",
+                                   "local_storage_directory": os.path.abspath("../Excel/MockData"),
+                                   "database_backend": "sqlite", "sentiment_backend": "deterministic"})
         self.process_data = ProcessData.DataForMultipleMonths()
 
     def test_set_blob_names(self):
@@ -31,29 +42,22 @@ class ProcessDataTest(unittest.TestCase):
         self.assertEqual(blob_name_pos, "Positive Comments - January 20.xlsx")
         self.assertEqual(blob_name_neg, "Negative Comments - January 20.xlsx")
 
-    def test_populate_pos_neg_lists(self):
+    def test_prepare_month_dataframe_labels_rows(self):
         """
-        Checks to see that lists of the correct length and contents are generated when a specified parameter is given.
+        Checks to see that the positive and negative comments are combined with only the expected columns, positive
+        comments first, and that every row is labelled with its sentiment, month and year.
         """
-        neg_list, pos_list = self.process_data.populate_pos_neg_lists(3, 5)
-        for item in neg_list:
-            self.assertEqual(item, "Negative")
-        for item in pos_list:
-            self.assertEqual(item, "Positive")
-        self.assertEqual(len(neg_list), 3)
-        self.assertEqual(len(pos_list), 5)
+        positive_df = pd.DataFrame({"CLINIC": ['Ex1', 'Ex2'], "RESPONSE": ["Likely", pd.NaT],
+                                    "COMMENTS": ['Good', 'Great'], "Unnamed: 3": [1, 2]})
+        negative_df = pd.DataFrame({"CLINIC": ['Ex3', 'Ex4', 'Ex5'], "RESPONSE": [pd.NaT, pd.NaT, "Unlikely"],
+                                    "COMMENTS": ['Bad', 'Rude', 'Slow']})
 
-    def test_populate_month_year_lists(self):
-        """
-        Chekcs to see that lists of correct length and contents are generated when specified parameters are given.
-        """
-        month_list, year_list = self.process_data.populate_month_year_lists(5, "May", 20)
-        for item in month_list:
-            self.assertEqual(item, "May")
-        for item in year_list:
-            self.assertEqual(item, 20)
-        self.assertEqual(len(month_list), 5)
-        self.assertEqual(len(year_list), 5)
+        df = self.process_data.prepare_month_dataframe(5, 20, negative_df, positive_df)
+        self.assertEqual(list(df.columns), ["CLINIC", "RESPONSE", "COMMENTS", "Pos or Neg", "Month", "Year"])
+        self.assertEqual(list(df["COMMENTS"]), ['Good', 'Great', 'Bad', 'Rude', 'Slow'])
+        self.assertEqual(list(df["Pos or Neg"]), ["Positive", "Positive", "Negative", "Negative", "Negative"])
+        self.assertEqual(list(df["Month"]), [5] * 5)
+        self.assertEqual(list(df["Year"]), [20] * 5)
 
     def test_data_reset(self):
         """
@@ -79,7 +83,7 @@ class ProcessDataTest(unittest.TestCase):
         Checks to see if no data present in list of file names then variables representing latest data remain as their
         default values and no error is thrown.
         """
-        self.process_data.azure_storage.blob_data_names.clear()
+        self.process_data.azure_storage.set_blob_data_names([])
         self.process_data.find_latest_data()
         self.assertEqual(self.process_data.latest_month, "")
         self.assertEqual(self.process_data.latest_year, "")
@@ -117,56 +121,218 @@ class ProcessDataTest(unittest.TestCase):
         """
         Checks to see that if the latest data is not available, no errors are thrown and None is returned.
         """
-        self.process_data.azure_storage.blob_data_names.clear()
+        self.process_data.azure_storage.set_blob_data_names([])
         file_month, file_year = self.process_data.find_required_month_data(0)
         self.assertEqual(file_month, None)
         self.assertEqual(file_year, None)
 
-    def test_clean_up_dataframe_none_dropped(self):
+    def test_prepare_month_dataframe_none_dropped(self):
         """
-        Checks to see that given a dataframe with some missing values but no row made up of entirely missing values, the
-        dataframe is unaltered and returned with the same number of rows as before.
+        Checks to see that given a dataframe with some missing values but no row made up of entirely missing values, no
+        rows are removed.
         """
         df = pd.DataFrame({"CLINIC": ['Ex1', 'Ex2', 'Ex3'],
-                           "COMMENT": [pd.NaT, 'Good', 'Bad'],
+                           "COMMENTS": [pd.NaT, 'Good', 'Bad'],
                            "RESPONSE": [pd.NaT, "Likely",
                                         pd.NaT]})
 
-        self.process_data.clean_up_dataframe(3, 3, df, df)
-        self.assertEqual(len(df.index), 3)
+        month_df = self.process_data.prepare_month_dataframe(1, 20, df, df)
+        self.assertEqual(len(month_df.index), 6)
 
-    def test_clean_up_dataframe_one_dropped(self):
+    def test_prepare_month_dataframe_one_dropped(self):
         """
         Checks to see that given a dataframe with missing values, including a row made up of missing values, that the
         empty row is removed but other rows are not changed.
         """
         df = pd.DataFrame({"CLINIC": [pd.NaT, 'Ex2', 'Ex3'],
-                           "COMMENT": [pd.NaT, 'Good', 'Bad'],
+                           "COMMENTS": [pd.NaT, 'Good', 'Bad'],
                            "RESPONSE": [pd.NaT, "Likely",
                                         pd.NaT]})
 
-        self.process_data.clean_up_dataframe(3, 3, df, df)
-        self.assertEqual(len(df.index), 2)
+        month_df = self.process_data.prepare_month_dataframe(1, 20, df, df)
+        self.assertEqual(len(month_df.index), 4)
+        self.assertEqual(list(month_df["COMMENTS"]), ['Good', 'Bad', 'Good', 'Bad'])
 
-    def test_clean_up_dataframe_clinic_to_zero(self):
+    def test_prepare_month_dataframe_clinic_to_zero(self):
         """
-        Checks to see that given a dataframe with CLINIC having missing values, the dataframe returned replaces the
-        missing values with a 0 and the row is not removed
+        Checks to see that missing values in CLINIC are replaced with a 0 in both the positive and negative comments and
+        the rows are not removed.
         """
-        df = pd.DataFrame({"CLINIC": ['Ex1', pd.NaT, 'Ex3'],
-                           "COMMENT": [pd.NaT, 'Good', 'Bad'],
-                           "RESPONSE": [pd.NaT, "Likely",
-                                        pd.NaT]})
+        positive_df = pd.DataFrame({"CLINIC": ['Ex1', pd.NaT], "COMMENTS": ['Good', 'Great'],
+                                    "RESPONSE": [pd.NaT, "Likely"]})
+        negative_df = pd.DataFrame({"CLINIC": [pd.NaT, 'Ex3'], "COMMENTS": ['Bad', 'Rude'],
+                                    "RESPONSE": ["Likely", pd.NaT]})
+
+        month_df = self.process_data.prepare_month_dataframe(1, 20, negative_df, positive_df)
+        self.assertEqual(len(month_df.index), 4)
+        self.assertEqual(list(month_df["CLINIC"]), ['Ex1', 0, 0, 'Ex3'])
+
+    def test_score_month_dataframe_scores_distinct_comments(self):
+        """
+        Checks to see that rows without a clinic or without any text are dropped before scoring, that each distinct
+        comment is only scored once even if it differs in case or whitespace, and that its score is given to every row
+        with the same comment.
+        """
+        df = pd.DataFrame({"CLINIC": ['Ex1', 'Ex2', 'Ex3', 'Ex4', 0, 'Ex6', 'Ex7', 'Ex8'],
+                           "COMMENTS": ['Good', ' good ', 'Bad', '   ', 'Great', pd.NaT, 'GOOD', 'Unscored'],
+                           "Pos or Neg": ["Positive"] * 8})
+
+        with mock.patch.object(self.process_data.text_analytics, "calculate_sentiment_scores",
+                               return_value=["0.9000", "0.1000", None]) as calculate_sentiment_scores:
+            scored_df = self.process_data.score_month_dataframe(df)
+
+        self.assertEqual(list(calculate_sentiment_scores.call_args[0][0]), ['Good', 'Bad', 'Unscored'])
+        self.assertEqual(list(scored_df["CLINIC"]), ['Ex1', 'Ex2', 'Ex3', 'Ex7'])
+        self.assertEqual(list(scored_df["Sentiment_Score"]), ["0.9000", "0.9000", "0.1000", "0.9000"])
+
+    def test_analyse_month_if_missing_checks_without_reading(self):
+        """
+        Checks to see that a month is only analysed if it is missing from the database, and that the check is made
+        without reading the month's stored data.
+        """
+        with mock.patch.object(self.process_data.database, "find_missing_months",
+                               side_effect=[set(), {(2, 20)}]) as find_missing_months, \
+                mock.patch.object(self.process_data.database, "use_database_storage") as use_database_storage, \
+                mock.patch.object(self.process_data, "analyse_month") as analyse_month:
+            self.process_data.analyse_month_if_missing(1, 20)
+            self.process_data.analyse_month_if_missing(2, 20)
+
+        find_missing_months.assert_called_with([(2, 20)])
+        analyse_month.assert_called_once_with(2, 20, None)
+        use_database_storage.assert_not_called()
+
+    def test_process_months_keeps_month_order(self):
+        """
+        Checks to see that months already in the database are read with one query, only the missing months are analysed
+        on the job queue and read back once stored, and the data for each month is still added to the final dataframe
+        in order from the latest month backwards, even if an older month finishes being analysed first.
+        """
+        def analyse_month_if_missing(file_month, file_year, progress):
+            time.sleep(0.05 * file_month)
 
-        self.process_data.clean_up_dataframe(3, 3, df, df)
-        self.assertEqual(len(df.index), 3)
-        self.assertEqual(df["CLINIC"][1], 0)
+        required_months = {0: (1, 20), 1: (12, 19), 2: (11, 19), 3: (None, None)}
+        stored_dataframe = pd.DataFrame({"Month": [12, 12], "Year": [19, 19]})
+        analysed_dataframe = pd.DataFrame({"Month": [11, 1], "Year": [19, 20]})
+        job_queue = AnalysisJobs.AnalysisJobQueue()
+
+        with mock.patch.object(self.process_data, "find_required_month_data", side_effect=required_months.get), \
+                mock.patch.object(self.process_data.database, "use_database_storage_for_months",
+                                  side_effect=[(stored_dataframe, {(1, 20), (11, 19)}),
+                                               (analysed_dataframe, set())]) as use_database_storage, \
+                mock.patch.object(self.process_data, "analyse_month_if_missing",
+                                  side_effect=analyse_month_if_missing) as analyse, \
+                mock.patch.object(ProcessData, "get_job_queue", return_value=job_queue):
+            self.process_data.latest_month = 1
+            self.process_data.process_months(4)
+        job_queue.executor.shutdown(wait=True)
+
+        self.assertEqual(use_database_storage.call_args_list, [mock.call([(1, 20), (12, 19), (11, 19)]),
+                                                               mock.call([(1, 20), (11, 19)])])
+        self.assertEqual(analyse.call_count, 2)
+        self.assertEqual(self.process_data.pending_jobs, [])
+        self.assertEqual(list(self.process_data.final_dataframe["Month"]), [1, 12, 12, 11])
+
+    def test_failed_analysis_raised_to_request(self):
+        """
+        Checks to see that a request waiting for a month to be analysed is given the error that stopped the month being
+        analysed.
+        """
+        job_queue = AnalysisJobs.AnalysisJobQueue()
+
+        with mock.patch.object(self.process_data, "analyse_month_if_missing",
+                               side_effect=RuntimeError("Workbook could not be read")), \
+                mock.patch.object(ProcessData, "get_job_queue", return_value=job_queue):
+            with self.assertRaises(RuntimeError):
+                self.process_data.analyse_missing_months([(1, 20)])
+        job_queue.executor.shutdown(wait=True)
+
+    def test_process_months_in_background(self):
+        """
+        Checks to see that when analysing in the background, missing months are queued as jobs and only the months
+        already in the database are added to the final dataframe.
+        """
+        required_months = {0: (1, 20), 1: (12, 19)}
+        stored_dataframe = pd.DataFrame({"Month": [12], "Year": [19]})
+        job_queue = mock.Mock()
+
+        with mock.patch.object(self.process_data, "find_required_month_data", side_effect=required_months.get), \
+                mock.patch.object(self.process_data.database, "use_database_storage_for_months",
+                                  return_value=(stored_dataframe, {(1, 20)})), \
+                mock.patch.object(self.process_data, "analyse_month") as analyse, \
+                mock.patch.object(ProcessData, "get_job_queue", return_value=job_queue):
+            self.process_data.latest_month = 1
+            self.process_data.process_months(2, background=True)
+
+        analyse.assert_not_called()
+        job_queue.submit.assert_called_once_with(1, 20, self.process_data.analyse_month_if_missing)
+        self.assertEqual(self.process_data.pending_jobs, [job_queue.submit.return_value])
+        self.assertEqual(list(self.process_data.final_dataframe["Month"]), [12])
+
+    def test_query_months_leaves_out_pending_months(self):
+        """
+        Checks to see that a filtered query only reads the months that are ready from the database when the missing
+        months are being analysed in the background.
+        """
+        required_months = {0: (1, 20), 1: (12, 19)}
+        job_queue = mock.Mock()
+
+        with mock.patch.object(self.process_data, "find_required_month_data", side_effect=required_months.get), \
+                mock.patch.object(self.process_data.database, "find_missing_months", return_value={(1, 20)}), \
+                mock.patch.object(self.process_data.database, "query_feedback",
+                                  return_value=(pd.DataFrame(), None)) as query_feedback, \
+                mock.patch.object(ProcessData, "get_job_queue", return_value=job_queue):
+            self.process_data.latest_month = 1
+            self.process_data.query_months(2, background=True, clinic="Ex1")
+
+        query_feedback.assert_called_once_with([(12, 19)], clinic="Ex1")
+        self.assertEqual(len(self.process_data.pending_jobs), 1)
+
+    def test_combine_month_dataframes(self):
+        """
+        Checks to see that months of data are combined in order into the final dataframe with compact column types.
+        """
+        january = pd.DataFrame({"CLINIC": ["Ex1", "Ex2"], "Pos or Neg": ["Positive", "Negative"], "Month": [1, 1],
+                                "Year": [20, 20], "Sentiment_Score": ["0.9000", "0.1000"]})
+        december = pd.DataFrame({"CLINIC": ["Ex1"], "Pos or Neg": ["Negative"], "Month": [12], "Year": [19],
+                                 "Sentiment_Score": [0.25]})
+
+        self.process_data.combine_month_dataframes([january, pd.DataFrame(), december])
+
+        final_dataframe = self.process_data.final_dataframe
+        self.assertEqual(list(final_dataframe["Month"]), [1, 1, 12])
+        self.assertEqual(final_dataframe["CLINIC"].dtype, "category")
+        self.assertEqual(final_dataframe["Month"].dtype, "int8")
+        self.assertEqual(final_dataframe["Sentiment_Score"].dtype, "float32")
 
     def populate_blob_data_names(self):
         """
         Helper method to create a list of file names available
         """
-        self.process_data.azure_storage.blob_data_names.clear()
-        self.process_data.azure_storage.blob_data_names.append("Positive Comments - January 20.xlsx")
-        self.process_data.azure_storage.blob_data_names.append("Positive Comments - December 19.xlsx")
-        self.process_data.azure_storage.blob_data_names.append("Positive Comments - November 19.xlsx")
+        self.process_data.azure_storage.set_blob_data_names(["Positive Comments - January 20.xlsx",
+                                                             "Positive Comments - December 19.xlsx",
+                                                             "Positive Comments - November 19.xlsx"])
+
+    def test_summarise(self):
+        """
+        Checks to see that data is summarised into the correct counts, ratio and score statistics for each clinic and
+        month.
+        """
+        self.process_data.combine_month_dataframes([pd.DataFrame(
+            {"CLINIC": ["Ex1", "Ex1", "Ex1", "Ex2"], "Pos or Neg": ["Positive", "Negative", "Positive", "Negative"],
+             "Month": [1, 1, 12, 1], "Year": [20, 20, 19, 20], "Sentiment_Score": [0.9, 0.1, 0.5, 0.2]})])
+
+        by_clinic = self.process_data.summarise("clinic")
+        by_clinic_month = self.process_data.summarise("clinicmonth")
+
+        self.assertEqual(list(by_clinic["CLINIC"]), ["Ex1", "Ex2"])
+        self.assertEqual(list(by_clinic["Comments"]), [3, 1])
+        self.assertEqual(list(by_clinic["Positive"]), [2, 0])
+        self.assertEqual(list(by_clinic["Negative"]), [1, 1])
+        self.assertEqual(list(by_clinic["Positive_Ratio"]), [0.6667, 0.0])
+        self.assertEqual(list(by_clinic["Mean_Score"]), [0.5, 0.2])
+        self.assertEqual(list(by_clinic["Median_Score"]), [0.5, 0.2])
+        self.assertEqual(list(zip(by_clinic_month["CLINIC"], by_clinic_month["Year"], by_clinic_month["Month"])),
+                         [("Ex1", 19, 12), ("Ex1", 20, 1), ("Ex2", 20, 1)])
+        self.assertEqual(list(by_clinic_month["P10_Score"]), [0.5, 0.18, 0.2])
+        with self.assertRaises(RuntimeError):
+            self.process_data.summarise("response")
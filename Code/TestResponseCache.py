@@ -0,0 +1,41 @@
+import unittest
+import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates a ResponseCache object before every test to be used in the tests.
+        """
+        self.response_cache = ResponseCache.ResponseCache()
+
+    def test_stored_response_returned(self):
+        """
+        Checks to see that a stored response is returned with an ETag that changes when the body changes.
+        """
+        entry = self.response_cache.put(("year", 12, 1, 20), "{}", self.response_cache.generation)
+        self.assertIs(self.response_cache.get(("year", 12, 1, 20)), entry)
+        self.assertEqual(self.response_cache.get(("year", 12, 2, 20)), None)
+        self.assertNotEqual(entry.etag, ResponseCache.CachedResponse("{ }").etag)
+
+    def test_expired_response_not_returned(self):
+        """
+        Checks to see that a response older than its time to live is no longer returned.
+        """
+        self.response_cache.ttl = -1
+        self.response_cache.put(("year", 12, 1, 20), "{}", self.response_cache.generation)
+        self.assertEqual(self.response_cache.get(("year", 12, 1, 20)), None)
+
+    def test_invalidation_removes_responses(self):
+        """
+        Checks to see that invalidating the cache removes every response and that a response that started being built
+        before the invalidation is not stored afterwards.
+        """
+        generation = self.response_cache.generation
+        self.response_cache.put(("year", 12, 1, 20), "{}", generation)
+        self.response_cache.invalidate()
+        self.response_cache.put(("range", 3, 1, 20), "{}", generation)
+
+        self.assertEqual(self.response_cache.get(("year", 12, 1, 20)), None)
+        self.assertEqual(self.response_cache.get(("range", 3, 1, 20)), None)
@@ -0,0 +1,44 @@
+import unittest
+import SentimentCache
+from TestFixtures import TemporaryStorageMixin
+
+
+class SentimentCacheTest(TemporaryStorageMixin, unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates a SentimentScoreCache object stored in a temporary directory before every test to be used in the tests.
+        """
+        self.use_temporary_directory()
+        self.cache = self.make_sentiment_cache("cache.db")
+
+    def test_cache_key_ignores_case_and_whitespace(self):
+        """
+        Checks to see that comments differing only in case or whitespace share a key but the same comment scored by a
+        different model version does not.
+        """
+        key = SentimentCache.make_cache_key("Very good", "latest")
+        self.assertEqual(key, SentimentCache.make_cache_key("  very   GOOD ", "latest"))
+        self.assertNotEqual(key, SentimentCache.make_cache_key("Very good", "2019-10-01"))
+
+    def test_stored_scores_returned_in_order(self):
+        """
+        Checks to see that stored scores are returned in the same order as the comments asked for, that comments not yet
+        scored are given None and that hits and misses are counted.
+        """
+        self.cache.store_scores(["Very good", "Rude staff"], ["0.9800", "0.0400"], "latest")
+        scores = self.cache.get_scores(["Rude staff", "Not seen before", "Very good", None], "latest")
+
+        self.assertEqual(scores, ["0.0400", None, "0.9800", None])
+        self.assertEqual(self.cache.statistics()["hits"], 2)
+        self.assertEqual(self.cache.statistics()["misses"], 1)
+
+    def test_scores_persist_beyond_memory(self):
+        """
+        Checks to see that scores evicted from the in memory cache are still found in the SQLite file.
+        """
+        self.cache.max_size = 1
+        self.cache.store_scores(["Very good", "Rude staff"], ["0.9800", "0.0400"], "latest")
+
+        self.assertEqual(len(self.cache.memory_cache), 1)
+        self.assertEqual(self.cache.get_scores(["Very good"], "latest"), ["0.9800"])
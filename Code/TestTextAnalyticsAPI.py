@@ -1,14 +1,29 @@
 import unittest
+from unittest import mock
+import SentimentCache
 import TextAnalyticsAPI as TextAnalyticsService
+from TestFixtures import TemporaryStorageMixin
 
 
-class TextAnalyticsTest(unittest.TestCase):
+class RequestError(Exception):
+    """
+    Stands in for an exception raised by the TA API client after receiving an error response.
+    """
+
+    def __init__(self, status_code, headers=None):
+        super().__init__("Operation returned an invalid status code {}".format(status_code))
+        self.response = mock.Mock(status_code=status_code, headers=headers or {})
+
+
+class TextAnalyticsTest(TemporaryStorageMixin, unittest.TestCase):
 
     def setUp(self):
         """
-        Creates a TextAnalyticsAPI object before every test to be used in the tests.
+        Creates a TextAnalyticsAPI object before every test to be used in the tests. The shared sentiment cache is
+        stored in a temporary directory so the tests do not leave a cache file behind.
         """
-
+        self.use_temporary_directory()
+        self.patch_shared_objects([(SentimentCache, "shared_cache", self.make_sentiment_cache())])
         self.text_analytics = TextAnalyticsService.TextAnalyticsService()
 
     def test_API_authentication(self):
@@ -35,3 +50,116 @@ class TextAnalyticsTest(unittest.TestCase):
         self.assertEqual(len(scores), 2)
         self.assertTrue(float(scores[0]) > 0.5)  # checks positive comment given positive score
         self.assertTrue(float(scores[1]) < 0.5)  # checks negative comment given negative score
+
+    def test_comments_split_into_batches(self):
+        """
+        Checks to see that comments are split into batches no larger than the batch size, that each document is given
+        the position of its comment as an id and that comments without any text are left out.
+        """
+
+        self.text_analytics.batch_size = 2
+        comments = ["Very good", "Excellent service", None, "   ", "Too long a wait"]
+
+        batches = self.text_analytics.split_into_batches(comments)
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual([document["id"] for document in batches[0]], ["0", "1"])
+        self.assertEqual([document["id"] for document in batches[1]], ["4"])
+
+    def test_scores_stay_aligned_when_a_comment_fails(self):
+        """
+        Checks to see that if a batch containing a bad comment keeps failing, only the bad comment loses its score and
+        every other score is still returned at the same index as its comment.
+        """
+
+        def sentiment(documents):
+            if any(document["text"] == "bad comment" for document in documents):
+                raise RequestError(400)
+            return mock.Mock(documents=[mock.Mock(id=document["id"], score=0.75) for document in documents], errors=[])
+
+        self.text_analytics.batch_size = 4
+        self.text_analytics.max_retries = 0
+        self.text_analytics.cache = None
+        comments = ["Very good", "bad comment", "Excellent service", "Friendly staff", "Too long a wait"]
+
+        with mock.patch.object(self.text_analytics, "authenticate_client") as authenticate_client:
+            authenticate_client.return_value.sentiment.side_effect = sentiment
+            scores = self.text_analytics.calculate_sentiment_scores(comments)
+
+        self.assertEqual(scores, ["0.7500", None, "0.7500", "0.7500", "0.7500"])
+
+    def test_failing_requests_not_split(self):
+        """
+        Checks to see that when every request fails for a reason other than a bad document, e.g. the API being
+        unreachable, bad credentials or throttling, the error is raised after a bounded number of requests instead of
+        the batch being split into one request per comment.
+        """
+        self.text_analytics.batch_size = 100
+        self.text_analytics.max_retries = 2
+        self.text_analytics.cache = None
+        comments = ["Comment {}".format(index) for index in range(100)]
+        failures = [(ConnectionError("Connection refused"), 3), (RequestError(401), 1), (RequestError(429), 3)]
+
+        for failure, expected_requests in failures:
+            with mock.patch.object(self.text_analytics, "authenticate_client") as authenticate_client, \
+                    mock.patch.object(TextAnalyticsService.time, "sleep"):
+                authenticate_client.return_value.sentiment.side_effect = failure
+                with self.assertRaises(type(failure)):
+                    self.text_analytics.calculate_sentiment_scores(comments)
+
+            self.assertEqual(authenticate_client.return_value.sentiment.call_count, expected_requests)
+
+    def test_throttled_request_waits_for_retry_after(self):
+        """
+        Checks to see that when the API throttles a request the retry waits for as long as the Retry-After header asks
+        rather than the usual backoff.
+        """
+        self.text_analytics.cache = None
+        responses = [RequestError(429, {"Retry-After": "7"}),
+                     mock.Mock(documents=[mock.Mock(id="0", score=0.5)], errors=[])]
+
+        with mock.patch.object(self.text_analytics, "authenticate_client") as authenticate_client, \
+                mock.patch.object(TextAnalyticsService.time, "sleep") as sleep:
+            authenticate_client.return_value.sentiment.side_effect = responses
+            scores = self.text_analytics.calculate_sentiment_scores(["Comment"])
+
+        self.assertEqual(scores, ["0.5000"])
+        sleep.assert_called_once_with(7.0)
+
+    def test_cached_comments_not_sent_again(self):
+        """
+        Checks to see that once a comment has been scored, scoring it again (even with different case or spacing) is
+        served by the sentiment cache and no further requests are made to the TA API.
+        """
+
+        self.text_analytics.cache = self.make_sentiment_cache("cache.db")
+
+        def sentiment(documents):
+            return mock.Mock(documents=[mock.Mock(id=document["id"], score=0.25) for document in documents], errors=[])
+
+        with mock.patch.object(self.text_analytics, "authenticate_client") as authenticate_client:
+            authenticate_client.return_value.sentiment.side_effect = sentiment
+            first_scores = self.text_analytics.calculate_sentiment_scores(["Too long a wait", "Rude staff"])
+            second_scores = self.text_analytics.calculate_sentiment_scores(["too long  a wait", "Rude staff"])
+
+        self.assertEqual(first_scores, ["0.2500", "0.2500"])
+        self.assertEqual(second_scores, ["0.2500", "0.2500"])
+        self.assertEqual(authenticate_client.return_value.sentiment.call_count, 1)
+
+    def test_progress_reported_while_scoring(self):
+        """
+        Checks to see that when a progress function is given it is told how many comments have been scored after each
+        chunk of comments, and that the scores are the same as when scoring without it.
+        """
+        self.text_analytics.cache = None
+        self.text_analytics.backend = mock.Mock()
+        self.text_analytics.backend.score_comments.side_effect = lambda comments: ["0.5000"] * len(comments)
+        self.text_analytics.batch_size = 2
+        self.text_analytics.max_workers = 2
+        progress = mock.Mock()
+
+        scores = self.text_analytics.calculate_sentiment_scores(["Comment"] * 10, progress)
+
+        self.assertEqual(scores, ["0.5000"] * 10)
+        self.assertEqual(progress.call_args_list, [mock.call(0, 10), mock.call(4, 10), mock.call(8, 10),
+                                                   mock.call(10, 10)])
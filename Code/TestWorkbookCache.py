@@ -0,0 +1,70 @@
+import unittest
+import os
+from unittest import mock
+import pandas as pd
+import AzureBlobStorage as AzureStorage
+import WorkbookCache
+from TestFixtures import TemporaryStorageMixin
+
+
+class WorkbookCacheTest(TemporaryStorageMixin, unittest.TestCase):
+
+    def setUp(self):
+        """
+        Creates a ParsedWorkbookCache object stored in a temporary directory before every test to be used in the tests.
+        """
+        self.use_temporary_directory()
+        self.cache = self.make_workbook_cache()
+        self.cache.enabled = True
+
+    def test_parsed_workbook_loaded_by_etag(self):
+        """
+        Checks to see that a stored workbook is loaded back with the same contents, including missing values, and that
+        it is not loaded once the ETag of the file has changed or if the ETag is not known.
+        """
+        dataframe = pd.DataFrame({"CLINIC": ["Radiology", None], "RESPONSE": [None, "Yes"],
+                                  "COMMENTS": ["Great staff", "Long wait"]})
+        self.cache.put("Positive Comments - January 20.xlsx", "etag1", dataframe)
+        self.cache.put("Positive Comments - January 20.xlsx", None, dataframe)
+
+        pd.testing.assert_frame_equal(self.cache.get("Positive Comments - January 20.xlsx", "etag1"), dataframe)
+        self.assertIsNone(self.cache.get("Positive Comments - January 20.xlsx", "etag2"))
+        self.assertIsNone(self.cache.get("Positive Comments - January 20.xlsx", None))
+        self.assertEqual(self.cache.statistics(), {"hits": 1, "misses": 2})
+        self.assertEqual(len(os.listdir(self.cache.directory)), 1)
+
+    def test_least_recently_used_files_removed(self):
+        """
+        Checks to see that only the most recently used files are kept once the cache is full.
+        """
+        self.cache.max_files = 2
+        dataframe = pd.DataFrame({"CLINIC": ["Radiology"], "RESPONSE": ["Yes"], "COMMENTS": ["Great staff"]})
+        for etag in ["etag1", "etag2", "etag3"]:
+            self.cache.put("Positive Comments - January 20.xlsx", etag, dataframe)
+            path = self.cache.get_path("Positive Comments - January 20.xlsx", etag)
+            os.utime(path, (int(etag[-1]), int(etag[-1])))
+
+        self.assertEqual(len(os.listdir(self.cache.directory)), 2)
+        self.assertIsNone(self.cache.get("Positive Comments - January 20.xlsx", "etag1"))
+
+    def test_workbook_only_parsed_once(self):
+        """
+        Checks to see that a month's files are downloaded and parsed the first time they are read, that only the columns
+        used by the pipeline are kept and that reading the month again loads the files from the cache.
+        """
+        azure_storage = AzureStorage.AzureStorage()
+        azure_storage.storage_backend = "local"
+        azure_storage.local_storage_directory = "../Excel/MockData"
+
+        with mock.patch.object(WorkbookCache, "workbook_cache", self.cache), \
+                mock.patch.object(azure_storage, "get_blob", wraps=azure_storage.get_blob) as get_blob:
+            first = azure_storage.get_month_dataframes("Negative Comments - January 20.xlsx",
+                                                       "Positive Comments - January 20.xlsx")
+            second = azure_storage.get_month_dataframes("Negative Comments - January 20.xlsx",
+                                                        "Positive Comments - January 20.xlsx")
+
+        self.assertEqual(get_blob.call_count, 2)
+        self.assertEqual(list(first[1].columns), ["CLINIC", "RESPONSE", "COMMENTS"])
+        pd.testing.assert_frame_equal(first[0], second[0])
+        pd.testing.assert_frame_equal(first[1], second[1])
+        self.assertEqual(self.cache.statistics(), {"hits": 2, "misses": 2})
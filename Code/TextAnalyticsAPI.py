@@ -1,11 +1,25 @@
 from azure.cognitiveservices.language.textanalytics import TextAnalyticsClient
 from msrest.authentication import CognitiveServicesCredentials
+from concurrent.futures import ThreadPoolExecutor
 import json
+import time
+
+from Metrics import metrics, timed, with_request_context
+from LocalSentiment import DeterministicSentimentScorer, LexiconSentimentScorer
+from SentimentCache import get_shared_cache
+
+# scorers that can be chosen in place of the TA API using "sentiment_backend" in config.json
+local_backends = {"lexicon": LexiconSentimentScorer, "deterministic": DeterministicSentimentScorer}
+# the TA API rejects a whole batch with these when one of its documents is invalid, e.g. too long
+rejected_document_status_codes = (400, 413)
+# retrying or splitting a batch does not help when the API does not accept our credentials
+authentication_status_codes = (401, 403)
 
 
 class TextAnalyticsService():
     """
-    This class encapsulates all the code that deals with sending data to the Text Analytics API on Azure.
+    This class encapsulates all the code that deals with sending data to the Text Analytics API on Azure. It can also
+    hand scoring over to one of the local backends, any backend just needs a model_version and a score_comments method.
     """
 
     def __init__(self):
@@ -13,6 +27,21 @@ class TextAnalyticsService():
             data = json.load(config_file)
             self.subscription_key = data["text_analytics_key"]
             self.endpoint = data["text_analytics_endpoint"]
+            # number of comments sent per request, the TA API rejects requests with more than 1000 documents
+            self.batch_size = data.get("text_analytics_batch_size", 100)
+            self.max_workers = data.get("text_analytics_max_workers", 4)
+            self.max_retries = data.get("text_analytics_max_retries", 3)
+            self.model_version = data.get("text_analytics_model_version", "latest")
+            cache_enabled = data.get("sentiment_cache_enabled", True)
+            backend_name = data.get("sentiment_backend", "azure")
+        self.cache = get_shared_cache() if cache_enabled else None
+
+        if backend_name == "azure":
+            self.backend = self
+        elif backend_name in local_backends:
+            self.backend = local_backends[backend_name]()
+        else:
+            raise RuntimeError("Unknown sentiment backend " + backend_name)
 
     def authenticate_client(self):
         """
@@ -26,24 +55,161 @@ class TextAnalyticsService():
             endpoint=self.endpoint, credentials=credentials)
         return text_analytics_client
 
-    def calculate_sentiment_scores(self, comments):
+    def split_into_batches(self, comments):
         """
-        Method that sends comments to the TA API for sentiment analysis then collates the results into a list.
+        Splits the comments into batches of documents that can each be sent to the TA API in a single request. The id of
+        each document is the position of the comment in the comments list so scores can be put back in the right order.
+        Comments without any text are left out as the API is unable to score them.
 
         :param comments: List of comments to be analysed.
-        :return: List of scores corresponding to the comments. So index 0 of scores list is for the comment at index 0
-        of the comments list etc.
+        :return: List of batches, each one a list of at most batch_size documents in the format expected by the API.
+        """
+        batches = []
+        batch = []
+
+        for index, comment in enumerate(comments):
+            if not isinstance(comment, str) or comment.strip() == "":
+                continue
+            batch.append({"id": str(index), "language": "en", "text": comment})
+            if len(batch) == self.batch_size:
+                batches.append(batch)
+                batch = []
+
+        if len(batch) != 0:
+            batches.append(batch)
+        return batches
+
+    def score_batch(self, batch, retries=None):
+        """
+        Sends a batch of documents to the TA API, retrying with a backoff if the request fails. If the API rejects the
+        batch because of a bad document it is split in half and each half is scored on its own so that a single bad
+        comment only loses its own score. Any other failure, e.g. bad credentials, throttling or the API being
+        unreachable, is raised once the retries are used up as splitting the batch would only repeat it.
+
+        :param batch: List of documents created by split_into_batches.
+        :param retries: Number of times to retry the request, defaults to max_retries.
+        :return: Dictionary mapping the position of each scored comment to its score.
         """
-        comment_sentiment_scores = []
-        client = self.authenticate_client()
+        if retries is None:
+            retries = self.max_retries
 
-        for comment in comments:
-            data = [{"id": 0, "language": "en", "text": comment}]
+        for attempt in range(retries + 1):
             try:
-                response = client.sentiment(documents=data)
+                response = self.authenticate_client().sentiment(documents=batch)
+                scores = {}
                 for document in response.documents:
-                    comment_sentiment_scores.append("{:.4f}".format(document.score))
+                    scores[int(document.id)] = "{:.4f}".format(document.score)
+                for error in response.errors:
+                    print("Unable to score comment {}. {}".format(error.id, error.message))
+                return scores
             except Exception as err:
                 print("Encountered exception. {}".format(err))
+                status_code = self.response_status_code(err)
+                if status_code in rejected_document_status_codes:
+                    break
+                if status_code in authentication_status_codes or attempt == retries:
+                    raise
+                time.sleep(self.retry_delay(err, attempt))
+
+        if len(batch) == 1:
+            return {}
+        # sub-batches are not retried again, the batch as a whole has already been sent
+        middle = len(batch) // 2
+        scores = self.score_batch(batch[:middle], 0)
+        scores.update(self.score_batch(batch[middle:], 0))
+        return scores
+
+    def response_status_code(self, err):
+        """
+        Finds the HTTP status code of the response that caused an exception raised by the TA API client.
+
+        :param err: Exception raised while sending a request to the TA API.
+        :return: The status code of the response, or None if no response was received e.g. the connection failed.
+        """
+        return getattr(getattr(err, "response", None), "status_code", None)
+
+    def retry_delay(self, err, attempt):
+        """
+        Works out how long to wait before retrying a failed request. When the API is throttling us the wait it asks
+        for in the Retry-After header is used, otherwise the wait doubles with every attempt.
+
+        :param err: Exception raised while sending a request to the TA API.
+        :param attempt: Number of attempts made so far, starting at 0.
+        :return: Number of seconds to wait before the next attempt.
+        """
+        if self.response_status_code(err) == 429:
+            try:
+                return float(err.response.headers["Retry-After"])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                pass
+        return 2 ** attempt
 
+    @timed("sentiment_requests")
+    def score_comments(self, comments):
+        """
+        Method that sends comments to the TA API for sentiment analysis then collates the results into a list. Comments
+        are sent in batches, with several batches being scored at the same time.
+
+        :param comments: List of comments to be analysed.
+        :return: List of scores corresponding to the comments. Comments that could not be scored have None as their
+        score.
+        """
+        comment_sentiment_scores = [None] * len(comments)
+        batches = self.split_into_batches(comments)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for scores in executor.map(with_request_context(self.score_batch), batches):
+                for index, score in scores.items():
+                    comment_sentiment_scores[index] = score
+
+        return comment_sentiment_scores
+
+    @timed("sentiment_scoring")
+    def calculate_sentiment_scores(self, comments, progress=None):
+        """
+        Method that finds the sentiment score of every comment. Scores are taken from the sentiment cache where possible
+        and only comments that have not been scored before are given to the backend.
+
+        :param comments: List of comments to be analysed.
+        :param progress: Optional function called with the number of comments scored so far and the total number of
+        comments as scoring goes on
+        :return: List of scores corresponding to the comments. So index 0 of scores list is for the comment at index 0
+        of the comments list etc. Comments that could not be scored have None as their score.
+        """
+        comments = list(comments)
+        metrics.add_rows("sentiment_scoring", len(comments))
+        if self.cache is None:
+            return self.score_with_progress(comments, progress, 0, len(comments))
+
+        comment_sentiment_scores = self.cache.get_scores(comments, self.backend.model_version)
+        unscored = [index for index, score in enumerate(comment_sentiment_scores) if score is None]
+        unscored_comments = [comments[index] for index in unscored]
+        new_scores = self.score_with_progress(unscored_comments, progress, len(comments) - len(unscored),
+                                              len(comments))
+        self.cache.store_scores(unscored_comments, new_scores, self.backend.model_version)
+
+        for index, score in zip(unscored, new_scores):
+            comment_sentiment_scores[index] = score
         return comment_sentiment_scores
+
+    def score_with_progress(self, comments, progress, already_scored, total):
+        """
+        Gives comments to the backend to be scored. When progress is given the comments are handed over in chunks just
+        large enough to keep every worker busy, so progress can be reported after each chunk.
+
+        :param comments: List of comments to be scored by the backend
+        :param progress: Function called with the number of comments scored so far and the total, or None
+        :param already_scored: Number of comments that were scored before this method was called, e.g. from the cache
+        :param total: Total number of comments being scored
+        :return: List of scores corresponding to the comments
+        """
+        if progress is None:
+            return self.backend.score_comments(comments)
+
+        progress(already_scored, total)
+        chunk_size = self.batch_size * self.max_workers
+        scores = []
+        for start in range(0, len(comments), chunk_size):
+            scores.extend(self.backend.score_comments(comments[start:start + chunk_size]))
+            progress(already_scored + len(scores), total)
+        return scores
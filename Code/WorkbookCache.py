@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+def make_cache_file_name(blob_name, etag):
+    """
+    Creates the name of the file a parsed workbook is stored under. The ETag is part of the name so a workbook that has
+    been replaced in blob storage is never loaded from an older copy.
+
+    :param blob_name: Name of the workbook in blob storage
+    :param etag: ETag of the workbook when it was parsed
+    :return: Hex digest of the SHA-256 hash of the name and ETag followed by the file extension used
+    """
+    content = blob_name + "\n" + etag
+    extension = ".arrow" if pyarrow is not None else ".pkl"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest() + extension
+
+
+class ParsedWorkbookCache():
+    """
+    This class encapsulates all the code that deals with keeping parsed workbooks in a local directory, so a workbook
+    that has already been parsed does not have to be downloaded and read again when its month is re-analysed. Workbooks
+    are stored in the Arrow file format and memory mapped when loaded if pyarrow is installed, otherwise they are
+    pickled. Only the most recently used files are kept.
+    """
+
+    def __init__(self):
+        with open('config.json') as config_file:
+            data = json.load(config_file)
+            self.enabled = data.get("parsed_workbook_cache_enabled", True)
+            self.directory = data.get("parsed_workbook_cache_directory", "parsed_workbooks")
+            self.max_files = data.get("parsed_workbook_cache_size", 48)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_path(self, blob_name, etag):
+        """
+        Gets the path a parsed workbook is stored at.
+
+        :param blob_name: Name of the workbook in blob storage
+        :param etag: ETag of the workbook
+        :return: Path of the file, None if the workbook cannot be cached because the cache is disabled or the ETag is
+        not known
+        """
+        if not self.enabled or etag is None:
+            return None
+        return os.path.join(self.directory, make_cache_file_name(blob_name, etag))
+
+    def get(self, blob_name, etag):
+        """
+        Loads a parsed workbook from the cache.
+
+        :param blob_name: Name of the workbook in blob storage
+        :param etag: ETag of the workbook
+        :return: Dataframe holding the parsed workbook, None if it is not stored
+        """
+        path = self.get_path(blob_name, etag)
+        dataframe = None
+        if path is not None and os.path.exists(path):
+            try:
+                dataframe = self.read_file(path)
+                # marks the file as recently used so it is the last to be removed
+                os.utime(path)
+            except Exception as err:
+                print(err)
+                dataframe = None
+
+        with self.lock:
+            if dataframe is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return dataframe
+
+    def put(self, blob_name, etag, dataframe):
+        """
+        Stores a parsed workbook in the cache, removing the least recently used files if there are too many. The file
+        is written under a temporary name first so a partly written file is never loaded.
+
+        :param blob_name: Name of the workbook in blob storage
+        :param etag: ETag of the workbook when it was downloaded
+        :param dataframe: Dataframe holding the parsed workbook
+        """
+        path = self.get_path(blob_name, etag)
+        if path is None:
+            return
+        temporary_path = path + "." + uuid.uuid4().hex + ".tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.write_file(temporary_path, dataframe)
+            os.replace(temporary_path, path)
+            self.remove_old_files()
+        except Exception as err:
+            print(err)
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def read_file(self, path):
+        """
+        Reads a parsed workbook from a file, memory mapping it if it is in the Arrow file format.
+
+        :param path: Path of the file
+        :return: Dataframe holding the parsed workbook
+        """
+        if not path.endswith(".arrow"):
+            return pd.read_pickle(path)
+        with pyarrow.memory_map(path) as source:
+            dataframe = pyarrow.ipc.open_file(source).read_all().to_pandas()
+        # Arrow gives missing text as None, NaN is used everywhere else
+        return dataframe.where(dataframe.notna(), np.nan)
+
+    def write_file(self, path, dataframe):
+        """
+        Writes a parsed workbook to a file.
+
+        :param path: Path of the file
+        :param dataframe: Dataframe holding the parsed workbook
+        """
+        if pyarrow is None:
+            dataframe.to_pickle(path)
+            return
+        table = pyarrow.Table.from_pandas(dataframe, preserve_index=False)
+        with pyarrow.OSFile(path, "wb") as sink:
+            writer = pyarrow.RecordBatchFileWriter(sink, table.schema)
+            writer.write_table(table)
+            writer.close()
+
+    def remove_old_files(self):
+        """
+        Removes the least recently used files once there are more than max_files in the directory.
+        """
+        with self.lock:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith(".arrow") or name.endswith(".pkl")]
+            if len(paths) <= self.max_files:
+                return
+            paths.sort(key=os.path.getmtime)
+            for path in paths[:len(paths) - self.max_files]:
+                try:
+                    os.remove(path)
+                except OSError as err:
+                    print(err)
+
+    def statistics(self):
+        """
+        Gives the number of workbooks loaded from the cache and the number that had to be parsed.
+
+        :return: Dictionary containing the hits and misses of the cache
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+workbook_cache = None
+workbook_cache_lock = threading.Lock()
+
+
+def get_workbook_cache():
+    """
+    Gets the cache shared by every request made to the API, creating it the first time it is needed.
+
+    :return: The ParsedWorkbookCache used by the whole process
+    """
+    global workbook_cache
+    with workbook_cache_lock:
+        if workbook_cache is None:
+            workbook_cache = ParsedWorkbookCache()
+        return workbook_cache
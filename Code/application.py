@@ -1,12 +1,30 @@
-from flask import Flask, jsonify, abort, make_response
+from flask import Flask, Response, jsonify, abort, make_response, request, stream_with_context
 from flask_restful import Api, Resource, reqparse
 from flask_httpauth import HTTPBasicAuth
+from datetime import timezone
+from urllib.parse import urlencode
+from werkzeug.http import http_date
 import json
-from ProcessData import DataForMultipleMonths
-from Database import Database
+from ProcessData import DataForMultipleMonths, summary_groupings
+from Database import Database, DatabaseUnavailableError, prepare_database
+from ResponseCache import get_response_cache
+from AnalysisJobs import get_job_queue
+from PreAnalysis import get_scheduler
+from SentimentCache import get_shared_cache
+from WorkbookCache import get_workbook_cache
+from Metrics import metrics, timed, start_request_timing, stop_request_timing, get_request_timings
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# requests that fail because the database cannot be reached are answered with a 503 so clients know to try again later
+api_errors = {"DatabaseUnavailableError": {"message": "Database unavailable, please try again later", "status": 503}}
 
 app = Flask(__name__)
-api = Api(app)
+api = Api(app, errors=api_errors)
 auth = HTTPBasicAuth()
 
 
@@ -41,6 +59,300 @@ def unauthorized():
     return make_response(jsonify({'message': 'Unauthorized access'}), 403)
 
 
+@app.before_request
+def start_timing():
+    """
+    Starts recording the time spent in each stage of the pipeline for the request being handled.
+    """
+    start_request_timing()
+
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Adds a Server-Timing header listing the time spent in each stage of the pipeline, so the cause of a slow request can
+    be seen from the browser or client. Only added when server_timing_enabled is set in the config, as it reveals how
+    the API works internally.
+
+    :param response: Response about to be sent
+    :return: The response, with the header added if enabled
+    """
+    with open("config.json") as config_file:
+        data = json.load(config_file)
+
+    timings = get_request_timings()
+    if data.get("server_timing_enabled", False) and timings:
+        response.headers["Server-Timing"] = ", ".join(
+            "{};dur={:.1f}".format(stage, seconds * 1000) for stage, seconds in sorted(timings.items()))
+    return response
+
+
+@app.teardown_request
+def stop_timing(exception):
+    """
+    Stops recording the time spent in each stage once the request has been handled.
+
+    :param exception: Exception raised while handling the request, if any
+    """
+    stop_request_timing()
+
+
+# formats data can be sent in, chosen with the format URL parameter or the Accept header, with their media types
+response_formats = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv",
+                    "parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+
+# formats that can only be sent if pyarrow is installed
+arrow_formats = ["parquet", "arrow"]
+
+# decimal places floats are written to in JSON, as scores held as float32 would otherwise gain digits they never had
+json_precision = 4
+
+
+def choose_response_format(args):
+    """
+    Works out which format the client wants data sent in. The format URL parameter takes priority over the Accept
+    header, and JSON is used if neither asks for a supported format. Parquet and Arrow are only offered if pyarrow is
+    installed.
+
+    :param args: Arguments parsed by the request parser
+    :return: Key of response_formats
+    """
+    available_formats = {name: media_type for name, media_type in response_formats.items()
+                         if pyarrow is not None or name not in arrow_formats}
+    if args['format'] is not None:
+        if args['format'] not in available_formats:
+            abort(406)
+        return args['format']
+    media_type = request.accept_mimetypes.best_match(list(available_formats.values()), default="application/json")
+    return next(name for name, format_media_type in available_formats.items() if format_media_type == media_type)
+
+
+@timed("serialise")
+def serialise(dataframe, response_format="json"):
+    """
+    Converts a dataframe to the format sent in responses. Parquet and Arrow keep the type of each column, so for
+    example clinics are sent as a dictionary encoded column rather than repeating every name.
+
+    :param dataframe: Pandas dataframe to be converted
+    :param response_format: Key of response_formats
+    :return: String holding the dataframe as JSON, or bytes holding it in any other format
+    """
+    if response_format == "json":
+        return dataframe.to_json(double_precision=json_precision)
+    if response_format == "ndjson":
+        return (dataframe.to_json(orient="records", lines=True, double_precision=json_precision).rstrip("\n") +
+                "\n").encode("utf-8")
+    if response_format == "csv":
+        return dataframe.to_csv(index=False).encode("utf-8")
+
+    table = pyarrow.Table.from_pandas(dataframe, preserve_index=False)
+    sink = pyarrow.BufferOutputStream()
+    if response_format == "parquet":
+        pyarrow.parquet.write_table(table, sink)
+    else:
+        writer = pyarrow.RecordBatchStreamWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    return sink.getvalue().to_pybytes()
+
+
+def data_response(body, status, headers, response_format):
+    """
+    Creates the response holding data. JSON is returned as before so that Flask-RESTful encodes it, any other format is
+    sent as it is with its media type.
+
+    :param body: Data created by serialise
+    :param status: HTTP status code
+    :param headers: Dictionary of headers
+    :param response_format: Key of response_formats
+    :return: tuple in the form (body, status code, headers), or a flask Response, to be returned by a Resource
+    """
+    if response_format == "json":
+        return body, status, headers
+    return Response(body, status=status, headers=headers, mimetype=response_formats[response_format])
+
+
+def pending_response(body, pending_jobs, response_format="json"):
+    """
+    Creates the response sent when some of the requested months are still being analysed in the background. The
+    response is not cached as it is missing data. In formats other than JSON the body only holds the data and the jobs
+    are given in Link headers.
+
+    :param body: Data for the months that are ready, created by serialise
+    :param pending_jobs: List of AnalysisJob objects analysing the months that are not ready
+    :param response_format: Key of response_formats
+    :return: tuple in the form (body, status code, headers) to be returned by a Resource
+    """
+    jobs = [job.to_dict() for job in pending_jobs]
+    for job in jobs:
+        job["url"] = api.url_for(AnalysisJobAPI, job_id=job["job_id"])
+    headers = {"Location": jobs[0]["url"], "Retry-After": "30"}
+    if response_format != "json":
+        headers["Link"] = ", ".join('<' + job["url"] + '>; rel="monitor"' for job in jobs)
+        return data_response(body, 202, headers, response_format)
+    return {"message": "Some months are still being analysed, the months that are ready are included in data",
+            "data": body, "jobs": jobs}, 202, headers
+
+
+def wants_background_analysis(asynchronous_analysis):
+    """
+    Works out whether months that have not been analysed yet should be analysed in the background for this request
+    rather than waiting for them. Clients opt in by sending a Prefer header of respond-async, unless
+    "asynchronous_analysis" is turned on in config.json for every request.
+
+    :param asynchronous_analysis: The "asynchronous_analysis" setting from config.json
+    :return: True if missing months should be analysed in the background and a 202 response returned
+    """
+    preferences = [preference.split(";")[0].strip().lower()
+                   for preference in request.headers.get("Prefer", "").split(",")]
+    return asynchronous_analysis or "respond-async" in preferences
+
+
+def cached_response(key, build_response, response_format="json"):
+    """
+    Returns a response from the response cache, building it and storing it in the cache first if needed. ETag and
+    Last-Modified headers are added so that a client that already has an up to date copy of the response is sent a 304
+    response with no body instead.
+
+    :param key: Tuple identifying the response, made up of the endpoint, the window of months and the latest month
+    :param build_response: Function that builds the body of the response if it is not already cached, returning the
+    body and a list of jobs analysing any months left out of it
+    :param response_format: Key of response_formats the body is in, which should also be part of the key
+    :return: tuple in the form (body, status code, headers) to be returned by a Resource
+    """
+    response_cache = get_response_cache()
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation
+        body, pending_jobs = build_response()
+        if len(pending_jobs) != 0:
+            return pending_response(body, pending_jobs, response_format)
+        entry = response_cache.put(key, body, generation)
+
+    headers = {"ETag": '"' + entry.etag + '"', "Last-Modified": http_date(entry.last_modified),
+               "Cache-Control": "no-cache"}
+
+    if request.if_none_match:
+        if request.if_none_match.contains(entry.etag):
+            return "", 304, headers
+    elif request.if_modified_since is not None:
+        if_modified_since = request.if_modified_since
+        if if_modified_since.tzinfo is None:
+            if_modified_since = if_modified_since.replace(tzinfo=timezone.utc)
+        if entry.last_modified <= if_modified_since:
+            return "", 304, headers
+
+    return data_response(entry.body, 200, headers, response_format)
+
+
+def add_query_arguments(parser):
+    """
+    Adds the URL parameters used to filter, cut down and page through data to a request parser.
+
+    :param parser: RequestParser of a Resource
+    """
+    parser.add_argument('columns', type=str, location='args')
+    parser.add_argument('clinic', type=str, location='args')
+    parser.add_argument('sentiment', type=str, choices=("Positive", "Negative"), location='args')
+    parser.add_argument('min_score', type=float, location='args')
+    parser.add_argument('max_score', type=float, location='args')
+    parser.add_argument('after', type=int, location='args')
+    parser.add_argument('limit', type=int, location='args')
+    parser.add_argument('format', type=str, location='args')
+
+
+def get_query_filters(args):
+    """
+    Turns the URL parameters added by add_query_arguments into filters for Database.query_feedback.
+
+    :param args: Arguments parsed by the request parser
+    :return: Dictionary of filters, None if no parameters were given so the whole of the data should be returned
+    """
+    filters = {"columns": args['columns'].split(",") if args['columns'] else None, "clinic": args['clinic'],
+               "sentiment": args['sentiment'], "min_score": args['min_score'], "max_score": args['max_score'],
+               "after_id": args['after'], "limit": args['limit']}
+    if all(value is None for value in filters.values()):
+        return None
+    if filters["limit"] is not None and filters["limit"] < 1:
+        abort(400)
+    return filters
+
+
+def query_response(dataframe, next_after_id, response_format="json"):
+    """
+    Creates the response for a page of filtered data. When there are more rows a Link header is added pointing at the
+    next page, which starts after the last ID of this page.
+
+    :param dataframe: Pandas dataframe holding the page of data
+    :param next_after_id: ID the next page starts after, None if this is the last page
+    :param response_format: Key of response_formats
+    :return: tuple in the form (body, status code, headers) to be returned by a Resource
+    """
+    headers = {}
+    if next_after_id is not None:
+        args = request.args.to_dict()
+        args['after'] = next_after_id
+        headers["Link"] = '<' + request.base_url + '?' + urlencode(args) + '>; rel="next"'
+    return data_response(serialise(dataframe, response_format), 200, headers, response_format)
+
+
+def query_months_response(process_data, no_of_months, filters, background, response_format="json"):
+    """
+    Creates the response for filtered data covering the most recent no_of_months months. The data is filtered in the
+    database rather than being built into final_dataframe.
+
+    :param process_data: DataForMultipleMonths object the request is using
+    :param no_of_months: Number of months of data to retrieve
+    :param filters: Filters created by get_query_filters
+    :param background: If True months that have not been analysed are analysed in the background
+    :param response_format: Key of response_formats
+    :return: tuple in the form (body, status code, headers) to be returned by a Resource
+    """
+    try:
+        dataframe, next_after_id = process_data.query_months(no_of_months, background=background, **filters)
+    except RuntimeError as err:
+        return {"message": str(err)}, 400
+    if len(process_data.pending_jobs) != 0:
+        return pending_response(serialise(dataframe, response_format), process_data.pending_jobs, response_format)
+    return query_response(dataframe, next_after_id, response_format)
+
+
+def stream_months_response(process_data, no_of_months, filters, background):
+    """
+    Creates a response that streams the data for the most recent no_of_months months as newline delimited JSON, one row
+    per line, reading a chunk of rows at a time from the database as the response is sent. Memory use does not grow
+    with the number of months and the client receives the first rows straight away. If any months are being analysed
+    in the background the status is 202 and a Link header points at each job.
+
+    :param process_data: DataForMultipleMonths object the request is using
+    :param no_of_months: Number of months of data to retrieve
+    :param filters: Filters created by get_query_filters, or None. Paging filters are ignored as the whole window is
+    streamed.
+    :param background: If True months that have not been analysed are analysed in the background
+    :return: Streamed flask Response
+    """
+    stream_filters = {}
+    if filters is not None:
+        stream_filters = {name: filters[name] for name in ["columns", "clinic", "sentiment", "min_score", "max_score"]}
+    try:
+        chunks = process_data.stream_months(no_of_months, background=background, **stream_filters)
+    except RuntimeError as err:
+        return {"message": str(err)}, 400
+
+    def generate():
+        for chunk in chunks:
+            yield chunk.to_json(orient="records", lines=True, double_precision=json_precision).rstrip("\n") + "\n"
+
+    headers = {}
+    status = 200
+    if len(process_data.pending_jobs) != 0:
+        status = 202
+        headers["Link"] = ", ".join('<' + api.url_for(AnalysisJobAPI, job_id=job.job_id) + '>; rel="monitor"'
+                                    for job in process_data.pending_jobs)
+    return Response(stream_with_context(generate()), status=status, headers=headers,
+                    mimetype=response_formats["ndjson"])
+
+
 class DataForYearAPI(Resource):
     """
     Class that deals with requests regarding the most recent years (12 months) worth of data. If less than 12 months
@@ -51,6 +363,11 @@ class DataForYearAPI(Resource):
 
     def __init__(self):
         self.months_to_analyse = 12
+        self.reqparse = reqparse.RequestParser()
+        add_query_arguments(self.reqparse)
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+            self.asynchronous_analysis = data.get("asynchronous_analysis", False)
         super(DataForYearAPI, self).__init__()
 
     def get(self):
@@ -58,17 +375,36 @@ class DataForYearAPI(Resource):
         Method for HTTP GET response. Creates a DataForMultipleMonths object in order to get the most recent 12 months
         worth of data.
 
-        :return: Converts a pandas dataframe containing the data to JSON format and returns that as a response.
+        :return: Converts a pandas dataframe containing the data to JSON format and returns that as a response. The
+        response is cached until the data changes or a newer month becomes available. Months that have not been analysed
+        yet are analysed before responding, unless the client sends a Prefer header of respond-async, in which case
+        they are analysed in the background and a 202 response is returned holding the months that are ready and the
+        jobs analysing the rest. URL parameters columns, clinic, sentiment, min_score, max_score, after and
+        limit filter the data and page through it in the database instead. Asking for format=ndjson, or sending an Accept
+        header of application/x-ndjson, streams the data a row per line instead. format can also be csv, parquet or
+        arrow, which are also chosen by their media types in the Accept header.
         """
+        args = self.reqparse.parse_args()
+        filters = get_query_filters(args)
+        background = wants_background_analysis(self.asynchronous_analysis)
         recent_years_data = DataForMultipleMonths()
-        database = Database()
-        database.create_table()
+        prepare_database()
         recent_years_data.reset_latest_available_data()
+        recent_years_data.find_latest_data()
+        response_format = choose_response_format(args)
+        if response_format == "ndjson":
+            return stream_months_response(recent_years_data, self.months_to_analyse, filters, background)
+        if filters is not None:
+            return query_months_response(recent_years_data, self.months_to_analyse, filters, background,
+                                         response_format)
 
-        for month_number in range(self.months_to_analyse):
-            recent_years_data.main(month_number)
+        def build_response():
+            recent_years_data.process_months(self.months_to_analyse, background=background)
+            return serialise(recent_years_data.final_dataframe, response_format), recent_years_data.pending_jobs
 
-        return recent_years_data.final_dataframe.to_json()
+        key = ("year", self.months_to_analyse, recent_years_data.latest_month, recent_years_data.latest_year,
+               response_format)
+        return cached_response(key, build_response, response_format)
 
 
 class DataForSpecifiedTimeAPI(Resource):
@@ -78,23 +414,93 @@ class DataForSpecifiedTimeAPI(Resource):
 
     decorators = [auth.login_required]
 
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        add_query_arguments(self.reqparse)
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+            self.asynchronous_analysis = data.get("asynchronous_analysis", False)
+        super(DataForSpecifiedTimeAPI, self).__init__()
+
     def get(self, no_of_months):
         """
         Method for HTTP GET response. Creates a DataForMultipleMonths object in order to get a specified number of
         the most recent months worth of data.
 
         :param no_of_months: Number of months of data to retrieve, specified at end of URL.
-        :return: Converts a pandas dataframe containing the data to JSON format and returns that as a response.
+        :return: Converts a pandas dataframe containing the data to JSON format and returns that as a response. The
+        response is cached until the data changes or a newer month becomes available. Months that have not been analysed
+        yet are analysed before responding, unless the client sends a Prefer header of respond-async, in which case
+        they are analysed in the background and a 202 response is returned holding the months that are ready and the
+        jobs analysing the rest. URL parameters columns, clinic, sentiment, min_score, max_score, after and
+        limit filter the data and page through it in the database instead. Asking for format=ndjson, or sending an Accept
+        header of application/x-ndjson, streams the data a row per line instead. format can also be csv, parquet or
+        arrow, which are also chosen by their media types in the Accept header.
         """
+        args = self.reqparse.parse_args()
+        filters = get_query_filters(args)
+        background = wants_background_analysis(self.asynchronous_analysis)
         specified_time_data = DataForMultipleMonths()
-        database = Database()
-        database.create_table()
+        prepare_database()
         specified_time_data.reset_latest_available_data()
+        specified_time_data.find_latest_data()
+        response_format = choose_response_format(args)
+        if response_format == "ndjson":
+            return stream_months_response(specified_time_data, no_of_months, filters, background)
+        if filters is not None:
+            return query_months_response(specified_time_data, no_of_months, filters, background, response_format)
+
+        def build_response():
+            specified_time_data.process_months(no_of_months, background=background)
+            return serialise(specified_time_data.final_dataframe, response_format), specified_time_data.pending_jobs
+
+        key = ("range", no_of_months, specified_time_data.latest_month, specified_time_data.latest_year,
+               response_format)
+        return cached_response(key, build_response, response_format)
+
 
-        for month_number in range(no_of_months):
-            specified_time_data.main(month_number)
+class SummaryAPI(Resource):
+    """
+    Class that deals with requests for statistics summarising a specific number of months worth of data by clinic,
+    month or both, so clients do not need to download every comment to work them out.
+    """
+
+    decorators = [auth.login_required]
 
-        return specified_time_data.final_dataframe.to_json()
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument('format', type=str, location='args')
+        with open("config.json") as config_file:
+            data = json.load(config_file)
+            self.asynchronous_analysis = data.get("asynchronous_analysis", False)
+        super(SummaryAPI, self).__init__()
+
+    def get(self, grouping, no_of_months):
+        """
+        Method for HTTP GET response. Summarises a specified number of the most recent months worth of data.
+
+        :param grouping: "clinic", "month" or "clinicmonth", specified in the URL, deciding what the data is grouped by
+        :param no_of_months: Number of months of data to summarise, specified at end of URL.
+        :return: JSON holding, for each group, the number of comments, the number of positive and negative comments,
+        the ratio of positive comments and the mean, median, 10th and 90th percentile sentiment score. Cached and
+        analysed in the background in the same way as the other endpoints, and can be sent in the same formats.
+        """
+        if grouping not in summary_groupings:
+            return {"message": "Data can only be summarised by " + ", ".join(summary_groupings)}, 404
+        response_format = choose_response_format(self.reqparse.parse_args())
+        background = wants_background_analysis(self.asynchronous_analysis)
+        summary_data = DataForMultipleMonths()
+        prepare_database()
+        summary_data.reset_latest_available_data()
+        summary_data.find_latest_data()
+
+        def build_response():
+            summary_data.process_months(no_of_months, background=background)
+            return serialise(summary_data.summarise(grouping), response_format), summary_data.pending_jobs
+
+        key = ("summary", grouping, no_of_months, summary_data.latest_month, summary_data.latest_year,
+               response_format)
+        return cached_response(key, build_response, response_format)
 
 
 class DataForMonthAPI(Resource):
@@ -106,8 +512,9 @@ class DataForMonthAPI(Resource):
 
     def __init__(self):
         self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('month', type=int)
-        self.reqparse.add_argument('year', type=int)
+        self.reqparse.add_argument('month', type=int, location='args')
+        self.reqparse.add_argument('year', type=int, location='args')
+        add_query_arguments(self.reqparse)
         super(DataForMonthAPI, self).__init__()
 
     def get(self):
@@ -116,18 +523,50 @@ class DataForMonthAPI(Resource):
         passed as URL parameters.
 
         :return: Converts a pandas dataframe containing the data to JSON format and returns that as a response if data
-        for the given month and year is present. Else returns a JSON message saying no data was found.
+        for the given month and year is present. Else returns a JSON message saying no data was found. URL parameters
+        columns, clinic, sentiment, min_score, max_score, after and limit filter the data and page through it in the
+        database. format or the Accept header choose between json, ndjson, csv, parquet and arrow.
         """
 
         args = self.reqparse.parse_args()
         if args['month'] is None or args['year'] is None:
             abort(400)
         database = Database()
+        response_format = choose_response_format(args)
+        filters = get_query_filters(args)
+        if filters is not None:
+            try:
+                dataframe, next_after_id = database.query_feedback([(args['month'], args['year'])], **filters)
+            except RuntimeError as err:
+                return {"message": str(err)}, 400
+            return query_response(dataframe, next_after_id, response_format)
         already_stored, month_dataframe = database.use_database_storage(args['month'], args['year'])
         if already_stored:
-            return month_dataframe.to_json()
+            return data_response(serialise(month_dataframe, response_format), 200, {}, response_format)
         return {"message": "No data found for given month and year"}
 
+    def put(self):
+        """
+        Method for HTTP PUT response. Analyses a specific month and year again after its files have been corrected, in
+        the background. Only rows that have changed are scored and stored, rather than the whole month. Month and year
+        passed as URL parameters.
+
+        :return: 202 response holding the job analysing the month, whose progress can be looked up. Else returns a JSON
+        message saying no data was found.
+        """
+
+        args = self.reqparse.parse_args()
+        if args['month'] is None or args['year'] is None:
+            abort(400)
+        month_data = DataForMultipleMonths()
+        if not month_data.azure_storage.has_data(args['month'], args['year'], "Positive"):
+            return {"message": "No data found for given month and year"}, 404
+        prepare_database()
+        job = get_job_queue().submit(args['month'], args['year'], month_data.reanalyse_month,
+                                     "reanalyse").to_dict()
+        job["url"] = api.url_for(AnalysisJobAPI, job_id=job["job_id"])
+        return job, 202, {"Location": job["url"]}
+
     def delete(self):
         """
         Method for HTTP DELETE response. Deletes data from the database for a specific month and year. Month and year
@@ -138,9 +577,61 @@ class DataForMonthAPI(Resource):
         if args['month'] is None or args['year'] is None:
             abort(400)
         database = Database()
-        database.delete_specific_month(args['month'], args['years'])
+        database.delete_specific_month(args['month'], args['year'])
+
+
+class AnalysisJobAPI(Resource):
+    """
+    Class that deals with requests regarding the progress of months being analysed in the background.
+    """
+
+    decorators = [auth.login_required]
+
+    def get(self, job_id):
+        """
+        Method for HTTP GET response. Gives the status of a background analysis job.
+
+        :param job_id: Id of the job, given in the response of the request that queued it
+        :return: JSON describing the job, including how many of the month's comments have been scored out of the total.
+        Else returns a JSON message saying no job was found.
+        """
+        job = get_job_queue().get_job(job_id)
+        if job is None:
+            return {"message": "No job found with given id"}, 404
+        return job.to_dict()
+
+
+class MetricsAPI(Resource):
+    """
+    Class that deals with requests for the metrics recorded while running the pipeline.
+    """
+
+    decorators = [auth.login_required]
+
+    def get(self):
+        """
+        Method for HTTP GET response. Gives the time taken and rows handled by each stage of the pipeline along with the
+        hit rates of the caches.
+
+        :return: The metrics in the Prometheus text format so they can be scraped by a monitoring server.
+        """
+        cache_statistics = {"response": get_response_cache().statistics(),
+                            "sentiment": get_shared_cache().statistics(),
+                            "parsed_workbook": get_workbook_cache().statistics()}
+        return Response(metrics.render(cache_statistics), mimetype="text/plain; version=0.0.4")
 
 
 api.add_resource(DataForYearAPI, '/psat/pastyear/', endpoint='year')
 api.add_resource(DataForMonthAPI, '/psat/specificmonth/', endpoint='month')
 api.add_resource(DataForSpecifiedTimeAPI, '/psat/mostrecentmonths/<int:no_of_months>', endpoint='range')
+api.add_resource(SummaryAPI, '/psat/summary/<string:grouping>/<int:no_of_months>', endpoint='summary')
+api.add_resource(AnalysisJobAPI, '/psat/jobs/<string:job_id>', endpoint='job')
+api.add_resource(MetricsAPI, '/psat/metrics', endpoint='metrics')
+
+if __name__ == "__main__":
+    # the scheduler is only started here rather than when the module is imported, so a server running several worker
+    # processes does not start one in each, PreAnalysis.py is run on its own in that case
+    with open("config.json") as config_file:
+        if json.load(config_file).get("pre_analysis_enabled", False):
+            get_scheduler().start()
+    app.run()